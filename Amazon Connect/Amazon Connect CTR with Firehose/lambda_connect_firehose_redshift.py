@@ -2,56 +2,254 @@ import json
 import pytz
 import boto3
 import base64
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from connect_timeutils import to_local_string
 
 dynamo = boto3.client('dynamodb', region_name='us-east-1')
 
-def is_duplicate(contact_id):
+# De-duplication by ContactId: batch_get_item takes up to 100 keys, transact_write_items up to 100 items
+DEDUP_TABLE = 'ProcessedCTR'
+BATCH_GET_LIMIT = 100
+TRANSACT_LIMIT = 100
+TRANSACT_RETRIES = 3
+DEDUP_WORKERS = int(os.getenv('DEDUP_WORKERS', '4'))
+
+# ContactIds known to be in ProcessedCTR, kept across warm invocations (DynamoDB stays the source of truth)
+RECENT_IDS_CACHE_SIZE = int(os.getenv('RECENT_IDS_CACHE_SIZE', '100000'))
+RECENT_IDS_TTL_SECONDS = int(os.getenv('RECENT_IDS_TTL_SECONDS', '86400'))
+
+class RecentIdCache:
     """
-    Try to insert contact_id into DynamoDB.
-    If contact_id exists, it throws an exceptions and returns True (duplicated).
+    Bounded LRU of ContactIds already registered in ProcessedCTR. A hit means
+    the id is a known duplicate and DynamoDB is not asked again. Entries older
+    than `ttl` seconds count as misses, so ids expired from the table are not
+    dropped forever. Hit/miss counters accumulate for the container's life.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, contact_id):
+        added = self.entries.get(contact_id)
+        if added is not None and time.monotonic() - added < self.ttl:
+            self.entries.move_to_end(contact_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, contact_ids):
+        now = time.monotonic()
+        for contact_id in contact_ids:
+            self.entries[contact_id] = now
+            self.entries.move_to_end(contact_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self.entries),
+            'maxsize': self.maxsize
+        }
+
+recent_ids = RecentIdCache(RECENT_IDS_CACHE_SIZE, RECENT_IDS_TTL_SECONDS)
+
+# Output records: json (one object per record), json_array or csv (values only, see copy_command)
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'json')
+# CSV: strings are always quoted, so an unquoted empty field is NULL for COPY
+CSV_NULL = ''
+
+def get_processed_ids(contact_ids):
+    """Return the ContactIds of one chunk that are already in ProcessedCTR."""
+    request = {DEDUP_TABLE: {
+        'Keys': [{'ContactId': {'S': contact_id}} for contact_id in contact_ids],
+        'ProjectionExpression': 'ContactId'
+    }}
+    processed = set()
+    while request:
+        response = dynamo.batch_get_item(RequestItems=request)
+        processed.update(item['ContactId']['S'] for item in response['Responses'].get(DEDUP_TABLE, []))
+        request = response.get('UnprocessedKeys')
+        if request:
+            time.sleep(0.05)
+    return processed
+
+def register_ids(contact_ids):
+    """
+    Insert one chunk of ContactIds into ProcessedCTR in a transaction, each one
+    conditional on not existing yet. If another invocation registered some of
+    them first, the transaction is cancelled: those ids are returned as
+    duplicates and the rest is written again.
     """
     eastern_tz = pytz.timezone("America/New_York")
     processed_at = datetime.utcnow().replace(tzinfo=pytz.utc).astimezone(eastern_tz).isoformat()
+    pending = list(contact_ids)
+    duplicates = set()
+
+    for attempt in range(TRANSACT_RETRIES + 1):
+        if not pending:
+            return duplicates
+        try:
+            dynamo.transact_write_items(TransactItems=[{
+                'Put': {
+                    'TableName': DEDUP_TABLE,
+                    'Item': {
+                        'ContactId': {'S': contact_id},
+                        'ProcessedAt': {'S': processed_at}
+                    },
+                    'ConditionExpression': 'attribute_not_exists(ContactId)'
+                }
+            } for contact_id in pending])
+            return duplicates
+        except dynamo.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get('CancellationReasons', [])
+            duplicates.update(contact_id for contact_id, reason in zip(pending, reasons)
+                              if reason.get('Code') == 'ConditionalCheckFailed')
+            pending = [contact_id for contact_id in pending if contact_id not in duplicates]
+            time.sleep(0.05 * 2 ** attempt)
+
+    if pending:
+        raise RuntimeError(f"Could not register {len(pending)} ContactIds in {DEDUP_TABLE}")
+    return duplicates
 
-    try:
-        dynamo.put_item(
-            TableName='ProcessedCTR',  
-            Item={
-                'ContactId': {'S': contact_id},
-                'ProcessedAt': {'S': processed_at}
-            },
-            ConditionExpression='attribute_not_exists(ContactId)'
-        )
-        return False  
-    except dynamo.exceptions.ConditionalCheckFailedException:
-        return True
+def find_new_contact_ids(contact_ids):
+    """
+    Batch version of the old per-record conditional put: check the distinct ids
+    with batched reads, then register the unseen ones with conditional
+    transactions. Chunks run concurrently. Returns the ids that are new.
+    """
+    def chunks(ids, size):
+        return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+    with ThreadPoolExecutor(max_workers=DEDUP_WORKERS) as pool:
+        processed = set().union(*pool.map(get_processed_ids, chunks(contact_ids, BATCH_GET_LIMIT)))
+        candidates = [contact_id for contact_id in contact_ids if contact_id not in processed]
+        duplicates = set().union(*pool.map(register_ids, chunks(candidates, TRANSACT_LIMIT)))
+    return set(candidates) - duplicates
 
 def parse_datetime(timestamp):
-    eastern_tz = pytz.timezone("America/New_York")
-    if timestamp:
-        try:
-            dt_utc = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
-            dt_utc = dt_utc.replace(tzinfo=pytz.utc)
-            return dt_utc.astimezone(eastern_tz).strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            return None
-    return None
+    # UTC ISO-8601 (with or without fractional seconds) to New York 'YYYY-MM-DD HH:MM:SS'; None if invalid
+    return to_local_string(timestamp)
+
+def arn_suffix(marker):
+    return lambda arn: arn.split(marker)[-1] if arn else None
+
+# Columns of connect.f_calls in output order: (column, path in the CTR, default when missing, converter)
+CTR_FIELDS = [
+    ('init_contact_id', ('InitialContactId',), '', None),
+    ('prev_contact_id', ('PreviousContactId',), '', None),
+    ('contact_id', ('ContactId',), '', None),
+    ('next_contact_id', ('NextContactId',), '', None),
+    ('channel', ('Channel',), '', None),
+    ('init_method', ('InitiationMethod',), '', None),
+    ('init_time', ('InitiationTimestamp',), '', parse_datetime),
+    ('disconn_time', ('DisconnectTimestamp',), '', parse_datetime),
+    ('disconn_reason', ('DisconnectReason',), '', None),
+    ('last_update_time', ('LastUpdateTimestamp',), '', parse_datetime),
+    ('agent_conn', ('Agent', 'ConnectedToAgentTimestamp'), '', parse_datetime),
+    ('agent_id', ('Agent', 'ARN'), '', arn_suffix("/agent/")),
+    ('agent_username', ('Agent', 'Username'), '', None),
+    ('agent_conn_att', ('AgentConnectionAttempts',), 0, None),
+    ('agent_afw_start', ('Agent', 'AfterContactWorkStartTimestamp'), '', parse_datetime),
+    ('agent_afw_end', ('Agent', 'AfterContactWorkEndTimestamp'), '', parse_datetime),
+    ('agent_afw_duration', ('Agent', 'AfterContactWorkDuration'), 0, None),
+    ('agent_interact_duration', ('Agent', 'AgentInteractionDuration'), 0, None),
+    ('agent_holds', ('Agent', 'NumberOfHolds'), 0, None),
+    ('agent_longest_hold', ('Agent', 'LongestHoldDuration'), 0, None),
+    ('queue_id', ('Queue', 'ARN'), '', arn_suffix("/queue/")),
+    ('queue_name', ('Queue', 'Name'), '', None),
+    ('in_queue_time', ('Queue', 'EnqueueTimestamp'), '', parse_datetime),
+    ('out_queue_time', ('Queue', 'DequeueTimestamp'), '', parse_datetime),
+    ('queue_duration', ('Queue', 'Duration'), 0, None),
+    ('customer_phone', ('CustomerEndpoint', 'Address'), '', None),
+    ('customer_voice', ('CustomerEndpoint', 'Voice'), '', None),
+    ('customer_hold_duration', ('Agent', 'CustomerHoldDuration'), 0, None),
+    ('sys_phone', ('SystemEndpoint', 'Address'), '', None),
+    ('conn_to_sys', ('ConnectedToSystemTimestamp',), '', parse_datetime),
+]
+
+CTR_COLUMNS = [column for column, _, _, _ in CTR_FIELDS]
+
+def compile_field(path, default, convert):
+    # One closure per column, so a record is extracted without interpreting the table
+    if len(path) == 1:
+        key = path[0]
+        if convert:
+            return lambda payload: convert(payload.get(key, default))
+        return lambda payload: payload.get(key, default)
+    outer, key = path
+    if convert:
+        return lambda payload: convert((payload.get(outer) or {}).get(key, default))
+    return lambda payload: (payload.get(outer) or {}).get(key, default)
+
+CTR_EXTRACTORS = [compile_field(path, default, convert) for _, path, default, convert in CTR_FIELDS]
+
+def transform_ctr(payload):
+    # Flat values of connect.f_calls, in CTR_COLUMNS order
+    return [extract(payload) for extract in CTR_EXTRACTORS]
+
+def csv_value(value):
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+# Output record encoders: 'json' keeps one object per record (COPY ... JSON 'auto');
+# 'json_array' and 'csv' carry values only, in CTR_COLUMNS order
+OUTPUT_ENCODERS = {
+    'json': lambda values: json.dumps(dict(zip(CTR_COLUMNS, values))),
+    'json_array': lambda values: json.dumps(values, separators=(',', ':')) + '\n',
+    'csv': lambda values: ','.join(csv_value(value) for value in values) + '\n',
+}
+
+def copy_command(table='connect.f_calls', output_format=None, jsonpaths_s3_path='s3://<bucket>/connect/f_calls_jsonpaths.json'):
+    """COPY statement (column list and options) matching an output format, for the Firehose destination."""
+    output_format = output_format or OUTPUT_FORMAT
+    options = {
+        'json': ["FORMAT AS JSON 'auto'"],
+        'json_array': [f"FORMAT AS JSON '{jsonpaths_s3_path}'"],
+        'csv': ["FORMAT AS CSV"],
+    }[output_format]
+    return '\n'.join([f"COPY {table} (", ',\n'.join(f"    {column}" for column in CTR_COLUMNS), ")",
+                      "FROM 's3://<bucket>/<manifest>'",
+                      "CREDENTIALS 'aws_iam_role=<role-arn>'", "MANIFEST"] + options) + ';'
+
+def jsonpaths_document():
+    """JSONPaths file for the json_array format: element i of the array is column i."""
+    return json.dumps({'jsonpaths': [f'$[{index}]' for index in range(len(CTR_COLUMNS))]}, indent=2)
+
+def dropped(record):
+    return {
+        'recordId': record['recordId'],
+        'result': 'Dropped',
+        'data': record['data']
+    }
 
 def lambda_handler(event, context):
-    output = []
+    encode_record = OUTPUT_ENCODERS[OUTPUT_FORMAT]
+    output = [None] * len(event['records'])
+    candidates = []
 
-    for record in event['records']:
+    for position, record in enumerate(event['records']):
 
         b64_data = record.get('data', '')
         
         if not b64_data.strip():
             # If it's empty it's marked as "Dropped" and it continues
-            output.append({
-                'recordId': record['recordId'],
-                'result': 'Dropped',
-                'data': record['data']
-            })
+            output[position] = dropped(record)
             continue
 
         try:
@@ -60,78 +258,51 @@ def lambda_handler(event, context):
 
         except json.JSONDecodeError as e:
             print(f"JSON decode error in record {record['recordId']}: {e}")
-            output.append({
-                'recordId': record['recordId'],
-                'result': 'Dropped',
-                'data': record['data']
-            })
+            output[position] = dropped(record)
             continue
 
         # Extract ContactId
         contact_id = payload.get('ContactId', '')
         if not contact_id:
             # In not ContacId, then Dropped
-            output.append({
-                'recordId': record['recordId'],
-                'result': 'Dropped',
-                'data': record['data']
-            })
+            output[position] = dropped(record)
             continue
 
-        # Verify if this ContactId was processed in DynamoDB
-        if is_duplicate(contact_id):
+        candidates.append((position, record, payload, contact_id))
+
+    # Duplicates inside the batch collapse to their first record; ids in the warm cache are known duplicates
+    # and the rest is checked in DynamoDB at once
+    first_seen = {}
+    for position, record, payload, contact_id in candidates:
+        first_seen.setdefault(contact_id, position)
+    unknown_ids = [contact_id for contact_id in first_seen if not recent_ids.contains(contact_id)]
+    new_ids = find_new_contact_ids(unknown_ids)
+    # New or not, every id checked is now in ProcessedCTR
+    recent_ids.add(unknown_ids)
+
+    for position, record, payload, contact_id in candidates:
+        # Verify if this ContactId was processed in DynamoDB (or earlier in this batch)
+        if contact_id not in new_ids or first_seen[contact_id] != position:
             print(f"Duplicate found for ContactId: {contact_id}")
-            output.append({
-                'recordId': record['recordId'],
-                'result': 'Dropped',
-                'data': record['data']
-            })
+            output[position] = dropped(record)
             continue
-        
-        agent_data = payload.get('Agent', {}) or {}
-        queue_data = payload.get('Queue', {}) or {}
-
-        # Transform the CTR into a flat structure
-        transformed = {
-            'init_contact_id': payload.get('InitialContactId', ''), 
-            'prev_contact_id': payload.get('PreviousContactId', ''),
-            'contact_id': payload.get('ContactId', ''),
-            'next_contact_id': payload.get('NextContactId', ''),
-            'channel': payload.get('Channel', ''),
-            'init_method': payload.get('InitiationMethod', ''),
-            'init_time': parse_datetime(payload.get('InitiationTimestamp', '')),
-            'disconn_time': parse_datetime(payload.get('DisconnectTimestamp', '')),
-            'disconn_reason': payload.get('DisconnectReason', ''),
-            'last_update_time': parse_datetime(payload.get('LastUpdateTimestamp', '')),
-            'agent_conn': parse_datetime(agent_data.get('ConnectedToAgentTimestamp', '')),
-            'agent_id': agent_data.get('ARN', '').split("/agent/")[-1] if agent_data.get('ARN') else None,
-            'agent_username': agent_data.get('Username', ''),
-            'agent_conn_att': payload.get('AgentConnectionAttempts', 0),
-            'agent_afw_start': parse_datetime(agent_data.get('AfterContactWorkStartTimestamp', '')),
-            'agent_afw_end': parse_datetime(agent_data.get('AfterContactWorkEndTimestamp', '')),
-            'agent_afw_duration': agent_data.get('AfterContactWorkDuration', 0),
-            'agent_interact_duration': agent_data.get('AgentInteractionDuration', 0),
-            'agent_holds': agent_data.get('NumberOfHolds', 0),
-            'agent_longest_hold': agent_data.get('LongestHoldDuration', 0),
-            'queue_id': queue_data.get('ARN', '').split("/queue/")[-1] if queue_data.get('ARN') else None,
-            'queue_name': queue_data.get('Name', ''),
-            'in_queue_time': parse_datetime(queue_data.get('EnqueueTimestamp', '')),
-            'out_queue_time': parse_datetime(queue_data.get('DequeueTimestamp', '')),
-            'queue_duration': queue_data.get('Duration', 0),
-            'customer_phone': payload.get('CustomerEndpoint', {}).get('Address', ''),
-            'customer_voice': payload.get('CustomerEndpoint', {}).get('Voice', ''),
-            'customer_hold_duration': agent_data.get('CustomerHoldDuration', 0),
-            'sys_phone': payload.get('SystemEndpoint', {}).get('Address', ''),
-            'conn_to_sys': parse_datetime(payload.get('ConnectedToSystemTimestamp', '')),
-        }
 
-        # Convert to JSON and encode for Firehose
-        transformed_json = json.dumps(transformed)
-        encoded_data = base64.b64encode(transformed_json.encode('utf-8')).decode('utf-8')
-        output.append({
+        transformed = transform_ctr(payload)
+
+        # Encode in the configured output format for Firehose
+        encoded_data = base64.b64encode(encode_record(transformed).encode('utf-8')).decode('utf-8')
+        output[position] = {
             'recordId': record['recordId'],
             'result': 'Ok',
             'data': encoded_data
-        })
-    
-    return {'records': output}
\ No newline at end of file
+        }
+
+    print(f"Recent ContactId cache: {json.dumps(recent_ids.stats())}")
+    return {'records': output}
+
+
+if __name__ == '__main__':
+    # Print the Firehose COPY settings for the configured OUTPUT_FORMAT
+    print(copy_command())
+    if OUTPUT_FORMAT == 'json_array':
+        print(jsonpaths_document())
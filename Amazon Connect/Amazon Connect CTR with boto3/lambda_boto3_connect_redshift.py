@@ -5,8 +5,13 @@ import pytz
 import psycopg2
 from psycopg2.extras import execute_values
 import datetime
+import threading
 import time as time_module
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import timedelta
+from connect_api import ConnectClient, backoff_delay, connect_client_config
+from connect_timeutils import to_local_string
 
 # AWS Connect Configuration
 INSTANCE_ID = os.getenv("INSTANCE_ID")
@@ -16,19 +21,33 @@ NY_TZ = pytz.timezone("America/New_York")
 # Redshift connection config
 REDSHIFT_CONFIG = json.loads(os.environ["REDSHIFT_CONFIG"])
 
-# Yesterday
-"""
-today_ny = datetime.now(NY_TZ).date()
-yesterday_ny = today_ny - timedelta(days=1)
-START_DATE_NY = NY_TZ.localize(datetime.combine(yesterday_ny, datetime.min.time()))
-END_DATE_NY = NY_TZ.localize(datetime.combine(yesterday_ny, datetime.max.time()))
-START_DATE_UTC = START_DATE_NY.astimezone(pytz.utc)
-END_DATE_UTC = END_DATE_NY.astimezone(pytz.utc)
-"""
-
-# By Hour Periods 
-now_ny = datetime.datetime.now(NY_TZ) # time right now in NY
-
+# describe_contact enrichment: parallel workers, request rate and retries per Connect call
+DESCRIBE_WORKERS = int(os.getenv("DESCRIBE_WORKERS", "8"))
+DESCRIBE_CONTACT_RPS = float(os.getenv("DESCRIBE_CONTACT_RPS", "5"))
+DESCRIBE_RETRIES = int(os.getenv("DESCRIBE_RETRIES", "5"))
+
+# search_contacts extraction: the window is split into slices of SEARCH_SLICE_MINUTES paginated by
+# SEARCH_WORKERS threads. SEARCH_CRITERIA (JSON, e.g. '{"Channels": ["VOICE"]}') is sent to the API
+SEARCH_SLICE_MINUTES = int(os.getenv("SEARCH_SLICE_MINUTES", "10"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+SEARCH_CRITERIA = json.loads(os.getenv("SEARCH_CRITERIA", "{}"))
+
+# Enriched rows are flushed to Redshift every FLUSH_ROWS. Pages are described DESCRIBE_BATCH contacts at a
+# time; once the Lambda is STOP_BEFORE_DEADLINE_MS from its timeout no further batch starts and the position
+# inside the page goes in the continuation payload. Work still in flight after the stop is at most
+# SEARCH_WORKERS x DESCRIBE_BATCH / DESCRIBE_CONTACT_RPS (16 s by default) plus the last flush
+FLUSH_ROWS = int(os.getenv("FLUSH_ROWS", "1000"))
+DESCRIBE_BATCH = int(os.getenv("DESCRIBE_BATCH", "20"))
+STOP_BEFORE_DEADLINE_MS = int(os.getenv("STOP_BEFORE_DEADLINE_MS", "60000"))
+
+# Backfill: {"backfill": {"start": "2025-06-01", "end": "2025-06-08T12:00"}} (New York time) is planned
+# into SLOT_HOURS units aligned like the scheduled runs; completed units are recorded in BACKFILL_TABLE
+SLOT_HOURS = 2
+BACKFILL_TABLE = os.getenv("BACKFILL_TABLE", "ConnectBackfillUnits")
+# Re-sends of UnprocessedKeys (throttled reads) per batch_get_item, with jittered exponential backoff
+BACKFILL_READ_RETRIES = int(os.getenv("BACKFILL_READ_RETRIES", "6"))
+
+# By Hour Periods (computed per invocation, a warm container must not reuse the window of its cold start)
 def get_previous_interval_bounds(now_ny, tz):
     current_time = now_ny.replace(minute=0, second=0, microsecond=0)
     hour = current_time.hour
@@ -52,23 +71,36 @@ def get_previous_interval_bounds(now_ny, tz):
     return start_utc, end_utc, interval_label
 
 
-START_DATE_UTC, END_DATE_UTC, interval_label = get_previous_interval_bounds(now_ny, NY_TZ)
-
-client = boto3.client("connect", region_name=AWS_REGION)
+# Function to split a New York date range into slot-aligned units, bounded like get_previous_interval_bounds
+def plan_backfill_units(start_local, end_local, tz):
+    slot = start_local.replace(minute=0, second=0, microsecond=0)
+    slot -= timedelta(hours=slot.hour % SLOT_HOURS)
+    units = []
+    while slot < end_local:
+        next_slot = slot + timedelta(hours=SLOT_HOURS)
+        units.append({
+            "unit": f"{slot:%Y-%m-%d} {slot.hour:02d}-{next_slot.hour:02d}",
+            "start": tz.localize(slot).astimezone(pytz.utc),
+            "end": (tz.localize(next_slot) + timedelta(seconds=1)).astimezone(pytz.utc)
+        })
+        slot = next_slot
+    return units
+
+# Rate limited, retrying Connect client (describe_contact budget shared by the workers); one pooled
+# connection per search and describe thread
+client = ConnectClient(
+    boto3.client("connect", region_name=AWS_REGION, config=connect_client_config(SEARCH_WORKERS + DESCRIBE_WORKERS)),
+    rates={'describe_contact': DESCRIBE_CONTACT_RPS},
+    max_retries=DESCRIBE_RETRIES
+)
+dynamodb = boto3.resource("dynamodb")
+backfill_table = dynamodb.Table(BACKFILL_TABLE)
 
 def parse_datetime(timestamp):
-    eastern_tz = pytz.timezone("America/New_York")
-    if not timestamp:
-        return None
-    try:
-        if isinstance(timestamp, datetime.datetime):
-            dt_utc = timestamp.replace(tzinfo=pytz.utc)
-        else:
-            dt_utc = datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=pytz.utc)
-        return dt_utc.astimezone(eastern_tz).strftime("%Y-%m-%d %H:%M:%S")
-    except Exception as e:
-        print(f"Failed to parse {timestamp}: {e}")
-        return None
+    local_time = to_local_string(timestamp)
+    if timestamp and local_time is None:
+        print(f"Failed to parse {timestamp}")
+    return local_time
 
 
 def get_contact_details(contact_id):
@@ -88,111 +120,287 @@ def get_contact_details(contact_id):
         print(f"Error fetching contact {contact_id}: {e}")
         return (None, 0, 0, None, None, None, None)
 
-def fetch_completed_calls(start_time, end_time):
-    print(f"Fetching completed calls from {start_time} to {end_time} (UTC)...")
-    rows = []
-    next_token = None
-    total_fetched = 0
+def build_call_row(contact, details):
+    contact_id = contact.get("Id")
+    init_contact_id = contact.get('InitialContactId', None)
+    prev_contact_id = contact.get('PreviousContactId', None)
+    next_contact_id = None
+    channel = contact.get("Channel", None)
+    init_method = contact.get('InitiationMethod')
+
+    raw_disconn = contact.get("DisconnectTimestamp")
+    raw_agent_conn = contact.get('AgentInfo', {}).get('ConnectedToAgentTimestamp')
+
+    contact_duration = ((raw_disconn - raw_agent_conn).total_seconds() if raw_disconn and raw_agent_conn else None)
+    init_time = parse_datetime(contact.get("InitiationTimestamp"))
+    disconn_time = parse_datetime(raw_disconn)
+    disconn_reason = None
+    agent_username = None
+    agent_conn_att = None
+    agent_afw_start = None
+    agent_afw_end = None
+    agent_afw_duration = None
+    agent_interact_duration = None
+    agent_longest_hold = None
+    queue_name = None
+    out_queue_time = None
+    customer_voice = None
+    sys_phone = None
+    agent_conn = parse_datetime(contact.get('AgentInfo', {}).get('ConnectedToAgentTimestamp', None))
+    agent_id = contact.get("AgentInfo", {}).get("Id", None)
+    queue_id = contact.get("QueueInfo", {}).get("Id", None)
+
+    (
+        customer_phone,
+        agent_holds,
+        customer_hold_duration,
+        last_update_time,
+        in_queue_time,
+        queue_duration,
+        conn_to_sys
+    ) = details
+
+    return (
+        init_contact_id, prev_contact_id, contact_id, next_contact_id,
+        channel, init_method, init_time, disconn_time, disconn_reason,
+        last_update_time, agent_conn, agent_id, agent_username,
+        agent_conn_att, agent_afw_start, agent_afw_end, agent_afw_duration,
+        agent_interact_duration, agent_holds, agent_longest_hold,
+        queue_id, queue_name, in_queue_time, out_queue_time, queue_duration,
+        customer_voice, customer_hold_duration, contact_duration,
+        sys_phone, conn_to_sys, customer_phone
+    )
+
+
+def split_time_range(start_time, end_time, minutes):
+    slices = []
+    slice_start = start_time
+    while slice_start < end_time:
+        slice_end = slice_start + timedelta(minutes=minutes)
+        # A remainder under a minute (the trailing second of every window and unit) extends this slice
+        if end_time - slice_end < timedelta(minutes=1):
+            slice_end = end_time
+        slices.append((slice_start, slice_end))
+        slice_start = slice_end
+    return slices
+
+
+def new_slices(start_time, end_time, unit=None):
+    # Slice progress is JSON-serializable so it can travel in the continuation payload; `offset` counts the
+    # contacts of the page at `next_token` already loaded
+    slices = [
+        {"start": slice_start.isoformat(), "end": slice_end.isoformat(), "next_token": None, "offset": 0}
+        for slice_start, slice_end in split_time_range(start_time, end_time, SEARCH_SLICE_MINUTES)
+    ]
+    if unit:
+        for slice_progress in slices:
+            slice_progress["unit"] = unit
+    return slices
+
+
+# Function to read which backfill units are already recorded as completed
+def get_completed_units(unit_ids):
+    # Keys still unprocessed after the retries count as not completed: those units are loaded again,
+    # which the merge procedure tolerates
+    completed = set()
+    for start in range(0, len(unit_ids), 100):
+        request = {BACKFILL_TABLE: {
+            "Keys": [{"unit_id": unit_id} for unit_id in unit_ids[start:start + 100]],
+            "ProjectionExpression": "unit_id"
+        }}
+        for attempt in range(BACKFILL_READ_RETRIES + 1):
+            if attempt:
+                time_module.sleep(backoff_delay(attempt - 1))
+            response = dynamodb.batch_get_item(RequestItems=request)
+            completed.update(item["unit_id"] for item in response["Responses"].get(BACKFILL_TABLE, []))
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+        else:
+            print(f"{len(request[BACKFILL_TABLE]['Keys'])} backfill units unread after "
+                  f"{BACKFILL_READ_RETRIES} retries, treated as not completed")
+    return completed
+
 
-    while True:
+# Function to read a backfill bound as naive New York time; offset-qualified values ("...Z", "+00:00") are converted
+def parse_backfill_time(value):
+    try:
+        moment = datetime.datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid backfill time {value!r}: expected ISO-8601, e.g. 2025-06-01 or 2025-06-01T12:00")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(NY_TZ).replace(tzinfo=None)
+    return moment
+
+
+# Function to plan a backfill into the slices of the units not completed yet; units a previous run
+# had started resume from its in-flight slices
+def plan_backfill(backfill, in_flight=()):
+    start_local = parse_backfill_time(backfill["start"])
+    end_local = parse_backfill_time(backfill["end"])
+    units = plan_backfill_units(start_local, end_local, NY_TZ)
+    completed = get_completed_units([unit["unit"] for unit in units])
+    todo = [unit for unit in units if unit["unit"] not in completed]
+    print(f"Backfill {start_local} - {end_local}: {len(units)} units, {len(units) - len(todo)} already completed")
+
+    started = {}
+    for slice_progress in in_flight:
+        started.setdefault(slice_progress["unit"], []).append(slice_progress)
+    slices = []
+    for unit in todo:
+        slices += started.get(unit["unit"]) or new_slices(unit["start"], unit["end"], unit["unit"])
+    return [unit["unit"] for unit in todo], slices
+
+
+# Function to keep the pending slices of the backfill units already started (a slice done or a position
+# saved); untouched units are planned again from the range, so the continuation stays small
+def in_flight_slices(slices, pending):
+    planned = Counter(slice_progress["unit"] for slice_progress in slices)
+    remaining = Counter(slice_progress["unit"] for slice_progress in pending)
+    started = {unit for unit, count in remaining.items() if count < planned[unit]}
+    started.update(slice_progress["unit"] for slice_progress in pending
+                   if slice_progress["next_token"] or slice_progress.get("offset"))
+    return [slice_progress for slice_progress in pending if slice_progress["unit"] in started]
+
+
+# Function to record the units without pending slices; returns the units still open
+def mark_completed_units(unit_ids, pending):
+    # A slice only leaves `pending` once every page was searched and flushed: slices whose search or
+    # flush failed stay pending, so their unit is not recorded and is retried on resume
+    open_units = {slice_progress.get("unit") for slice_progress in pending}
+    for unit_id in unit_ids:
+        if unit_id not in open_units:
+            backfill_table.put_item(Item={
+                "unit_id": unit_id,
+                "completed_at": datetime.datetime.now(NY_TZ).isoformat()
+            })
+    print(f"Backfill units completed: {len(unit_ids) - len(open_units & set(unit_ids))} of {len(unit_ids)}")
+    return [unit_id for unit_id in unit_ids if unit_id in open_units]
+
+
+def extract_calls(slices, context=None):
+    """
+    Search and enrich the pending slices, flushing rows to Redshift every
+    FLUSH_ROWS. A slice only moves past a batch of contacts once its rows are
+    flushed, so a resumed run never describes a flushed contact again.
+    Stops between describe batches when the Lambda is STOP_BEFORE_DEADLINE_MS
+    from its timeout. Returns the rows loaded and the slices still pending.
+    """
+    progress = [dict(slice_progress, done=False) for slice_progress in slices]
+    stop = threading.Event()
+    lock = threading.Lock()
+    seen = set()
+    buffer = []  # (slice index, rows of one describe batch, (NextToken, offset) after that batch)
+    loaded = 0
+    flush_failed = False
+
+    def search_slice(index, describes):
         params = {
             "InstanceId": INSTANCE_ID,
             "MaxResults": 100,
             "TimeRange": {
                 "Type": "INITIATION_TIMESTAMP",
-                "StartTime": start_time,
-                "EndTime": end_time
+                "StartTime": datetime.datetime.fromisoformat(progress[index]["start"]),
+                "EndTime": datetime.datetime.fromisoformat(progress[index]["end"])
             }
         }
-        if next_token:
-            params["NextToken"] = next_token
-
-        try:
-            response = client.search_contacts(**params)
-        except client.exceptions.TooManyRequestsException:
-            print("Too many requests, retrying...")
-            time_module.sleep(2)
-            continue
-        except Exception as e:
-            print(f"Error: {e}")
-            break
-
-        contacts_batch = response.get("Contacts", [])
-        total_fetched += len(contacts_batch)
-        print(f"🔹 Retrieved {len(contacts_batch)} contacts (total: {total_fetched})")
-        
-        for idx, contact in enumerate(contacts_batch):
-            contact_id = contact.get("Id")
-            if not contact_id:
-                continue
-            print(f"Processing contact [{idx + 1}] → {contact_id}")
-            
-            init_contact_id = contact.get('InitialContactId', None)
-            prev_contact_id = contact.get('PreviousContactId', None)
-            next_contact_id = None
-            channel = contact.get("Channel", None)
-            init_method = contact.get('InitiationMethod')
-
-            raw_disconn = contact.get("DisconnectTimestamp")
-            if not raw_disconn:
-                continue
-            raw_agent_conn = contact.get('AgentInfo', {}).get('ConnectedToAgentTimestamp')
-
-            contact_duration = ((raw_disconn - raw_agent_conn).total_seconds() if raw_disconn and raw_agent_conn else None)
-            init_time = parse_datetime(contact.get("InitiationTimestamp"))
-            disconn_time = parse_datetime(raw_disconn)
-            disconn_reason = None
-            agent_username = None
-            agent_conn_att = None
-            agent_afw_start = None
-            agent_afw_end = None
-            agent_afw_duration = None
-            agent_interact_duration = None
-            agent_longest_hold = None
-            queue_name = None
-            out_queue_time = None
-            customer_voice = None
-            sys_phone = None
-            agent_conn = parse_datetime(contact.get('AgentInfo', {}).get('ConnectedToAgentTimestamp', None))
-            agent_id = contact.get("AgentInfo", {}).get("Id", None)
-            queue_id = contact.get("QueueInfo", {}).get("Id", None)
-            
-
-            (
-                customer_phone,
-                agent_holds,
-                customer_hold_duration,
-                last_update_time,
-                in_queue_time,
-                queue_duration,
-                conn_to_sys
-            ) = get_contact_details(contact_id)
-
-            rows.append((
-                init_contact_id, prev_contact_id, contact_id, next_contact_id,
-                channel, init_method, init_time, disconn_time, disconn_reason,
-                last_update_time, agent_conn, agent_id, agent_username,
-                agent_conn_att, agent_afw_start, agent_afw_end, agent_afw_duration,
-                agent_interact_duration, agent_holds, agent_longest_hold,
-                queue_id, queue_name, in_queue_time, out_queue_time, queue_duration,
-                customer_voice, customer_hold_duration, contact_duration,
-                sys_phone, conn_to_sys, customer_phone
-            ))
-
-            time_module.sleep(0.05)
-
-        next_token = response.get("NextToken")
-        if not next_token:
-            break
-
-    print(f"Total fetched: {total_fetched}")
-    return rows
+        if SEARCH_CRITERIA:
+            params["SearchCriteria"] = SEARCH_CRITERIA
+        next_token = progress[index]["next_token"]
+        offset = progress[index].get("offset", 0)
+
+        while not stop.is_set():
+            if next_token:
+                params["NextToken"] = next_token
+            try:
+                response = client.search_contacts(**params)
+            except Exception as e:
+                # Nothing is buffered for this page: the slice keeps its last flushed NextToken, stays
+                # pending and is searched again from there on resume
+                print(f"Error searching {progress[index]['start']} - {progress[index]['end']}, "
+                      f"slice left pending: {e}")
+                break
+            page_token, next_token = next_token, response.get("NextToken")
+            page = response.get("Contacts", [])
+
+            # On a stop the slice keeps this page's token and the contacts of it already described.
+            # A page with nothing left to describe still records the move to the next token
+            batch_starts = range(offset, len(page), DESCRIBE_BATCH) if offset < len(page) else [len(page)]
+            for batch_start in batch_starts:
+                if stop.is_set() and batch_start < len(page):
+                    return
+                batch_end = min(batch_start + DESCRIBE_BATCH, len(page))
+                # Only completed contacts are kept (no server-side criterion exists for them).
+                # Contacts on a slice boundary can come back twice, so they are de-duplicated by Id.
+                with lock:
+                    contacts = [contact for contact in page[batch_start:batch_end]
+                                if contact.get("Id") and contact.get("DisconnectTimestamp")
+                                and contact["Id"] not in seen]
+                    seen.update(contact["Id"] for contact in contacts)
+
+                details = describes.map(get_contact_details, [contact["Id"] for contact in contacts])
+                rows = [build_call_row(contact, contact_details) for contact, contact_details in zip(contacts, details)]
+                position = (next_token, 0) if batch_end == len(page) else (page_token, batch_end)
+                with lock:
+                    buffer.append((index, rows, position))
+            offset = 0
+            if not next_token:
+                break
+
+    def flush():
+        # After a failed insert nothing is flushed again: a later flush would move the NextToken of a
+        # slice past the pages whose rows were dropped, and those contacts would never be loaded
+        nonlocal loaded, flush_failed
+        if flush_failed:
+            return False
+        with lock:
+            batch = buffer[:]
+            del buffer[:]
+        rows = [row for _, page_rows, _ in batch for row in page_rows]
+        if rows and not insert_into_redshift(rows):
+            flush_failed = True
+            return False
+        for index, _, (next_token, offset) in batch:
+            progress[index]["next_token"] = next_token
+            progress[index]["offset"] = offset
+            progress[index]["done"] = not next_token and not offset
+        loaded += len(rows)
+        return True
+
+    def buffered_rows():
+        with lock:
+            return sum(len(page_rows) for _, page_rows, _ in buffer)
+
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as searches, \
+            ThreadPoolExecutor(max_workers=DESCRIBE_WORKERS) as describes:
+        futures = [searches.submit(search_slice, index, describes) for index in range(len(progress))]
+        running = set(futures)
+        while running:
+            _, running = wait(running, timeout=1)
+            if context and not stop.is_set() and context.get_remaining_time_in_millis() < STOP_BEFORE_DEADLINE_MS:
+                print("Approaching the Lambda timeout, stopping after the pages in flight")
+                stop.set()
+            if not flush_failed and buffered_rows() >= FLUSH_ROWS and not flush():
+                print("Flush failed, stopping after the pages in flight")
+                stop.set()
+        for future in futures:
+            future.result()
+
+    # Rows of a failed flush (and those buffered after it) are dropped; their pages stay pending and
+    # are fetched again on resume
+    flush()
+
+    pending = [{key: value for key, value in slice_progress.items() if key != "done"}
+               for slice_progress in progress if not slice_progress["done"]]
+    print(f"Loaded {loaded} completed contacts, {len(pending)} of {len(progress)} slices pending "
+          f"(describe rate {client.limiter('describe_contact').rate:.2f}/s)")
+    return loaded, pending
 
 
 def insert_into_redshift(rows):
     if not rows:
         print("No rows to insert.")
-        return
+        return True
 
     insert_sql = """
         INSERT INTO connect.f_calls_staging (
@@ -219,8 +427,10 @@ def insert_into_redshift(rows):
                 # Execute stored procedure
                 cur.execute(procedure_sql)
                 print("Stored procedure 'connect.insert_new_f_calls()' executed.")
+        return True
     except Exception as e:
         print(f"Redshift error: {e}")
+        return False
     finally:
         if 'conn' in locals():
             conn.close()
@@ -228,16 +438,56 @@ def insert_into_redshift(rows):
 # Lambda entry point
 def lambda_handler(event, context):
     start_time = time_module.time()
+    client.reset_counters()
+
+    # Step Functions passes the previous output back to resume an interrupted window or backfill
+    event = event or {}
+    continuation = event.get("continuation")
+    backfill = event.get("backfill") or (continuation or {}).get("backfill")
+    units = []
+    if backfill:
+        # Units run concurrently: their slices share the search and describe pools and the API budget.
+        # On resume the completed-unit table says what is left
+        in_flight = (continuation or {}).get("slices", [])
+        if continuation:
+            print(f"Resuming backfill with {len(in_flight)} in-flight slices")
+        units, slices = plan_backfill(backfill, in_flight)
+    elif continuation:
+        slices = continuation["slices"]
+        units = continuation.get("units", [])
+        print(f"Resuming {len(slices)} pending slices")
+    else:
+        start_utc, end_utc, interval_label = get_previous_interval_bounds(datetime.datetime.now(NY_TZ), NY_TZ)
+        print(f"Interval {interval_label}")
+        slices = new_slices(start_utc, end_utc)
 
-    calls = fetch_completed_calls(START_DATE_UTC, END_DATE_UTC)
-    insert_into_redshift(calls)
+    loaded, pending = extract_calls(slices, context)
+    total_loaded = loaded + (continuation or {}).get("rows_loaded", 0)
+    if units:
+        units = mark_completed_units(units, pending)
+    client.report_counters()
 
     end_time = time_module.time()
     minutes = int((end_time - start_time) // 60)
     seconds = int((end_time - start_time) % 60)
     print(f"Execution time: {minutes} min {seconds} sec")
 
+    if pending:
+        # A backfill continuation carries its range and the slices of started units only (the payload
+        # limit is 256 KB); a window carries its pending slices
+        if backfill:
+            next_run = {"backfill": backfill, "slices": in_flight_slices(slices, pending)}
+        else:
+            next_run = {"slices": pending, "units": units}
+        return {
+            "statusCode": 200,
+            "complete": False,
+            "body": f"Loaded {total_loaded} calls so far, {len(pending)} slices pending.",
+            "continuation": {**next_run, "rows_loaded": total_loaded}
+        }
+
     return {
         "statusCode": 200,
-        "body": f"Loaded {len(calls)} calls into Redshift staging."
+        "complete": True,
+        "body": f"Loaded {total_loaded} calls into Redshift staging."
     }
\ No newline at end of file
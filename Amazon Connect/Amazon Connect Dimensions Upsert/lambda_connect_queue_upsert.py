@@ -4,6 +4,8 @@ import json
 from datetime import datetime
 import pytz
 import os
+from connect_api import ConnectClient, connect_client_config
+from connect_redshift import upsert_rows
 
 # AWS Configuration
 instance_id = os.getenv("INSTANCE_ID")
@@ -15,13 +17,18 @@ region_name = os.getenv("REGION")
 REDSHIFT_CONFIG = json.loads(os.environ["REDSHIFT_CONFIG"])
 IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
 
-# AWS clients
-connect_client = boto3.client(
+# AWS clients (Connect calls are rate limited and retried by ConnectClient)
+connect_client = ConnectClient(boto3.client(
     'connect',
     aws_access_key_id=aws_access_key_id,
     aws_secret_access_key=aws_secret_access_key,
-    region_name=region_name
-)
+    region_name=region_name,
+    config=connect_client_config()
+))
+
+# connect.dim_queues columns loaded each run; existing queues get name and last_modified updated
+QUEUE_COLUMNS = ['queue_id', 'queue_name', 'last_modified']
+QUEUE_UPDATE_COLUMNS = ['queue_name', 'last_modified']
 
 # Timezone for New York
 ny_tz = pytz.timezone('America/New_York')
@@ -76,29 +83,17 @@ def get_all_queues(instance_id):
 
 # Function to insert or update queues in Redshift
 def upsert_queues_in_redshift(queues):
+    if not queues:
+        print("No queues to upsert.")
+        return
+
     try:
         conn = psycopg2.connect(**REDSHIFT_CONFIG)
         cursor = conn.cursor()
 
-        for queue in queues:
-            # Check if the queue already exists in the database
-            cursor.execute("SELECT COUNT(*) FROM connect.dim_queues WHERE queue_id = %s", (queue['queue_id'],))
-            queue_exists = cursor.fetchone()[0]
-
-            # If the queue exists, perform an UPDATE; otherwise, perform an INSERT
-            if queue_exists > 0:
-                cursor.execute("""
-                    UPDATE connect.dim_queues
-                    SET queue_name = %s, last_modified = %s
-                    WHERE queue_id = %s
-                """, (queue['queue_name'], queue['last_modified'], queue['queue_id']))
-                print(f"Updated queue {queue['queue_id']}")
-            else:
-                cursor.execute("""
-                    INSERT INTO connect.dim_queues (queue_id, queue_name, last_modified)
-                    VALUES (%s, %s, %s)
-                """, (queue['queue_id'], queue['queue_name'], queue['last_modified']))
-                print(f"Inserted queue {queue['queue_id']}")
+        # The whole snapshot goes into a staging table and is merged with one UPDATE and one INSERT
+        rows = [[queue[column] for column in QUEUE_COLUMNS] for queue in queues]
+        upsert_rows(cursor, 'connect.dim_queues', QUEUE_COLUMNS, ['queue_id'], QUEUE_UPDATE_COLUMNS, rows)
 
         # Commit the changes to the database
         conn.commit()
@@ -114,10 +109,13 @@ def upsert_queues_in_redshift(queues):
 
 # Lambda Handler
 def lambda_handler(event, context):
+    connect_client.reset_counters()
+
     # Fetch queues from Amazon Connect
     queues = get_all_queues(instance_id)
 
     # Insert/Update queues in Redshift
     upsert_queues_in_redshift(queues)
+    connect_client.report_counters()
 
     return {'status': 'ok', 'message': 'Queues have been updated in Redshift'}
\ No newline at end of file
@@ -3,7 +3,19 @@ import psycopg2
 import json
 from datetime import datetime
 import pytz
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
+from connect_api import ConnectClient, connect_client_config
+from connect_redshift import upsert_rows
+from connect_directory import (
+    DIRECTORY_BUCKET,
+    list_user_summaries,
+    load_directory,
+    save_directory,
+    split_changed_users,
+    summary_modified,
+)
 
 # AWS Configuration
 instance_id = os.getenv("INSTANCE_ID")
@@ -15,13 +27,23 @@ region_name = os.getenv("REGION")
 REDSHIFT_CONFIG = json.loads(os.environ["REDSHIFT_CONFIG"])
 IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
 
-# AWS clients
-connect_client = boto3.client(
+# search_users returns names for up to 100 users per call; describe_user is the per-user fallback
+USER_SEARCH_PAGE_SIZE = 100
+DESCRIBE_WORKERS = int(os.getenv('DESCRIBE_WORKERS', '4'))
+
+# AWS clients (Connect calls are rate limited and retried by ConnectClient)
+connect_client = ConnectClient(boto3.client(
     'connect',
     aws_access_key_id=aws_access_key_id,
     aws_secret_access_key=aws_secret_access_key,
-    region_name=region_name
-)
+    region_name=region_name,
+    config=connect_client_config(DESCRIBE_WORKERS)
+))
+s3 = boto3.client('s3')
+
+# connect.dim_users columns loaded each run; existing users keep their email and get the rest updated
+USER_COLUMNS = ['user_id', 'user_email', 'user_name', 'user_lastname', 'last_modified']
+USER_UPDATE_COLUMNS = ['user_name', 'user_lastname', 'last_modified']
 
 # Timezone for New York
 ny_tz = pytz.timezone('America/New_York')
@@ -33,51 +55,77 @@ def convert_to_ny_time(utc_time):
         return utc_time.astimezone(ny_tz)
     return None
 
-# Function to get all users from Amazon Connect
-def get_all_users(instance_id):
-    users = []
-    next_token = None
+# Function to get the new or changed users from Amazon Connect (every user when there is no snapshot)
+def get_all_users(instance_id, known_users=None):
     print("Starting to fetch users from Amazon Connect...")
+    summaries = list_user_summaries(connect_client, instance_id)
+    changed, unchanged, removed = split_changed_users(summaries, known_users or {})
+    print(f"Fetched {len(summaries)} users: {len(changed)} new or changed, {len(unchanged)} unchanged, "
+          f"{len(removed)} removed since the snapshot")
+
+    # Names come from search_users pages unless describing the few changed users takes fewer calls
+    identities = {}
+    if len(changed) > math.ceil(len(summaries) / USER_SEARCH_PAGE_SIZE):
+        identities = search_user_identities(instance_id)
+
+    # describe_user (concurrent, rate limited) only for users the search missed or without LastModifiedTime
+    to_describe = [user['Id'] for user in changed
+                   if user['Id'] not in identities or user.get('LastModifiedTime') is None]
+    with ThreadPoolExecutor(max_workers=DESCRIBE_WORKERS) as pool:
+        described = dict(zip(to_describe, pool.map(get_user_details, to_describe)))
+    print(f"User details: {len(changed) - len(to_describe)} from search_users, {len(to_describe)} from describe_user")
 
-    while True:
-        # Fetch users with pagination
-        if next_token:
-            response = connect_client.list_users(
-                InstanceId=instance_id,
-                NextToken=next_token
-            )
+    users = []
+    directory = dict(unchanged)
+    for user in changed:
+        user_id = user['Id']
+        user_name = user['Username']
+
+        # Get first and last name, and last modified time from the search or the describe_user API
+        if user_id in described:
+            first_name, last_name, last_modified_time = described[user_id]
         else:
-            response = connect_client.list_users(
-                InstanceId=instance_id
-            )
-
-        print(f"Fetched {len(response['UserSummaryList'])} users...")
-
-        # Extract user information
-        for user in response['UserSummaryList']:
-            user_id = user['Id']
-            user_name = user['Username']
-            
-            # Get first and last name, and last modified time using describe_user API
-            first_name, last_name, last_modified_time = get_user_details(user_id)
-            print(f"Processing user: {user_name} ({user_id})")
-
-            # Add the user details with lowercase keys as required
-            users.append({
-                'user_id': user_id,
-                'user_email': user_name,
-                'user_name': first_name,
-                'user_lastname': last_name,
-                'last_modified': last_modified_time
-            })
-
-        # Check if there are more users to fetch
-        next_token = response.get('NextToken', None)
-        if not next_token:
-            break
+            identity = identities[user_id]
+            first_name = identity.get('FirstName', None)
+            last_name = identity.get('LastName', None)
+            last_modified_time = user['LastModifiedTime'].strftime('%Y-%m-%d %H:%M:%S')
+        print(f"Processing user: {user_name} ({user_id})")
+
+        # Add the user details with lowercase keys as required
+        users.append({
+            'user_id': user_id,
+            'user_email': user_name,
+            'user_name': first_name,
+            'user_lastname': last_name,
+            'last_modified': last_modified_time
+        })
+
+        # Every listed user goes in the snapshot (agent metrics takes its agent ids from it); one whose
+        # describe failed is stored without summary_modified, so the next run describes it again
+        modified = summary_modified(user) if last_modified_time is not None else None
+        directory[user_id] = {**users[-1], 'summary_modified': modified}
 
     print(f"Total users fetched: {len(users)}")
-    return users
+    return users, directory
+
+def search_user_identities(instance_id):
+    """Return {user_id: IdentityInfo} for every user, 100 per search_users page ({} if the search fails)."""
+    identities = {}
+    params = {'InstanceId': instance_id, 'MaxResults': USER_SEARCH_PAGE_SIZE}
+    try:
+        while True:
+            response = connect_client.search_users(**params)
+            for user in response.get('Users', []):
+                identities[user['Id']] = user.get('IdentityInfo') or {}
+            params['NextToken'] = response.get('NextToken')
+            if not params['NextToken']:
+                break
+    except Exception as e:
+        # Without the search every changed user is described, as before
+        print(f"Error searching users: {e}")
+        return {}
+    print(f"Identity info fetched for {len(identities)} users with search_users")
+    return identities
 
 def get_user_details(user_id):
     """Fetch detailed information about a user including first and last name and last modified time."""
@@ -110,28 +158,9 @@ def upsert_users_in_redshift(users):
         conn = psycopg2.connect(**REDSHIFT_CONFIG)
         cursor = conn.cursor()
 
-        for user in users:
-            print(f"Checking if user {user['user_id']} exists in Redshift...")
-            # Check if the user already exists in the database
-            cursor.execute("SELECT COUNT(*) FROM connect.dim_users WHERE user_id = %s", (user['user_id'],))
-            user_exists = cursor.fetchone()[0]
-
-            # If the user exists, perform an UPDATE; otherwise, perform an INSERT
-            if user_exists > 0:
-                print(f"User {user['user_id']} exists. Updating record...")
-                cursor.execute("""
-                    UPDATE connect.dim_users
-                    SET user_name = %s, user_lastname = %s, last_modified = %s
-                    WHERE user_id = %s
-                """, (user['user_name'], user['user_lastname'], user['last_modified'], user['user_id']))
-                print(f"Updated user {user['user_id']}")
-            else:
-                print(f"User {user['user_id']} does not exist. Inserting new record...")
-                cursor.execute("""
-                    INSERT INTO connect.dim_users (user_id, user_email, user_name, user_lastname, last_modified)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (user['user_id'], user['user_email'], user['user_name'], user['user_lastname'], user['last_modified']))
-                print(f"Inserted user {user['user_id']}")
+        # All users go into a staging table and are merged with one UPDATE and one INSERT
+        rows = [[user[column] for column in USER_COLUMNS] for user in users]
+        upsert_rows(cursor, 'connect.dim_users', USER_COLUMNS, ['user_id'], USER_UPDATE_COLUMNS, rows)
 
         # Commit the changes to the database
         conn.commit()
@@ -139,18 +168,29 @@ def upsert_users_in_redshift(users):
 
         cursor.close()
         conn.close()
+        return True
     except Exception as e:
         print(f"Error during upsert operation: {e}")
+        return False
 
 # Lambda Handler
 def lambda_handler(event, context):
     print("Starting script execution...")
 
+    connect_client.reset_counters()
+
+    # Users unchanged since the snapshot are neither described nor upserted ({"full_refresh": true} redoes all)
+    snapshot = None if (event or {}).get('full_refresh') else load_directory(s3)
+    known_users = snapshot['users'] if snapshot else {}
+
     # Fetch users from Amazon Connect
-    users = get_all_users(instance_id)
+    users, directory = get_all_users(instance_id, known_users)
 
-    # Insert/Update users in Redshift
-    upsert_users_in_redshift(users)
+    # Insert/Update users in Redshift; the snapshot only moves once they are in Redshift
+    upserted = upsert_users_in_redshift(users) if users else True
+    if DIRECTORY_BUCKET and upserted and (users or directory.keys() != known_users.keys()):
+        save_directory(s3, directory)
+    connect_client.report_counters()
 
     print('Users have been updated in Redshift')
 
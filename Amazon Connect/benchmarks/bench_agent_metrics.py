@@ -0,0 +1,107 @@
+"""
+Compare the legacy dict-per-row parsing of connect_agent_metrics with the
+positional parser, and the client-side cost of each load path, on synthetic
+get_metric_data_v2 results.
+
+    python "Amazon Connect/benchmarks/bench_agent_metrics.py" --agent-hours 1000,10000,100000
+
+Legacy: one 55-key dict per agent-hour, every metric name lowercased, then
+re-tupled for execute_values (default page size 100). New: rows filled through
+METRIC_INDEX, loaded with paged INSERTs or, from BULK_LOAD_MIN_ROWS, staged as
+gzipped CSV for a single COPY. The Redshift side is not timed; the statement
+count and the staged bytes show what each path sends.
+Needs psycopg2 and boto3 importable (connect_agent_metrics imports them).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+for name, value in (('REDSHIFT_CONFIG', '{}'), ('INSTANCE_ID', 'bench'), ('TIMEZONE', 'America/New_York'),
+                    ('REGION', 'us-east-1')):
+    os.environ.setdefault(name, value)
+
+import connect_agent_metrics as metrics  # noqa: E402
+from connect_redshift import BULK_LOAD_MIN_ROWS, INSERT_PAGE_SIZE, encode_csv_gzip  # noqa: E402
+
+LEGACY_PAGE_SIZE = 100
+
+
+def legacy_parse_metrics_to_json(metric_results):
+    # parse_metrics_to_json + the re-tupling of insert_json_rows_to_redshift before the positional parser
+    rows = []
+    for entry in metric_results:
+        row = {
+            'agent_id': entry['Dimensions']['AGENT'],
+            'start_time': entry['MetricInterval']['StartTime'].astimezone(metrics.ny_tz).replace(tzinfo=None),
+            'end_time': entry['MetricInterval']['EndTime'].astimezone(metrics.ny_tz).replace(tzinfo=None),
+        }
+        for metric in metrics.EXPECTED_METRICS:
+            row[metric.lower()] = None
+        for metric in entry['Collections']:
+            name = metric['Metric']['Name'].lower()
+            value = metric.get('Value')
+            row[name] = round(value, 2) if value is not None else None
+        rows.append(row)
+    column_names = list(rows[0].keys())
+    return [tuple(row.get(col) for col in column_names) for row in rows]
+
+
+def make_metric_results(agent_hours, null_rate, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 3, 10, 4, tzinfo=pytz.utc)
+    results = []
+    for index in range(agent_hours):
+        hour = start + timedelta(hours=index % 24)
+        results.append({
+            'Dimensions': {'AGENT': f'agent-{index // 24:06d}'},
+            'MetricInterval': {'StartTime': hour, 'EndTime': hour + timedelta(hours=1)},
+            'Collections': [{'Metric': {'Name': name}, 'Value': None if rng.random() < null_rate else rng.random() * 3600}
+                            for name in metrics.METRIC_NAMES],
+        })
+    return results
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agent-hours', default='1000,10000,100000', help='comma list of result sizes')
+    parser.add_argument('--null-rate', type=float, default=0.3, help='share of metrics returned without a value')
+    args = parser.parse_args()
+
+    print(f"{'agent-hours':>11} {'parser':<8} {'parse s':>8} {'rows/s':>10} {'load path':<10} {'encode s':>9} "
+          f"{'statements':>10} {'staged KB':>10}")
+    for agent_hours in [int(value) for value in args.agent_hours.split(',') if value]:
+        results = make_metric_results(agent_hours, args.null_rate)
+
+        legacy_seconds, legacy = timed(legacy_parse_metrics_to_json, results)
+        new_seconds, rows = timed(metrics.parse_metric_rows, results)
+        if [list(row) for row in legacy] != rows:
+            raise SystemExit(f"Parsers disagree at {agent_hours} agent-hours")
+
+        legacy_statements = -(-agent_hours // LEGACY_PAGE_SIZE)
+        print(f"{agent_hours:>11,} {'legacy':<8} {legacy_seconds:>8.3f} {agent_hours / legacy_seconds:>10,.0f} "
+              f"{'insert':<10} {'':>9} {legacy_statements:>10,} {'':>10}")
+        if agent_hours >= BULK_LOAD_MIN_ROWS:
+            encode_seconds, body = timed(encode_csv_gzip, rows)
+            print(f"{'':>11} {'indexed':<8} {new_seconds:>8.3f} {agent_hours / new_seconds:>10,.0f} "
+                  f"{'copy':<10} {encode_seconds:>9.3f} {1:>10,} {len(body) / 1024:>10,.0f}")
+        else:
+            print(f"{'':>11} {'indexed':<8} {new_seconds:>8.3f} {agent_hours / new_seconds:>10,.0f} "
+                  f"{'insert':<10} {'':>9} {-(-agent_hours // INSERT_PAGE_SIZE):>10,} {'':>10}")
+        print(f"{'':>11} speed-up x{legacy_seconds / new_seconds:.1f} parsing")
+
+
+if __name__ == '__main__':
+    main()
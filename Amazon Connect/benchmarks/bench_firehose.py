@@ -0,0 +1,272 @@
+"""
+Load-test the Firehose CTR transformer (lambda_connect_firehose_redshift.py)
+with synthetic batches and a local DynamoDB stand-in.
+
+    python "Amazon Connect/benchmarks/bench_firehose.py" --invocations 20 --batch-records 500 \
+        --payloads small,large --duplicate-rates 0,0.3 --formats json,csv --latency-ms 8
+
+Every configuration (payload size x duplicate rate x OUTPUT_FORMAT) runs the
+real lambda_handler over the same batches. The stand-in replaces the module's
+DynamoDB client: batch_get_item and transact_write_items sleep --latency-ms
+per call, and --race-rate makes some ids appear as registered by another
+invocation between the read and the write (TransactionCanceledException).
+The recent-ids cache stays warm across the invocations of a configuration,
+as in a warm container (--cold clears it before each invocation).
+
+The handler works on the whole batch, so records are not timed one by one:
+ms/rec is each invocation's time divided by its records, and its p50/p99
+are taken across invocations. They are not a per-record latency
+distribution. The records/invocation column is how many records fit in
+Firehose's 3-minute transform timeout at the p99 ms/rec.
+Needs boto3 importable (the module creates its client at import time).
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'Amazon Connect CTR with Firehose'))
+
+import lambda_connect_firehose_redshift as firehose  # noqa: E402
+
+FIREHOSE_TIMEOUT_SECONDS = 180
+
+# Contact attributes per CTR: real payloads go from a few hundred bytes to tens of KB
+PAYLOAD_ATTRIBUTES = {'small': 0, 'medium': 20, 'large': 200}
+
+
+class LocalDynamo:
+    """
+    In-memory ProcessedCTR with the two calls the transformer makes. Each call
+    sleeps `latency` seconds; `race_rate` is the share of new ids that another
+    invocation registers between batch_get_item and transact_write_items.
+    """
+
+    class exceptions:
+        class TransactionCanceledException(Exception):
+            def __init__(self, reasons):
+                super().__init__('Transaction cancelled')
+                self.response = {'Error': {'Code': 'TransactionCanceledException'}, 'CancellationReasons': reasons}
+
+    def __init__(self, latency=0.0, race_rate=0.0, seed=11):
+        self.latency = latency
+        self.race_rate = race_rate
+        self.rng = random.Random(seed)
+        self.items = set()
+        self.raced = set()
+        self.calls = {'batch_get_item': 0, 'transact_write_items': 0, 'cancelled': 0}
+        self.lock = threading.Lock()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def batch_get_item(self, RequestItems):
+        self._call('batch_get_item')
+        (table, request), = RequestItems.items()
+        with self.lock:
+            found = [key for key in request['Keys'] if key['ContactId']['S'] in self.items]
+        return {'Responses': {table: found}, 'UnprocessedKeys': {}}
+
+    def transact_write_items(self, TransactItems):
+        self._call('transact_write_items')
+        ids = [item['Put']['Item']['ContactId']['S'] for item in TransactItems]
+        with self.lock:
+            # The race is drawn once per id: a retry of the same write only fails for ids already taken
+            for contact_id in ids:
+                if contact_id not in self.items and contact_id not in self.raced:
+                    self.raced.add(contact_id)
+                    if self.rng.random() < self.race_rate:
+                        self.items.add(contact_id)
+            reasons = [{'Code': 'ConditionalCheckFailed' if contact_id in self.items else 'None'} for contact_id in ids]
+            if any(reason['Code'] != 'None' for reason in reasons):
+                self.calls['cancelled'] += 1
+                raise self.exceptions.TransactionCanceledException(reasons)
+            self.items.update(ids)
+        return {}
+
+
+def iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+
+
+def make_ctr(rng, contact_id, attributes):
+    start = datetime(2025, 3, 1) + timedelta(seconds=rng.randrange(60 * 86400))
+    enqueued = start + timedelta(seconds=rng.randrange(5, 30))
+    connected = enqueued + timedelta(seconds=rng.randrange(5, 300))
+    ended = connected + timedelta(seconds=rng.randrange(30, 1800))
+    return {
+        'ContactId': contact_id,
+        'InitialContactId': contact_id,
+        'Channel': 'VOICE',
+        'InitiationMethod': rng.choice(['INBOUND', 'OUTBOUND', 'TRANSFER']),
+        'InitiationTimestamp': iso(start),
+        'ConnectedToSystemTimestamp': iso(start),
+        'DisconnectTimestamp': iso(ended),
+        'DisconnectReason': rng.choice(['CUSTOMER_DISCONNECT', 'AGENT_DISCONNECT']),
+        'LastUpdateTimestamp': iso(ended + timedelta(seconds=60)),
+        'AgentConnectionAttempts': 1,
+        'Agent': {
+            'ARN': f'arn:aws:connect:us-east-1:000000000000:instance/bench/agent/{uuid.UUID(int=rng.getrandbits(128))}',
+            'Username': f'agent{rng.randrange(300)}',
+            'ConnectedToAgentTimestamp': iso(connected),
+            'AfterContactWorkStartTimestamp': iso(ended),
+            'AfterContactWorkEndTimestamp': iso(ended + timedelta(seconds=45)),
+            'AfterContactWorkDuration': 45,
+            'AgentInteractionDuration': int((ended - connected).total_seconds()),
+            'NumberOfHolds': rng.randrange(3),
+            'LongestHoldDuration': rng.randrange(120),
+            'CustomerHoldDuration': rng.randrange(240),
+        },
+        'Queue': {
+            'ARN': f'arn:aws:connect:us-east-1:000000000000:instance/bench/queue/q{rng.randrange(20)}',
+            'Name': f'Queue {rng.randrange(20)}',
+            'EnqueueTimestamp': iso(enqueued),
+            'DequeueTimestamp': iso(connected),
+            'Duration': int((connected - enqueued).total_seconds()),
+        },
+        'CustomerEndpoint': {'Address': f'+1555{rng.randrange(10 ** 7):07d}', 'Type': 'TELEPHONE_NUMBER'},
+        'SystemEndpoint': {'Address': '+18005550100', 'Type': 'TELEPHONE_NUMBER'},
+        'Attributes': {f'attribute_{index}': f'value {rng.random():.12f}' for index in range(attributes)},
+    }
+
+
+def make_batches(invocations, batch_records, payload, duplicate_rate, malformed_rate, empty_rate, seed=7):
+    """
+    Firehose events plus the number of records each one should emit as Ok.
+    Duplicates reuse an id from this or an earlier batch; malformed records are
+    invalid JSON or lack a ContactId; empty records have no data.
+    """
+    rng = random.Random(seed)
+    seen = []
+    batches = []
+    for _ in range(invocations):
+        records = []
+        expected_ok = 0
+        for index in range(batch_records):
+            draw = rng.random()
+            if draw < empty_rate:
+                data = ''
+            elif draw < empty_rate + malformed_rate:
+                body = '{"ContactId": "truncated' if rng.random() < 0.5 else json.dumps({'Channel': 'VOICE'})
+                data = base64.b64encode(body.encode('utf-8')).decode('utf-8')
+            else:
+                if seen and rng.random() < duplicate_rate:
+                    contact_id = rng.choice(seen)
+                else:
+                    contact_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                    seen.append(contact_id)
+                    expected_ok += 1
+                body = json.dumps(make_ctr(rng, contact_id, PAYLOAD_ATTRIBUTES[payload]))
+                data = base64.b64encode(body.encode('utf-8')).decode('utf-8')
+            records.append({'recordId': f'{len(batches)}-{index}', 'data': data})
+        batches.append(({'records': records}, expected_ok))
+    return batches
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def run_configuration(batches, output_format, latency, race_rate, cold):
+    dynamo = LocalDynamo(latency=latency, race_rate=race_rate)
+    firehose.dynamo = dynamo
+    firehose.OUTPUT_FORMAT = output_format
+    firehose.recent_ids = firehose.RecentIdCache(firehose.RECENT_IDS_CACHE_SIZE, firehose.RECENT_IDS_TTL_SECONDS)
+
+    invocation_ms_per_record = []
+    records = ok = expected = input_bytes = output_bytes = response_bytes = 0
+    elapsed = 0.0
+    for event, expected_ok in batches:
+        if cold:
+            firehose.recent_ids.entries.clear()
+        # The handler logs every duplicate; keep that out of the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            response = firehose.lambda_handler(event, None)
+            seconds = time.perf_counter() - started
+        elapsed += seconds
+        records += len(event['records'])
+        invocation_ms_per_record.append(seconds * 1000 / len(event['records']))
+        input_bytes += sum(len(record['data']) for record in event['records'])
+        expected += expected_ok
+        response_bytes += len(json.dumps(response))
+        for record in response['records']:
+            if record['result'] == 'Ok':
+                ok += 1
+                output_bytes += len(base64.b64decode(record['data']))
+
+    return {
+        'records_per_second': records / elapsed,
+        'ms_per_record_p50': percentile(invocation_ms_per_record, 0.50),
+        'ms_per_record_p99': percentile(invocation_ms_per_record, 0.99),
+        'ok': ok,
+        'expected_ok': expected,
+        'output_bytes_per_ok': output_bytes / ok if ok else 0,
+        'output_ratio': output_bytes / (input_bytes * 3 / 4) if input_bytes else 0,
+        'response_mb': response_bytes / len(batches) / 1024 ** 2,
+        'dynamo_calls': dynamo.calls,
+    }
+
+
+def csv_list(text, cast=str):
+    return [cast(value) for value in text.split(',') if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invocations', type=int, default=20)
+    parser.add_argument('--batch-records', type=int, default=500)
+    parser.add_argument('--payloads', default='small,large', help=f"comma list of {', '.join(PAYLOAD_ATTRIBUTES)}")
+    parser.add_argument('--duplicate-rates', default='0,0.3', help='comma list of shares of repeated ContactIds')
+    parser.add_argument('--formats', default=','.join(firehose.OUTPUT_ENCODERS), help='comma list of OUTPUT_FORMAT values')
+    parser.add_argument('--malformed-rate', type=float, default=0.01)
+    parser.add_argument('--empty-rate', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='latency of every DynamoDB call')
+    parser.add_argument('--race-rate', type=float, default=0.0, help='share of new ids registered by a concurrent invocation')
+    parser.add_argument('--cold', action='store_true', help='clear the recent-ids cache before every invocation')
+    args = parser.parse_args()
+
+    print(f"{args.invocations} invocations x {args.batch_records} records, DynamoDB latency {args.latency_ms} ms, "
+          f"{args.malformed_rate:.0%} malformed, {args.empty_rate:.0%} empty, race {args.race_rate:.0%}, "
+          f"{'cold' if args.cold else 'warm'} cache")
+    print(f"{'payload':<8} {'dups':>5} {'format':<11} {'records/s':>10} {'ms/rec p50':>11} {'ms/rec p99':>11} "
+          f"{'rec/invoc':>10} {'bytes/ok':>9} {'out/in':>7} {'resp MB':>8} {'ok':>7} {'get':>5} {'put':>5}")
+
+    for payload in csv_list(args.payloads):
+        for duplicate_rate in csv_list(args.duplicate_rates, float):
+            batches = make_batches(args.invocations, args.batch_records, payload, duplicate_rate,
+                                   args.malformed_rate, args.empty_rate)
+            for output_format in csv_list(args.formats):
+                result = run_configuration(batches, output_format, args.latency_ms / 1000, args.race_rate, args.cold)
+                fits = int(FIREHOSE_TIMEOUT_SECONDS / (result['ms_per_record_p99'] / 1000))
+                # Races turn some new ids into duplicates, so fewer Ok records than generated is expected then
+                check = '' if result['ok'] == result['expected_ok'] or args.race_rate else ' !'
+                calls = result['dynamo_calls']
+                print(f"{payload:<8} {duplicate_rate:>5.0%} {output_format:<11} {result['records_per_second']:>10,.0f} "
+                      f"{result['ms_per_record_p50']:>11.3f} {result['ms_per_record_p99']:>11.3f} {fits:>10,} "
+                      f"{result['output_bytes_per_ok']:>9,.0f} {result['output_ratio']:>7.1%} "
+                      f"{result['response_mb']:>8.2f} {result['ok']:>7,}{check} "
+                      f"{calls['batch_get_item']:>5} {calls['transact_write_items']:>5}")
+
+    print("ms/rec: invocation time / its records, p50 and p99 across invocations (records are not timed singly).")
+    print(f"rec/invoc: records one invocation can take within Firehose's {FIREHOSE_TIMEOUT_SECONDS}s timeout at the p99 "
+          "ms/rec. "
+          "resp MB: mean transformed response per invocation (Firehose limit 6 MB).")
+
+
+if __name__ == '__main__':
+    main()
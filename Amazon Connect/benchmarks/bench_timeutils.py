@@ -0,0 +1,84 @@
+"""
+Compare the legacy per-call parse_datetime of the CTR loaders with the cached
+connect_timeutils formatter on synthetic CTR timestamps.
+
+    python "Amazon Connect/benchmarks/bench_timeutils.py" --records 50000
+
+Each record carries the nine timestamps the Firehose transformer converts.
+Part of them have fractional seconds, which the legacy parser rejects.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from connect_timeutils import LocalTimeFormatter  # noqa: E402
+
+TIMESTAMPS_PER_RECORD = 9
+
+
+def legacy_parse_datetime(timestamp):
+    # parse_datetime of lambda_connect_firehose_redshift.py before connect_timeutils
+    eastern_tz = pytz.timezone("America/New_York")
+    if timestamp:
+        try:
+            dt_utc = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+            dt_utc = dt_utc.replace(tzinfo=pytz.utc)
+            return dt_utc.astimezone(eastern_tz).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+    return None
+
+
+def make_timestamps(records, fraction_rate, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 3, 1)
+    values = []
+    for _ in range(records * TIMESTAMPS_PER_RECORD):
+        moment = start + timedelta(seconds=rng.randrange(60 * 86400))
+        text = moment.strftime('%Y-%m-%dT%H:%M:%S')
+        if rng.random() < fraction_rate:
+            text += f'.{rng.randrange(1000):03d}'
+        values.append(text + 'Z')
+    return values
+
+
+def run(convert, values, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [convert(value) for value in values]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--fraction-rate', type=float, default=0.3, help='share of timestamps with fractional seconds')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    values = make_timestamps(args.records, args.fraction_rate)
+    print(f"{args.records} records x {TIMESTAMPS_PER_RECORD} timestamps, {args.fraction_rate:.0%} with fractions")
+    print(f"{'parser':<10} {'seconds':>9} {'records/s':>12} {'parsed':>9}")
+
+    legacy_seconds, legacy = run(legacy_parse_datetime, values, args.repeat)
+    cached_seconds, cached = run(LocalTimeFormatter().format, values, args.repeat)
+    for name, seconds, results in (('legacy', legacy_seconds, legacy), ('cached', cached_seconds, cached)):
+        parsed = sum(result is not None for result in results)
+        print(f"{name:<10} {seconds:>9.3f} {args.records / seconds:>12,.0f} {parsed / len(results):>9.1%}")
+
+    mismatches = sum(1 for old, new in zip(legacy, cached) if old is not None and old != new)
+    print(f"speed-up x{legacy_seconds / cached_seconds:.1f}, {mismatches} mismatches where the legacy parser succeeded")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
 import psycopg2
-from psycopg2.extras import execute_values
 import boto3
 import pytz
 import json 
 import os 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, time
+from connect_api import ConnectClient, connect_client_config
+from connect_redshift import merge_rows
+from connect_directory import DIRECTORY_BUCKET, DIRECTORY_MAX_AGE_HOURS, directory_age_hours, load_directory
 
 # Constants
 REDSHIFT_CONFIG = json.loads(os.environ['REDSHIFT_CONFIG'])
@@ -13,6 +16,73 @@ TIMEZONE = os.environ['TIMEZONE']
 ny_tz = pytz.timezone(TIMEZONE)
 REGION = os.environ['REGION']
 
+# get_metric_data_v2 requests run on a bounded pool; the ConnectClient rate limit is shared by every worker
+METRIC_WORKERS = int(os.getenv('METRIC_WORKERS', '4'))
+# Metrics per request (0 = all in one request); smaller groups are merged back per (agent, interval)
+METRICS_PER_REQUEST = int(os.getenv('METRICS_PER_REQUEST', '0'))
+AGENTS_PER_REQUEST = 100
+# Days one event may request (get_metric_data_v2 is called per day, since HOUR intervals allow < 3 days per request)
+MAX_DAYS_PER_RUN = int(os.getenv('MAX_DAYS_PER_RUN', '31'))
+
+# 'daily' loads whole local days (yesterday by default); 'incremental' loads the hours closed since the
+# watermark (event key 'mode' overrides). Every LATE_REFETCH_HOURS an incremental run also re-fetches the hours
+# that have been closed for LATE_INTERVALS hours since the previous refetch, to pick up late corrections (0 = never)
+METRICS_MODE = os.getenv('METRICS_MODE', 'daily')
+LATE_INTERVALS = int(os.getenv('LATE_INTERVALS', '2'))
+LATE_REFETCH_HOURS = int(os.getenv('LATE_REFETCH_HOURS', '6'))
+WATERMARK_TABLE = os.getenv('WATERMARK_TABLE', 'ConnectAgentMetricsWatermark')
+WATERMARK_NAME = 'f_agent_metrics'
+# Only fetch the hourly metrics of agents with online time in the window (found with one TOTAL-interval probe)
+ACTIVE_AGENTS_ONLY = os.getenv('ACTIVE_AGENTS_ONLY', 'false').lower() == 'true'
+ACTIVITY_METRIC = 'SUM_ONLINE_TIME_AGENT'
+
+METRIC_NAMES = [
+    'SUM_ONLINE_TIME_AGENT', 'SUM_NON_PRODUCTIVE_TIME_AGENT', 'AGENT_ADHERENT_TIME',
+    'AGENT_NON_ADHERENT_TIME', 'AGENT_ANSWER_RATE', 'AGENT_NON_RESPONSE',
+    'AGENT_NON_RESPONSE_WITHOUT_CUSTOMER_ABANDONS', 'AGENT_OCCUPANCY',
+    'AGENT_SCHEDULED_TIME', 'AGENT_SCHEDULE_ADHERENCE', 'AVG_DIALS_PER_MINUTE',
+    'SUM_IDLE_TIME_AGENT', 'SUM_ERROR_STATUS_TIME_AGENT', 'SUM_CONTACT_TIME_AGENT',
+    'SUM_CONNECTING_TIME_AGENT', 'SUM_RETRY_CALLBACK_ATTEMPTS',
+    'PERCENT_TALK_TIME_CUSTOMER', 'AVG_TALK_TIME_CUSTOMER', 'PERCENT_TALK_TIME_AGENT',
+    'AVG_TALK_TIME_AGENT', 'PERCENT_TALK_TIME', 'AVG_TALK_TIME', 'CONTACTS_QUEUED',
+    'CONTACTS_QUEUED_BY_ENQUEUE', 'MAX_QUEUED_TIME', 'CONTACTS_TRANSFERRED_OUT_FROM_QUEUE',
+    'AVG_QUEUE_ANSWER_TIME', 'CONTACTS_CREATED', 'SUM_CONTACTS_DISCONNECTED',
+    'AVG_ACTIVE_TIME', 'ABANDONMENT_RATE', 'AVG_NON_TALK_TIME',
+    'AVG_INTERRUPTION_TIME_AGENT', 'DELIVERY_ATTEMPTS', 'CONTACTS_TRANSFERRED_OUT',
+    'CONTACTS_TRANSFERRED_OUT_INTERNAL', 'CONTACTS_TRANSFERRED_OUT_EXTERNAL',
+    'CONTACTS_PUT_ON_HOLD', 'AVG_HOLDS', 'SUM_HOLD_TIME', 'CONTACTS_HOLD_ABANDONS',
+    'CONTACTS_ON_HOLD_AGENT_DISCONNECT', 'CONTACTS_ON_HOLD_CUSTOMER_DISCONNECT',
+    'CONTACTS_HANDLED', 'AVG_HANDLE_TIME', 'SUM_HANDLE_TIME', 'AVG_INTERACTION_TIME',
+    'SUM_INTERACTION_TIME', 'AVG_CONTACT_DURATION', 'SUM_INTERACTION_AND_HOLD_TIME',
+    'AVG_AFTER_CONTACT_WORK_TIME', 'SUM_AFTER_CONTACT_WORK_TIME'
+]
+
+# Columns of connect.f_agent_metrics: agent_id, start_time, end_time, then one per metric
+EXPECTED_METRICS = [
+    'AGENT_ANSWER_RATE', 'AGENT_NON_RESPONSE', 'AGENT_OCCUPANCY',
+    'AVG_DIALS_PER_MINUTE', 'SUM_CONNECTING_TIME_AGENT', 'SUM_RETRY_CALLBACK_ATTEMPTS',
+    'PERCENT_TALK_TIME_CUSTOMER', 'AVG_TALK_TIME_CUSTOMER', 'PERCENT_TALK_TIME_AGENT',
+    'AVG_TALK_TIME_AGENT', 'PERCENT_TALK_TIME', 'AVG_TALK_TIME',
+    'CONTACTS_QUEUED', 'CONTACTS_QUEUED_BY_ENQUEUE', 'MAX_QUEUED_TIME',
+    'CONTACTS_TRANSFERRED_OUT_FROM_QUEUE', 'AVG_QUEUE_ANSWER_TIME', 'CONTACTS_CREATED',
+    'SUM_CONTACTS_DISCONNECTED', 'AVG_ACTIVE_TIME', 'ABANDONMENT_RATE', 'AVG_NON_TALK_TIME',
+    'AVG_INTERRUPTION_TIME_AGENT', 'DELIVERY_ATTEMPTS', 'CONTACTS_TRANSFERRED_OUT',
+    'CONTACTS_TRANSFERRED_OUT_INTERNAL', 'CONTACTS_TRANSFERRED_OUT_EXTERNAL',
+    'CONTACTS_PUT_ON_HOLD', 'AVG_HOLDS', 'SUM_HOLD_TIME', 'CONTACTS_HOLD_ABANDONS',
+    'CONTACTS_ON_HOLD_AGENT_DISCONNECT', 'CONTACTS_ON_HOLD_CUSTOMER_DISCONNECT',
+    'CONTACTS_HANDLED', 'AVG_HANDLE_TIME', 'SUM_HANDLE_TIME', 'AVG_INTERACTION_TIME',
+    'SUM_INTERACTION_TIME', 'AVG_CONTACT_DURATION', 'SUM_INTERACTION_AND_HOLD_TIME',
+    'AVG_AFTER_CONTACT_WORK_TIME', 'SUM_AFTER_CONTACT_WORK_TIME', 'SUM_ONLINE_TIME_AGENT',
+    'SUM_NON_PRODUCTIVE_TIME_AGENT', 'SUM_IDLE_TIME_AGENT', 'SUM_ERROR_STATUS_TIME_AGENT',
+    'SUM_CONTACT_TIME_AGENT', 'AGENT_NON_RESPONSE_WITHOUT_CUSTOMER_ABANDONS',
+    'AGENT_NON_ADHERENT_TIME', 'AGENT_ADHERENT_TIME', 'AGENT_SCHEDULED_TIME',
+    'AGENT_SCHEDULE_ADHERENCE'
+]
+
+METRIC_COLUMNS = ['agent_id', 'start_time', 'end_time'] + [metric.lower() for metric in EXPECTED_METRICS]
+METRIC_INDEX = {metric: index for index, metric in enumerate(EXPECTED_METRICS, start=3)}
+# One row per agent-hour: loads replace the rows with the same key
+METRIC_KEY_COLUMNS = ['agent_id', 'start_time']
 
 
 def get_all_agent_ids(client,instance_id):
@@ -38,6 +108,15 @@ def get_all_agent_ids(client,instance_id):
     return agent_ids
 
 
+def get_agent_ids(client, s3):
+    # The user directory snapshot saved by the user upsert avoids paging list_users while it is recent
+    directory = load_directory(s3) if DIRECTORY_BUCKET else None
+    if directory and directory_age_hours(directory) <= DIRECTORY_MAX_AGE_HOURS:
+        print(f" Agent IDs taken from the user directory snapshot: {len(directory['users'])}")
+        return list(directory['users'])
+    return get_all_agent_ids(client, INSTANCE_ID)
+
+
 def chunk_list(lst, chunk_size=100):
     for i in range(0, len(lst), chunk_size):
         yield lst[i:i + chunk_size]
@@ -46,10 +125,27 @@ def chunk_list(lst, chunk_size=100):
 def get_time_range():
     today_ny = datetime.now(ny_tz).date()
     yesterday_ny = today_ny - timedelta(days=1)
-    start = ny_tz.localize(datetime.combine(yesterday_ny, datetime.min.time())).astimezone(pytz.utc)
-    end = ny_tz.localize(datetime.combine(yesterday_ny, datetime.max.time())).astimezone(pytz.utc)
+    return get_day_range(yesterday_ny)
+
+def get_day_range(day):
+    start = ny_tz.localize(datetime.combine(day, datetime.min.time())).astimezone(pytz.utc)
+    end = ny_tz.localize(datetime.combine(day, datetime.max.time())).astimezone(pytz.utc)
     return start, end
 
+def get_requested_days(event):
+    # {"date": "YYYY-MM-DD"} or {"start_date": ..., "end_date": ...} (inclusive, local days); default yesterday
+    event = event or {}
+    if event.get('date') or event.get('start_date'):
+        first = datetime.strptime(event.get('date') or event['start_date'], '%Y-%m-%d').date()
+        last = datetime.strptime(event.get('date') or event.get('end_date') or event['start_date'], '%Y-%m-%d').date()
+    else:
+        first = last = datetime.now(ny_tz).date() - timedelta(days=1)
+    if last < first:
+        raise ValueError(f"end_date {last} is before start_date {first}")
+    if (last - first).days + 1 > MAX_DAYS_PER_RUN:
+        raise ValueError(f"{(last - first).days + 1} days requested, at most {MAX_DAYS_PER_RUN} per run")
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
 def get_all_metrics_paginated(client, **params):
     all_results = []
     next_token = None
@@ -65,112 +161,188 @@ def get_all_metrics_paginated(client, **params):
             break
     return all_results
 
-def parse_metrics_to_json(metric_results):
-    expected_metrics = [
-        'AGENT_ANSWER_RATE', 'AGENT_NON_RESPONSE', 'AGENT_OCCUPANCY',
-        'AVG_DIALS_PER_MINUTE', 'SUM_CONNECTING_TIME_AGENT', 'SUM_RETRY_CALLBACK_ATTEMPTS',
-        'PERCENT_TALK_TIME_CUSTOMER', 'AVG_TALK_TIME_CUSTOMER', 'PERCENT_TALK_TIME_AGENT',
-        'AVG_TALK_TIME_AGENT', 'PERCENT_TALK_TIME', 'AVG_TALK_TIME',
-        'CONTACTS_QUEUED', 'CONTACTS_QUEUED_BY_ENQUEUE', 'MAX_QUEUED_TIME',
-        'CONTACTS_TRANSFERRED_OUT_FROM_QUEUE', 'AVG_QUEUE_ANSWER_TIME', 'CONTACTS_CREATED',
-        'SUM_CONTACTS_DISCONNECTED', 'AVG_ACTIVE_TIME', 'ABANDONMENT_RATE', 'AVG_NON_TALK_TIME',
-        'AVG_INTERRUPTION_TIME_AGENT', 'DELIVERY_ATTEMPTS', 'CONTACTS_TRANSFERRED_OUT',
-        'CONTACTS_TRANSFERRED_OUT_INTERNAL', 'CONTACTS_TRANSFERRED_OUT_EXTERNAL',
-        'CONTACTS_PUT_ON_HOLD', 'AVG_HOLDS', 'SUM_HOLD_TIME', 'CONTACTS_HOLD_ABANDONS',
-        'CONTACTS_ON_HOLD_AGENT_DISCONNECT', 'CONTACTS_ON_HOLD_CUSTOMER_DISCONNECT',
-        'CONTACTS_HANDLED', 'AVG_HANDLE_TIME', 'SUM_HANDLE_TIME', 'AVG_INTERACTION_TIME',
-        'SUM_INTERACTION_TIME', 'AVG_CONTACT_DURATION', 'SUM_INTERACTION_AND_HOLD_TIME',
-        'AVG_AFTER_CONTACT_WORK_TIME', 'SUM_AFTER_CONTACT_WORK_TIME', 'SUM_ONLINE_TIME_AGENT',
-        'SUM_NON_PRODUCTIVE_TIME_AGENT', 'SUM_IDLE_TIME_AGENT', 'SUM_ERROR_STATUS_TIME_AGENT',
-        'SUM_CONTACT_TIME_AGENT', 'AGENT_NON_RESPONSE_WITHOUT_CUSTOMER_ABANDONS',
-        'AGENT_NON_ADHERENT_TIME', 'AGENT_ADHERENT_TIME', 'AGENT_SCHEDULED_TIME',
-        'AGENT_SCHEDULE_ADHERENCE'
+def get_watermark(table):
+    # End (UTC) of the last interval loaded by the incremental mode, or None before its first run
+    item = table.get_item(Key={'name': WATERMARK_NAME}).get('Item')
+    return datetime.fromisoformat(item['last_interval_end']) if item else None
+
+def advance_watermark(table, interval_end):
+    # Only moves forward, so a slow run cannot undo a later one
+    try:
+        table.update_item(
+            Key={'name': WATERMARK_NAME},
+            UpdateExpression='SET last_interval_end = :end, updated_at = :now',
+            ConditionExpression='attribute_not_exists(last_interval_end) OR last_interval_end < :end',
+            ExpressionAttributeValues={
+                ':end': interval_end.isoformat(),
+                ':now': datetime.now(ny_tz).isoformat()
+            }
+        )
+        print(f"Watermark {WATERMARK_NAME}: {interval_end.isoformat()}")
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Watermark {WATERMARK_NAME} is already at {interval_end.isoformat()} or later")
+
+def get_incremental_windows(watermark, now):
+    # Closed hours only; the first run starts at local midnight. Windows stay within a day (HOUR allows < 3 days)
+    end = now.astimezone(pytz.utc).replace(minute=0, second=0, microsecond=0)
+    if watermark is not None and watermark >= end:
+        return []
+    if watermark is None:
+        start = ny_tz.localize(datetime.combine(now.astimezone(ny_tz).date(), datetime.min.time())).astimezone(pytz.utc)
+    else:
+        start = max(get_refetch_start(watermark, end), end - timedelta(days=MAX_DAYS_PER_RUN))
+    windows = []
+    while start < end:
+        windows.append((start, min(end, start + timedelta(hours=24))))
+        start = windows[-1][1]
+    return windows
+
+def get_refetch_start(watermark, end):
+    # A run crossing a multiple of LATE_REFETCH_HOURS (UTC) goes back to LATE_INTERVALS hours before the previous
+    # multiple: every hour is loaded once when it closes and once more after it has settled
+    if not LATE_INTERVALS:
+        return watermark
+    period = timedelta(hours=LATE_REFETCH_HOURS)
+    epoch = datetime(1970, 1, 1, tzinfo=pytz.utc)
+    last_refetch = epoch + (watermark - epoch) // period * period
+    if end < last_refetch + period:
+        return watermark
+    return last_refetch - timedelta(hours=LATE_INTERVALS)
+
+def fetch_metric_results(client, base_params, agent_ids, metric_names, windows=None):
+    # One request per (time window, agent chunk, metric group); pool.map keeps the results in request order
+    windows = windows or [(base_params['StartTime'], base_params['EndTime'])]
+    metric_groups = list(chunk_list(metric_names, METRICS_PER_REQUEST or len(metric_names)))
+    requests = [
+        {**base_params,
+         'StartTime': start_time,
+         'EndTime': end_time,
+         'Filters': [{'FilterKey': 'AGENT', 'FilterValues': agent_chunk}],
+         'Metrics': [{'Name': name} for name in metric_group]}
+        for start_time, end_time in windows
+        for agent_chunk in chunk_list(agent_ids, AGENTS_PER_REQUEST)
+        for metric_group in metric_groups
     ]
+    print(f"Fetching metrics: {len(requests)} requests ({len(metric_groups)} metric groups) on {METRIC_WORKERS} workers")
+
+    with ThreadPoolExecutor(max_workers=METRIC_WORKERS) as pool:
+        results = list(pool.map(lambda params: get_all_metrics_paginated(client, **params), requests))
+    return merge_metric_results(results)
+
+def find_active_agents(client, base_params, agent_ids):
+    # One metric over the whole window (TOTAL interval): a single row per agent that was online
+    probe_params = {**base_params, 'Interval': {'TimeZone': TIMEZONE, 'IntervalPeriod': 'TOTAL'}}
+    results = fetch_metric_results(client, probe_params, agent_ids, [ACTIVITY_METRIC])
+    active = {entry['Dimensions']['AGENT'] for entry in results
+              if any(metric.get('Value') for metric in entry['Collections'])}
+    print(f" Active agents in the window: {len(active)} of {len(agent_ids)}")
+    return [agent_id for agent_id in agent_ids if agent_id in active]
 
+def merge_metric_results(results):
+    # Partial collections of the same agent and interval (one per metric group) become a single entry
+    merged = {}
+    for metric_results in results:
+        for entry in metric_results:
+            interval = entry.get('MetricInterval', {})
+            key = (entry['Dimensions']['AGENT'], interval.get('StartTime'), interval.get('EndTime'))
+            if key in merged:
+                merged[key]['Collections'].extend(entry['Collections'])
+            else:
+                merged[key] = {**entry, 'Collections': list(entry['Collections'])}
+    return list(merged.values())
+
+def parse_metric_rows(metric_results):
+    # Rows are filled by position (METRIC_COLUMNS order); metrics outside EXPECTED_METRICS are ignored
+    width = len(METRIC_COLUMNS)
+    metric_index = METRIC_INDEX
+    local_times = {}
     rows = []
     for entry in metric_results:
-        row = {
-            'agent_id': entry['Dimensions']['AGENT'],
-            'start_time': entry['MetricInterval']['StartTime'].astimezone(ny_tz).replace(tzinfo=None),
-            'end_time': entry['MetricInterval']['EndTime'].astimezone(ny_tz).replace(tzinfo=None),
-        }
-        for metric in expected_metrics:
-            row[metric.lower()] = None
+        row = [None] * width
+        row[0] = entry['Dimensions']['AGENT']
+        interval = entry['MetricInterval']
+        for position, key in ((1, 'StartTime'), (2, 'EndTime')):
+            # Every agent shares the same few intervals, so each one is converted once
+            moment = interval[key]
+            local = local_times.get(moment)
+            if local is None:
+                local = local_times[moment] = moment.astimezone(ny_tz).replace(tzinfo=None)
+            row[position] = local
 
         for metric in entry['Collections']:
-            name = metric['Metric']['Name'].lower()
-            value = metric.get('Value')
-            row[name] = round(value, 2) if value is not None else None
+            index = metric_index.get(metric['Metric']['Name'])
+            if index is not None:
+                value = metric.get('Value')
+                row[index] = round(value, 2) if value is not None else None
 
         rows.append(row)
     return rows
 
-def insert_json_rows_to_redshift(json_rows, redshift_config):
-    if not json_rows:
+def merge_metric_rows_to_redshift(rows, redshift_config, s3=None):
+    if not rows:
         print("No rows to insert.")
-        return
-    column_names = list(json_rows[0].keys())
-    values = [tuple(row.get(col) for col in column_names) for row in json_rows]
-
-    insert_query = f"""
-        INSERT INTO connect.f_agent_metrics (
-            {', '.join(column_names)}
-        ) VALUES %s
-    """
+        return True
 
     try:
         conn = psycopg2.connect(**redshift_config)
         with conn:
             with conn.cursor() as cur:
-                execute_values(cur, insert_query, values)
-                print(f"Inserted {len(values)} rows into Redshift.")
+                # Staged (COPY through S3 for large loads) and merged on (agent_id, start_time) in one transaction
+                merge_rows(cur, 'connect.f_agent_metrics', METRIC_COLUMNS, METRIC_KEY_COLUMNS, rows, s3=s3)
+        return True
     except Exception as e:
-        print(f"Redshift insert failed: {e}")
+        print(f"Redshift merge failed: {e}")
+        return False
     finally:
         if 'conn' in locals():
             conn.close()
 
 def lambda_handler(event, context):
-    start_time, end_time = get_time_range()
-    client = boto3.client("connect", region_name=REGION)
-    agent_ids = get_all_agent_ids(client,INSTANCE_ID)
-    all_metric_results = []
-
-    metric_names = [
-        'SUM_ONLINE_TIME_AGENT', 'SUM_NON_PRODUCTIVE_TIME_AGENT', 'AGENT_ADHERENT_TIME',
-        'AGENT_NON_ADHERENT_TIME', 'AGENT_ANSWER_RATE', 'AGENT_NON_RESPONSE',
-        'AGENT_NON_RESPONSE_WITHOUT_CUSTOMER_ABANDONS', 'AGENT_OCCUPANCY',
-        'AGENT_SCHEDULED_TIME', 'AGENT_SCHEDULE_ADHERENCE', 'AVG_DIALS_PER_MINUTE',
-        'SUM_IDLE_TIME_AGENT', 'SUM_ERROR_STATUS_TIME_AGENT', 'SUM_CONTACT_TIME_AGENT',
-        'SUM_CONNECTING_TIME_AGENT', 'SUM_RETRY_CALLBACK_ATTEMPTS',
-        'PERCENT_TALK_TIME_CUSTOMER', 'AVG_TALK_TIME_CUSTOMER', 'PERCENT_TALK_TIME_AGENT',
-        'AVG_TALK_TIME_AGENT', 'PERCENT_TALK_TIME', 'AVG_TALK_TIME', 'CONTACTS_QUEUED',
-        'CONTACTS_QUEUED_BY_ENQUEUE', 'MAX_QUEUED_TIME', 'CONTACTS_TRANSFERRED_OUT_FROM_QUEUE',
-        'AVG_QUEUE_ANSWER_TIME', 'CONTACTS_CREATED', 'SUM_CONTACTS_DISCONNECTED',
-        'AVG_ACTIVE_TIME', 'ABANDONMENT_RATE', 'AVG_NON_TALK_TIME',
-        'AVG_INTERRUPTION_TIME_AGENT', 'DELIVERY_ATTEMPTS', 'CONTACTS_TRANSFERRED_OUT',
-        'CONTACTS_TRANSFERRED_OUT_INTERNAL', 'CONTACTS_TRANSFERRED_OUT_EXTERNAL',
-        'CONTACTS_PUT_ON_HOLD', 'AVG_HOLDS', 'SUM_HOLD_TIME', 'CONTACTS_HOLD_ABANDONS',
-        'CONTACTS_ON_HOLD_AGENT_DISCONNECT', 'CONTACTS_ON_HOLD_CUSTOMER_DISCONNECT',
-        'CONTACTS_HANDLED', 'AVG_HANDLE_TIME', 'SUM_HANDLE_TIME', 'AVG_INTERACTION_TIME',
-        'SUM_INTERACTION_TIME', 'AVG_CONTACT_DURATION', 'SUM_INTERACTION_AND_HOLD_TIME',
-        'AVG_AFTER_CONTACT_WORK_TIME', 'SUM_AFTER_CONTACT_WORK_TIME'
-    ]
+    event = event or {}
+    incremental = event.get('mode', METRICS_MODE) == 'incremental'
+    if incremental:
+        watermark_table = boto3.resource('dynamodb').Table(WATERMARK_TABLE)
+        watermark = get_watermark(watermark_table)
+        windows = get_incremental_windows(watermark, datetime.now(pytz.utc))
+        if not windows:
+            print(f"No closed intervals since the watermark {watermark}")
+            return {'status': 'ok', 'rows': 0}
+        print(f"Incremental load from {windows[0][0].isoformat()} to {windows[-1][1].isoformat()} "
+              f"(watermark {watermark.isoformat() if watermark else None})")
+    else:
+        days = get_requested_days(event)
+        windows = [get_day_range(day) for day in days]
+        print(f"Loading agent metrics for {days[0]} to {days[-1]} ({len(days)} days)")
+    client = ConnectClient(boto3.client("connect", region_name=REGION, config=connect_client_config(METRIC_WORKERS)))
+    s3 = boto3.client("s3")
+    agent_ids = get_agent_ids(client, s3)
+
+    params = {
+        'ResourceArn': f"arn:aws:connect:{REGION}:555988031712:instance/{INSTANCE_ID}",
+        'StartTime': windows[0][0],
+        'EndTime': windows[-1][1],
+        'Interval': {'TimeZone': TIMEZONE, 'IntervalPeriod': 'HOUR'},
+        'Groupings': ['AGENT'],
+        'MaxResults': 100
+    }
+
+    if ACTIVE_AGENTS_ONLY:
+        agent_ids = find_active_agents(client, params, agent_ids)
+
+    all_metric_results = fetch_metric_results(client, params, agent_ids, METRIC_NAMES, windows)
+
+    # Every requested day goes into a single merge
+    rows = parse_metric_rows(all_metric_results)
+    merged = merge_metric_rows_to_redshift(rows, REDSHIFT_CONFIG, s3=s3)
+    client.report_counters()
+
+    # Re-fetched intervals are replaced by the merge, so the watermark only has to follow the last closed hour
+    if incremental and merged:
+        advance_watermark(watermark_table, windows[-1][1])
 
-    for agent_chunk in chunk_list(agent_ids, 100):
-        params = {
-            'ResourceArn': f"arn:aws:connect:{REGION}:555988031712:instance/{INSTANCE_ID}",
-            'StartTime': start_time,
-            'EndTime': end_time,
-            'Interval': {'TimeZone': TIMEZONE, 'IntervalPeriod': 'HOUR'},
-            'Filters': [{'FilterKey': 'AGENT', 'FilterValues': agent_chunk}],
-            'Groupings': ['AGENT'],
-            'Metrics': [{'Name': name} for name in metric_names],
-            'MaxResults': 100
-        }
-
-        results = get_all_metrics_paginated(client, **params)
-        all_metric_results.extend(results)
-
-    json_rows = parse_metrics_to_json(all_metric_results)
-    insert_json_rows_to_redshift(json_rows, REDSHIFT_CONFIG)
+    return {
+        'status': 'ok' if merged else 'error',
+        'start': windows[0][0].isoformat(),
+        'end': windows[-1][1].isoformat(),
+        'rows': len(rows)
+    }
@@ -0,0 +1,174 @@
+import json
+import os
+import random
+import threading
+import time
+from functools import partial
+
+from botocore.config import Config
+
+# Shared helpers for the Amazon Connect Lambdas (deployed with each one as a layer)
+
+# Requests per second allowed per Connect API. Defaults stay under the account's standard
+# quotas; CONNECT_API_RATES='{"describe_contact": 8}' overrides them without a deploy.
+DEFAULT_API_RATES = {
+    'describe_contact': 5.0,
+    'describe_user': 2.0,
+    'get_metric_data_v2': 5.0,
+    'list_queues': 2.0,
+    'list_users': 2.0,
+    'search_contacts': 5.0,
+    'search_users': 2.0,
+}
+FALLBACK_API_RATE = 2.0
+
+# Retries after a throttle or a transient service error, with exponential backoff and full jitter
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 10.0
+
+THROTTLE_ERRORS = {'TooManyRequestsException', 'ThrottlingException', 'LimitExceededException'}
+TRANSIENT_ERRORS = {'InternalServiceException', 'ServiceUnavailableException'}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by the worker threads calling one Connect API.
+
+    `acquire` blocks until a token is available. A throttle halves the rate and
+    empties the bucket; every success then raises the rate by `ramp` requests
+    per second (default 2% of `max_rate`), up to `max_rate`, so the limiter settles just under the quota.
+    Throttles reported within `cooldown` seconds of a cut (workers that were
+    in flight together) only cut the rate once.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, max_rate=None, ramp=None, cooldown=1.0):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.min_rate = min_rate
+        self.max_rate = float(max_rate or rate)
+        self.ramp = ramp or self.max_rate * 0.02
+        self.cooldown = cooldown
+        self.last_cut = None
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self._refill()
+            self.tokens = 0.0
+            if self.last_cut is None or self.updated - self.last_cut >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.last_cut = self.updated
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.ramp)
+
+
+def connect_client_config(workers=0):
+    """
+    botocore config for the clients wrapped by ConnectClient. botocore does not
+    retry, so ConnectClient is the only retry layer: attempts do not multiply,
+    the counters see every one and each throttle reaches the rate limiter. The
+    connection pool fits `workers` threads calling the client at once.
+    """
+    return Config(retries={'total_max_attempts': 1}, max_pool_connections=max(10, workers))
+
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    # Full jitter: concurrent workers that were throttled together retry spread out
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ConnectClient:
+    """
+    Wrapper around a boto3 Connect client used by every Connect Lambda.
+
+    Each API gets its own AdaptiveRateLimiter (budget from DEFAULT_API_RATES,
+    CONNECT_API_RATES and `rates`). Throttles and transient errors are retried
+    up to `max_retries` times with jittered exponential backoff; any other
+    error is raised at once. Calls, throttles, retries and errors are counted
+    per API so each invocation can report them. API methods are reachable as
+    attributes (`connect.list_users(...)`), like on the boto3 client.
+    """
+
+    def __init__(self, client, rates=None, max_retries=DEFAULT_MAX_RETRIES):
+        self.client = client
+        self.exceptions = client.exceptions
+        self.rates = {**DEFAULT_API_RATES, **json.loads(os.getenv('CONNECT_API_RATES', '{}')), **(rates or {})}
+        self.max_retries = max_retries
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.reset_counters()
+
+    def limiter(self, api):
+        with self.lock:
+            if api not in self.limiters:
+                self.limiters[api] = AdaptiveRateLimiter(self.rates.get(api, FALLBACK_API_RATE))
+            return self.limiters[api]
+
+    def reset_counters(self):
+        with self.lock:
+            self.counters = {}
+
+    def _count(self, api, counter):
+        with self.lock:
+            counts = self.counters.setdefault(api, {'calls': 0, 'throttles': 0, 'retries': 0, 'errors': 0})
+            counts[counter] += 1
+
+    def call(self, api, **params):
+        limiter = self.limiter(api)
+        method = getattr(self.client, api)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            self._count(api, 'calls')
+            try:
+                response = method(**params)
+            except Exception as e:
+                code = _error_code(e)
+                if code not in THROTTLE_ERRORS and code not in TRANSIENT_ERRORS:
+                    self._count(api, 'errors')
+                    raise
+                if code in THROTTLE_ERRORS:
+                    self._count(api, 'throttles')
+                    limiter.throttled()
+                if attempt == self.max_retries:
+                    self._count(api, 'errors')
+                    raise
+                self._count(api, 'retries')
+                time.sleep(backoff_delay(attempt))
+                continue
+            limiter.succeeded()
+            return response
+
+    def report_counters(self):
+        for api, counts in sorted(self.counters.items()):
+            print(f"Connect {api}: {counts['calls']} calls, {counts['throttles']} throttles, "
+                  f"{counts['retries']} retries, {counts['errors']} errors (rate {self.limiters[api].rate:.2f}/s)")
+        return self.counters
+
+    def __getattr__(self, api):
+        if api.startswith('_'):
+            raise AttributeError(api)
+        return partial(self.call, api)
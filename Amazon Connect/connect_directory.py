@@ -0,0 +1,79 @@
+import json
+import os
+import time
+
+# Snapshot of the Connect user directory, kept in S3 between runs (shared by the user upsert and agent metrics).
+# Each user is stored with the LastModifiedTime of its list_users summary, so only users whose summary
+# changed since the last run need a describe_user. Every listed user is kept, also those stored without
+# summary_modified (always treated as changed). Without DIRECTORY_BUCKET the snapshot is disabled.
+
+DIRECTORY_BUCKET = os.getenv('DIRECTORY_BUCKET')
+DIRECTORY_KEY = os.getenv('DIRECTORY_KEY', 'connect/user_directory.json')
+
+# Age after which agent metrics stops trusting the snapshot and lists the users itself
+DIRECTORY_MAX_AGE_HOURS = float(os.getenv('DIRECTORY_MAX_AGE_HOURS', '26'))
+
+
+def load_directory(s3, bucket=None, key=DIRECTORY_KEY):
+    """Return the saved snapshot ({'saved_at': epoch, 'users': {user_id: user}}), or None if there is none yet."""
+    bucket = bucket or DIRECTORY_BUCKET
+    if not bucket:
+        return None
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        print(f"No user directory snapshot at s3://{bucket}/{key}")
+        return None
+    directory = json.loads(body)
+    print(f"User directory snapshot: {len(directory['users'])} users, {directory_age_hours(directory):.1f}h old")
+    return directory
+
+
+def save_directory(s3, users, bucket=None, key=DIRECTORY_KEY):
+    bucket = bucket or DIRECTORY_BUCKET
+    if not bucket:
+        return
+    body = json.dumps({'saved_at': time.time(), 'users': users}, default=str)
+    s3.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/json')
+    print(f"User directory snapshot saved: {len(users)} users")
+
+
+def directory_age_hours(directory):
+    return (time.time() - directory['saved_at']) / 3600
+
+
+def summary_modified(summary):
+    # None when list_users gives no LastModifiedTime: the user then always counts as changed
+    modified = summary.get('LastModifiedTime')
+    return modified.isoformat() if modified is not None else None
+
+
+def list_user_summaries(connect, instance_id):
+    summaries = []
+    params = {'InstanceId': instance_id}
+    while True:
+        response = connect.list_users(**params)
+        summaries.extend(response['UserSummaryList'])
+        params['NextToken'] = response.get('NextToken')
+        if not params['NextToken']:
+            break
+    return summaries
+
+
+def split_changed_users(summaries, known_users):
+    """
+    Compare the current list_users summaries with the snapshot users. Returns
+    the summaries of new or modified users, the snapshot entries still valid,
+    and the ids no longer listed.
+    """
+    changed = []
+    unchanged = {}
+    for summary in summaries:
+        known = known_users.get(summary['Id'])
+        modified = summary_modified(summary)
+        if known is not None and modified is not None and known.get('summary_modified') == modified:
+            unchanged[summary['Id']] = known
+        else:
+            changed.append(summary)
+    removed = set(known_users) - {summary['Id'] for summary in summaries}
+    return changed, unchanged, removed
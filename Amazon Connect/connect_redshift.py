@@ -0,0 +1,119 @@
+import csv
+import gzip
+import io
+import os
+import uuid
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+# Shared Redshift loading for the Connect Lambdas: small row sets go in with multi-row INSERTs,
+# large ones are staged in S3 as gzipped CSV and loaded with a single COPY.
+
+S3_TARGET_BUCKET = os.getenv('S3_TARGET_BUCKET')
+IAM_ROLE_ARN = os.getenv('IAM_ROLE_ARN')
+STAGING_PREFIX = os.getenv('STAGING_PREFIX', 'connect/staging/')
+
+# Rows from which COPY is used (when S3_TARGET_BUCKET and IAM_ROLE_ARN are set), and rows per INSERT statement below it
+BULK_LOAD_MIN_ROWS = int(os.getenv('BULK_LOAD_MIN_ROWS', '5000'))
+INSERT_PAGE_SIZE = int(os.getenv('INSERT_PAGE_SIZE', '1000'))
+
+
+def encode_csv_gzip(rows):
+    # None is written as an empty unquoted field, which COPY ... EMPTYASNULL loads as NULL for every type.
+    # Level 1: close to the ratio of level 6 on these files at several times the speed
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=1) as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        csv.writer(text).writerows(rows)
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+def new_staging_key(name, prefix=STAGING_PREFIX):
+    return f"{prefix}{name}/{datetime.utcnow():%Y/%m/%d}/{uuid.uuid4().hex}.csv.gz"
+
+
+def build_copy_sql(table, columns, s3_path, iam_role=IAM_ROLE_ARN):
+    return '\n'.join([
+        f"COPY {table} ({', '.join(columns)})",
+        f"FROM '{s3_path}'",
+        f"IAM_ROLE '{iam_role}'",
+        "FORMAT AS CSV",
+        "GZIP",
+        "EMPTYASNULL",
+        "TIMEFORMAT 'auto'",
+    ]) + ';'
+
+
+def copy_rows(cur, s3, table, columns, rows, bucket=None, iam_role=None):
+    """Stage the rows in S3 as one gzipped CSV and COPY them into `table` on the given cursor."""
+    bucket = bucket or S3_TARGET_BUCKET
+    key = new_staging_key(table.replace('.', '_'))
+    body = encode_csv_gzip(rows)
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+    cur.execute(build_copy_sql(table, columns, f"s3://{bucket}/{key}", iam_role or IAM_ROLE_ARN))
+    print(f"COPY {len(rows)} rows into {table} from s3://{bucket}/{key} ({len(body) / 1024:.0f} KB)")
+
+
+def insert_rows(cur, table, columns, rows, page_size=INSERT_PAGE_SIZE):
+    execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows, page_size=page_size)
+    print(f"Inserted {len(rows)} rows into {table}.")
+
+
+def load_rows(cur, table, columns, rows, s3=None):
+    """Load positional rows into `table`: COPY through S3 for large sets when staging is configured, INSERT otherwise."""
+    if s3 is not None and S3_TARGET_BUCKET and IAM_ROLE_ARN and len(rows) >= BULK_LOAD_MIN_ROWS:
+        copy_rows(cur, s3, table, columns, rows)
+    else:
+        insert_rows(cur, table, columns, rows)
+
+
+
+def stage_rows(cur, table, columns, key_columns, rows, s3=None):
+    # Temp staging table LIKE the target, loaded with the last row of each key; returns its name and row count
+    key_positions = [columns.index(column) for column in key_columns]
+    unique_rows = list({tuple(row[position] for position in key_positions): row for row in rows}.values())
+    stage = f"{table.split('.')[-1]}_stage"
+    cur.execute(f"CREATE TEMP TABLE {stage} (LIKE {table});")
+    load_rows(cur, stage, columns, unique_rows, s3=s3)
+    return stage, len(unique_rows)
+
+
+def merge_rows(cur, table, columns, key_columns, rows, s3=None):
+    """
+    Replace the rows of `table` that share a key with `rows`, in one set-based merge: the rows are
+    loaded into a temp staging table (LIKE the target), the matching target rows deleted, and the
+    staging rows inserted. Re-running a load replaces its rows instead of duplicating them. Within
+    `rows` the last row of each key wins. Runs in the caller's transaction.
+    """
+    stage, staged = stage_rows(cur, table, columns, key_columns, rows, s3=s3)
+    column_list = ', '.join(columns)
+    key_match = ' AND '.join(f"{table}.{column} = {stage}.{column}" for column in key_columns)
+
+    cur.execute(f"DELETE FROM {table} USING {stage} WHERE {key_match};")
+    replaced = cur.rowcount
+    cur.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage};")
+    cur.execute(f"DROP TABLE {stage};")
+    print(f"Merged {staged} rows into {table} ({replaced} replaced)")
+
+
+def upsert_rows(cur, table, columns, key_columns, update_columns, rows, s3=None):
+    """
+    Set-based upsert for dimension tables: existing keys get only `update_columns` updated (other
+    columns of the target keep their values), new keys are inserted. Statements do not grow with
+    the row count. Runs in the caller's transaction.
+    """
+    stage, staged = stage_rows(cur, table, columns, key_columns, rows, s3=s3)
+    column_list = ', '.join(columns)
+    key_match = ' AND '.join(f"{table}.{column} = {stage}.{column}" for column in key_columns)
+
+    cur.execute(f"UPDATE {table} SET {', '.join(f'{column} = {stage}.{column}' for column in update_columns)} "
+                f"FROM {stage} WHERE {key_match};")
+    updated = cur.rowcount
+    cur.execute(f"INSERT INTO {table} ({column_list}) SELECT {', '.join(f'{stage}.{column}' for column in columns)} "
+                f"FROM {stage} LEFT JOIN {table} ON {key_match} WHERE {table}.{key_columns[0]} IS NULL;")
+    inserted = cur.rowcount
+    cur.execute(f"DROP TABLE {stage};")
+    print(f"Upserted {staged} rows into {table} ({updated} updated, {inserted} inserted)")
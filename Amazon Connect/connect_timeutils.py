@@ -0,0 +1,84 @@
+import datetime
+
+import pytz
+
+# Shared timestamp conversion for the Connect loaders: UTC timestamps (ISO-8601 strings from CTRs
+# or datetimes from boto3) to local 'YYYY-MM-DD HH:MM:SS' strings, as loaded into Redshift.
+
+LOCAL_TIMEZONE = 'America/New_York'
+
+# Distinct UTC hours kept per formatter before the cache is reset
+MAX_CACHED_HOURS = 50000
+
+
+class LocalTimeFormatter:
+    """
+    Format UTC timestamps as local time without a tz lookup per value.
+
+    The local 'YYYY-MM-DD HH' prefix of every UTC hour is computed once (one
+    pytz conversion per hour bucket, so DST transitions stay exact) and cached.
+    When the zone's offset is a whole number of hours, minutes and seconds are
+    the same in UTC and local time and are copied straight from the input.
+    Fractional seconds are accepted and dropped. Unparseable values give None.
+    """
+
+    def __init__(self, timezone=LOCAL_TIMEZONE):
+        self.tz = pytz.timezone(timezone)
+        self.hours = {}
+
+    def _hour_prefix(self, year, month, day, hour):
+        key = (year, month, day, hour)
+        prefix = self.hours.get(key)
+        if prefix is None:
+            local = datetime.datetime(year, month, day, hour, tzinfo=pytz.utc).astimezone(self.tz)
+            # False marks zones with a non whole-hour offset: those take the slow path
+            prefix = (f'{local.year:04d}-{local.month:02d}-{local.day:02d} {local.hour:02d}'
+                      if local.utcoffset().total_seconds() % 3600 == 0 else False)
+            if len(self.hours) >= MAX_CACHED_HOURS:
+                self.hours.clear()
+            self.hours[key] = prefix
+        return prefix
+
+    def _format_datetime(self, value):
+        # boto3 datetimes are UTC; naive values are taken as UTC as well
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc)
+        prefix = self._hour_prefix(value.year, value.month, value.day, value.hour)
+        if prefix:
+            return f'{prefix}:{value.minute:02d}:{value.second:02d}'
+        local = value.replace(tzinfo=pytz.utc).astimezone(self.tz)
+        return f'{local.year:04d}-{local.month:02d}-{local.day:02d} {local.hour:02d}:{local.minute:02d}:{local.second:02d}'
+
+    def format(self, value):
+        if not value:
+            return None
+        if isinstance(value, datetime.datetime):
+            return self._format_datetime(value)
+        if not isinstance(value, str):
+            return None
+
+        # Fast path: 'YYYY-MM-DDTHH:MM:SSZ' or 'YYYY-MM-DDTHH:MM:SS.fffZ'
+        if (len(value) >= 20 and value[10] == 'T' and value[13] == ':' and value[16] == ':'
+                and value[-1] == 'Z' and (len(value) == 20 or value[19] == '.')):
+            minute, second = value[14:16], value[17:19]
+            if minute.isdigit() and second.isdigit() and minute < '60' and second < '60':
+                try:
+                    prefix = self._hour_prefix(int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]))
+                except ValueError:
+                    return None
+                if prefix:
+                    return f'{prefix}:{minute}:{second}'
+
+        # Any other ISO-8601 form (offsets, no 'Z', odd fractions) in a single parse
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+        return self._format_datetime(parsed)
+
+
+local_time = LocalTimeFormatter()
+
+
+def to_local_string(value):
+    return local_time.format(value)
@@ -0,0 +1,231 @@
+"""
+extract_calls of the CTR Lambda (lambda_boto3_connect_redshift.py) against
+in-memory Connect and Redshift fakes: a run that is interrupted (failed flush,
+Lambda deadline) and then resumed from its pending slices must load every
+completed contact exactly once.
+
+    python -m pytest "Amazon Connect/tests"
+"""
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'Amazon Connect CTR with boto3'))
+
+WINDOW_START = datetime.datetime(2025, 6, 1, 12, tzinfo=datetime.timezone.utc)
+
+
+class FakeConnect:
+    """
+    search_contacts pages by offset (NextToken is the index of the next contact);
+    describe_contact echoes the id after `describe_seconds`, so pages reach the
+    buffer over several flush checks.
+    """
+
+    exceptions = types.SimpleNamespace()
+
+    def __init__(self, contacts=600, seconds_apart=6, describe_seconds=0.0):
+        self.describe_seconds = describe_seconds
+        self.contacts = [{
+            'Id': f'contact-{index:04d}',
+            'InitiationTimestamp': WINDOW_START + datetime.timedelta(seconds=seconds_apart * index),
+            'DisconnectTimestamp': WINDOW_START + datetime.timedelta(seconds=seconds_apart * index + 60),
+            'AgentInfo': {'Id': 'agent'},
+        } for index in range(contacts)]
+
+    def search_contacts(self, **params):
+        time_range = params['TimeRange']
+        matching = [contact for contact in self.contacts
+                    if time_range['StartTime'] <= contact['InitiationTimestamp'] < time_range['EndTime']]
+        start = int(params.get('NextToken') or 0)
+        response = {'Contacts': matching[start:start + params['MaxResults']]}
+        if start + params['MaxResults'] < len(matching):
+            response['NextToken'] = str(start + params['MaxResults'])
+        return response
+
+    def describe_contact(self, InstanceId, ContactId):
+        time.sleep(self.describe_seconds)
+        return {'Contact': {'Id': ContactId}}
+
+
+class FakeRedshift:
+    """insert_into_redshift stand-in: the inserts listed in `failing` (1-based) fail, the others are kept."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.inserts = 0
+        self.contact_ids = []
+        self.lock = threading.Lock()
+
+    def insert(self, rows):
+        with self.lock:
+            self.inserts += 1
+            if self.inserts in self.failing:
+                return False
+            self.contact_ids += [row[2] for row in rows]
+            return True
+
+
+class FakeUnitsTable:
+    """ConnectBackfillUnits stand-in: put_item on the table, batch_get_item on the resource."""
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, Item):
+        self.items[Item['unit_id']] = Item
+
+    def batch_get_item(self, RequestItems):
+        responses = {name: [self.items[key['unit_id']] for key in request['Keys'] if key['unit_id'] in self.items]
+                     for name, request in RequestItems.items()}
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+
+def import_ctr_lambda():
+    # The Lambda builds its AWS clients at import time: boto3, botocore and psycopg2 are replaced for the import
+    boto3 = types.ModuleType('boto3')
+    boto3.client = lambda *args, **kwargs: FakeConnect(contacts=0)
+    boto3.resource = lambda *args, **kwargs: mock.MagicMock()
+    psycopg2 = types.ModuleType('psycopg2')
+    extras = types.ModuleType('psycopg2.extras')
+    extras.execute_values = None
+    psycopg2.extras = extras
+    botocore = types.ModuleType('botocore')
+    botocore_config = types.ModuleType('botocore.config')
+    botocore_config.Config = dict
+    botocore.config = botocore_config
+    modules = {'boto3': boto3, 'botocore': botocore, 'botocore.config': botocore_config,
+               'psycopg2': psycopg2, 'psycopg2.extras': extras}
+    with mock.patch.dict(sys.modules, modules), mock.patch.dict(os.environ, {'REDSHIFT_CONFIG': '{}'}):
+        sys.modules.pop('lambda_boto3_connect_redshift', None)
+        import lambda_boto3_connect_redshift
+    return lambda_boto3_connect_redshift
+
+
+class ExtractCallsResumeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ctr = import_ctr_lambda()
+
+    def run_extract(self, connect, redshift, slices, context=None, **settings):
+        client = self.ctr.ConnectClient(connect, rates={'describe_contact': 10000, 'search_contacts': 10000})
+        with mock.patch.multiple(self.ctr, client=client, insert_into_redshift=redshift.insert, **settings):
+            return self.ctr.extract_calls(slices, context)
+
+    def window_slices(self, minutes):
+        with mock.patch.object(self.ctr, 'SEARCH_SLICE_MINUTES', minutes):
+            return self.ctr.new_slices(WINDOW_START, WINDOW_START + datetime.timedelta(hours=1))
+
+    def assert_tokens_not_past_unloaded(self, connect, redshift, pending):
+        # Every contact before a pending slice's position must already be in Redshift
+        loaded = set(redshift.contact_ids)
+        for slice_progress in pending:
+            response = connect.search_contacts(TimeRange={
+                'StartTime': datetime.datetime.fromisoformat(slice_progress['start']),
+                'EndTime': datetime.datetime.fromisoformat(slice_progress['end'])
+            }, MaxResults=len(connect.contacts))
+            position = int(slice_progress['next_token'] or 0) + slice_progress.get('offset', 0)
+            skipped = [contact['Id'] for contact in response['Contacts'][:position]]
+            self.assertTrue(loaded.issuperset(skipped), f"{slice_progress} is past contacts not loaded")
+
+    def assert_loaded_once(self, connect, redshift):
+        self.assertEqual(sorted(redshift.contact_ids), [contact['Id'] for contact in connect.contacts])
+
+    def test_failed_flush_is_reloaded_on_resume(self):
+        # The first insert fails while both slices keep buffering pages
+        connect = FakeConnect(describe_seconds=0.01)
+        redshift = FakeRedshift(failing={1})
+        settings = {'FLUSH_ROWS': 150, 'SEARCH_WORKERS': 2, 'DESCRIBE_WORKERS': 2}
+
+        loaded, pending = self.run_extract(connect, redshift, self.window_slices(30), **settings)
+        self.assertEqual(loaded, 0)
+        self.assertEqual(redshift.inserts, 1)
+        self.assertEqual(len(pending), 2)
+        self.assert_tokens_not_past_unloaded(connect, redshift, pending)
+
+        resumed, pending = self.run_extract(connect, redshift, pending, **settings)
+        self.assertEqual(pending, [])
+        self.assertEqual(resumed, len(connect.contacts))
+        self.assert_loaded_once(connect, redshift)
+
+    def test_failed_flush_keeps_earlier_flushed_pages(self):
+        connect = FakeConnect(describe_seconds=0.01)
+        redshift = FakeRedshift(failing={2})
+        settings = {'FLUSH_ROWS': 150, 'SEARCH_WORKERS': 1, 'DESCRIBE_WORKERS': 2}
+
+        loaded, pending = self.run_extract(connect, redshift, self.window_slices(60), **settings)
+        self.assertGreater(loaded, 0)
+        self.assertEqual(len(pending), 1)
+        self.assert_tokens_not_past_unloaded(connect, redshift, pending)
+
+        _, pending = self.run_extract(connect, redshift, pending, **settings)
+        self.assertEqual(pending, [])
+        self.assert_loaded_once(connect, redshift)
+
+    def test_deadline_stops_inside_a_page(self):
+        # A page takes 2 s to describe and the deadline is reached at the first check (after 1 s)
+        connect = FakeConnect(describe_seconds=0.02)
+        redshift = FakeRedshift()
+        context = mock.Mock(get_remaining_time_in_millis=mock.Mock(return_value=0))
+        settings = {'FLUSH_ROWS': 1000, 'SEARCH_WORKERS': 1, 'DESCRIBE_WORKERS': 1, 'DESCRIBE_BATCH': 20}
+
+        started = time.perf_counter()
+        loaded, pending = self.run_extract(connect, redshift, self.window_slices(60), context, **settings)
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(len(pending), 1)
+        self.assertIsNone(pending[0]['next_token'])
+        self.assertEqual(pending[0]['offset'], loaded)
+        self.assertGreater(loaded, 0)
+        self.assert_tokens_not_past_unloaded(connect, redshift, pending)
+
+        _, pending = self.run_extract(connect, redshift, pending, **{**settings, 'DESCRIBE_WORKERS': 8})
+        self.assertEqual(pending, [])
+        self.assert_loaded_once(connect, redshift)
+
+
+    def test_trailing_second_extends_the_last_slice(self):
+        unit = self.ctr.plan_backfill_units(datetime.datetime(2025, 6, 1, 10), datetime.datetime(2025, 6, 1, 12),
+                                            self.ctr.NY_TZ)[0]
+        with mock.patch.object(self.ctr, 'SEARCH_SLICE_MINUTES', 10):
+            slices = self.ctr.new_slices(unit['start'], unit['end'], unit['unit'])
+        self.assertEqual(len(slices), 12)
+        self.assertEqual(slices[-1]['end'], unit['end'].isoformat())
+
+    def test_backfill_continuation_stays_small(self):
+        # Two weeks of contacts, about one every 20 minutes, none on the 1-second overlap between units;
+        # the first run stops at its first deadline check
+        connect = FakeConnect(contacts=1008, seconds_apart=1201, describe_seconds=0.01)
+        redshift = FakeRedshift()
+        units = FakeUnitsTable()
+        backfill = {'start': WINDOW_START.isoformat(), 'end': (WINDOW_START + datetime.timedelta(days=14)).isoformat()}
+        context = mock.Mock(get_remaining_time_in_millis=mock.Mock(return_value=0))
+        client = self.ctr.ConnectClient(connect, rates={'describe_contact': 10000, 'search_contacts': 10000})
+
+        with mock.patch.multiple(self.ctr, client=client, insert_into_redshift=redshift.insert, dynamodb=units,
+                                 backfill_table=units, DESCRIBE_WORKERS=2):
+            response = self.ctr.lambda_handler({'backfill': backfill}, context)
+            self.assertFalse(response['complete'])
+            continuation = response['continuation']
+            self.assertEqual(continuation['backfill'], backfill)
+            self.assertLess(len(json.dumps(continuation)), 16 * 1024)
+            self.assertLess(len(continuation['slices']), 100)
+
+            with mock.patch.object(self.ctr, 'DESCRIBE_WORKERS', 8):
+                response = self.ctr.lambda_handler({'continuation': continuation}, None)
+
+        self.assertTrue(response['complete'])
+        self.assert_loaded_once(connect, redshift)
+        self.assertEqual(len(units.items), 14 * 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import boto3
+import pandas as pd
+from datetime import datetime
+from functools import partial
+import pytz
+import time
+import json
+import os
+import psycopg2
+from litify_checkpoint import (
+    CHECKPOINT_TABLE,
+    advance_watermark,
+    get_processed_folder_keys,
+    get_watermark,
+    start_after_folder,
+)
+from litify_coercion import apply_coercion_plan, read_csv_options
+from litify_objects import LITIFY_OBJECTS
+from litify_pipeline import new_stage_stats, prefetch_csvs, report_stage_stats, timed_stage
+from litify_staging import (
+    DEFAULT_CHUNK_ROWS,
+    STAGING_FORMATS,
+    build_copy_sql,
+    csv_header,
+    encode_frames,
+    list_csv_keys,
+    load_folders_coalesced,
+    new_staging_key,
+    stream_csv_to_s3,
+)
+
+# Configuration
+REDSHIFT_CONFIG = json.loads(os.environ["REDSHIFT_CONFIG"])
+IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
+
+S3_TARGET_BUCKET = os.getenv("S3_TARGET_BUCKET")
+
+# Rows per CSV chunk when streaming; 0 loads the whole CSV at once
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+
+# Coalesce all pending folders into a single COPY and merge per object (can be overridden per event)
+COALESCE_FOLDERS = os.getenv("COALESCE_FOLDERS", "false").lower() == "true"
+
+# Staging file format: json, json_gzip, json_zstd, csv_gzip or parquet
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "json")
+STAGING_EXTENSION = STAGING_FORMATS[STAGING_FORMAT]['extension']
+
+# Objects to load, comma separated (default: every object in the registry); the event key 'objects' overrides it
+LOADER_OBJECTS = [name.strip() for name in os.getenv("LOADER_OBJECTS", "").split(',') if name.strip()]
+
+# AWS clients, shared by every object
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+checkpoints = dynamodb.Table(os.getenv("CHECKPOINT_TABLE", CHECKPOINT_TABLE))
+
+bucket_name = 'sfdatabackup-gfproduction'
+prefix_base = 'backup/'
+
+# Helper function to get the local time in ISO format
+def get_local_time_iso():
+    ny_tz = pytz.timezone('America/New_York')
+    return datetime.now(ny_tz).isoformat()
+
+# Function to pick the registry entries to load
+def select_objects(names=None):
+    if not names:
+        return LITIFY_OBJECTS
+    unknown = set(names) - {spec['name'] for spec in LITIFY_OBJECTS}
+    if unknown:
+        raise ValueError(f"Objetos desconocidos: {sorted(unknown)}")
+    return [spec for spec in LITIFY_OBJECTS if spec['name'] in names]
+
+# Function to upload dataframe to S3
+def upload_df_to_s3(df, s3_bucket, s3_key):
+    body = b''.join(encode_frames([df], STAGING_FORMAT))
+    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=body)
+
+# Function to copy staged data into the object's staging table and run its merge, over the shared connection
+def copy_to_redshift_and_update(conn, spec, s3_temp_key, manifest=False, columns=None):
+    S3_TEMP_PATH = f's3://{S3_TARGET_BUCKET}/{s3_temp_key}'
+    copy_sql = build_copy_sql(spec['staging_table'], S3_TEMP_PATH, IAM_ROLE_ARN, STAGING_FORMAT, columns, manifest)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(copy_sql)
+            print(f"COPY completado: {spec['staging_table']}")
+            cur.execute(f"CALL {spec['procedure']}();")
+            print(f"Procedure ejecutada: {spec['procedure']}")
+        conn.commit()
+    except Exception:
+        # Leave the shared connection usable for the next CSV or object
+        conn.rollback()
+        raise
+
+# Function to extract folder key from folder name
+def extract_folder_key(folder_name: str) -> str:
+    return folder_name.split('/')[-2].split('_Differential')[0] + "_"
+
+# Function to mark folder as processed for an object in DynamoDB
+def mark_key_as_processed(spec, folder_key):
+    dynamodb.Table(spec['processed_table']).put_item(Item={
+        'folder_key': folder_key,
+        'processed_at': get_local_time_iso()
+    })
+
+# Function to list differential folders in S3
+def list_differential_folders(bucket, base_prefix, start_after=None):
+    paginator = s3.get_paginator('list_objects_v2')
+    params = {'Bucket': bucket, 'Prefix': base_prefix, 'Delimiter': '/'}
+    if start_after:
+        params['StartAfter'] = start_after
+    result = paginator.paginate(**params)
+    folders = []
+    for page in result:
+        folders += [cp['Prefix'] for cp in page.get('CommonPrefixes', [])]
+    return folders
+
+# Function to process the CSVs of one object in a differential folder
+def process_object_csvs(conn, spec, bucket, differential_folder, stats):
+    csv_keys = list_csv_keys(s3, bucket, differential_folder + spec['subfolder'])
+
+    # If no files found, return False to indicate this folder is empty for the object
+    if not csv_keys:
+        print(f"No se encontró carpeta '{spec['subfolder']}' con CSVs en {differential_folder}")
+        return False
+
+    transform = partial(apply_coercion_plan, plan=spec['plan'])
+
+    # The next CSV downloads while the current one is transformed; COPY and merge stay in CSV order
+    for key, path in prefetch_csvs(s3, bucket, csv_keys, stats):
+        print(f"Procesando CSV: {key}")
+        s3_temp_key = new_staging_key(spec['name'], suffix=STAGING_EXTENSION)
+        read_options = read_csv_options(spec['plan'], csv_header(path))
+
+        try:
+            if CSV_CHUNK_ROWS:
+                with open(path, 'rb') as body:
+                    rows, columns = stream_csv_to_s3(s3, body, transform, S3_TARGET_BUCKET, s3_temp_key, CSV_CHUNK_ROWS,
+                                                     STAGING_FORMAT, stats=stats, read_options=read_options)
+            else:
+                df = transform(pd.read_csv(path, **read_options))
+                upload_df_to_s3(df, S3_TARGET_BUCKET, s3_temp_key)
+                rows, columns = len(df), list(df.columns)
+            if rows:
+                with timed_stage(stats, 'copy'):
+                    copy_to_redshift_and_update(conn, spec, s3_temp_key, columns=columns)
+        except Exception as e:
+            print(f"Error al transformar {key}: {e}")
+
+    return True
+
+# Function to find, per object, the differential folders still to load
+def pending_folders(objects, all_diff_folders, watermarks):
+    folder_keys = [extract_folder_key(f) for f in all_diff_folders if f.endswith('_Differential/')]
+    pending = {}
+    already_done = {}
+    for spec in objects:
+        name = spec['name']
+        processed_keys = get_processed_folder_keys(dynamodb, spec['processed_table'], folder_keys)
+        pending[name] = []
+        for i, full_diff_folder in enumerate(all_diff_folders):
+            if not full_diff_folder.endswith('_Differential/'):
+                continue
+            # The listing starts after the lowest watermark, so objects ahead of it skip their older folders here
+            if watermarks[name] and full_diff_folder <= watermarks[name]:
+                continue
+            folder_key = extract_folder_key(full_diff_folder)
+            if folder_key in processed_keys:
+                print(f"Ya procesado ({name}): {folder_key}")
+                already_done[name] = full_diff_folder
+                continue
+            pending[name].append((i, full_diff_folder, folder_key))
+    return pending, already_done
+
+# Function to load each object's pending folders with a single COPY and procedure call per object
+def coalesce_pending_folders(conn, objects, all_diff_folders, pending, stats):
+    last_done = {}
+    for spec in objects:
+        name = spec['name']
+        folders_with_csv = load_folders_coalesced(
+            s3, bucket_name, [folder for _, folder, _ in pending[name]], spec['subfolder'],
+            partial(apply_coercion_plan, plan=spec['plan']), partial(copy_to_redshift_and_update, conn, spec),
+            S3_TARGET_BUCKET, spec['name'], plan=spec['plan'], chunksize=CSV_CHUNK_ROWS,
+            staging_format=STAGING_FORMAT, stats=stats)
+
+        # Folders are only marked once the object's merge has succeeded
+        for i, full_diff_folder, folder_key in pending[name]:
+            if full_diff_folder in folders_with_csv or i < len(all_diff_folders) - 1:
+                mark_key_as_processed(spec, folder_key)
+                last_done[name] = full_diff_folder
+                print(f"Completado ({name}): {folder_key}")
+            else:
+                print(f"Última carpeta sin CSVs ({name}), no se marcará como procesada: {folder_key}")
+    return last_done
+
+# Function to walk the folders once, loading every pending object of each folder
+def load_pending_folders(conn, objects, all_diff_folders, pending, stats):
+    last_done = {}
+    todo = {name: {folder for _, folder, _ in folders} for name, folders in pending.items()}
+    for i, full_diff_folder in enumerate(all_diff_folders):
+        for spec in objects:
+            name = spec['name']
+            if full_diff_folder not in todo[name]:
+                continue
+
+            folder_key = extract_folder_key(full_diff_folder)
+            print(f"Procesando folder ({name}): {folder_key}")
+            csv_processed = process_object_csvs(conn, spec, bucket_name, full_diff_folder, stats)
+
+            # Empty folders are only marked if there is a next folder (late files can still arrive)
+            if not csv_processed:
+                if i < len(all_diff_folders) - 1:
+                    mark_key_as_processed(spec, folder_key)
+                    last_done[name] = full_diff_folder
+                    print(f"Carpeta vacía marcada como procesada ({name}): {folder_key}")
+                else:
+                    print(f"Última carpeta sin CSVs ({name}), no se marcará como procesada: {folder_key}")
+            else:
+                mark_key_as_processed(spec, folder_key)
+                last_done[name] = full_diff_folder
+                print(f"Completado ({name}): {folder_key}")
+    return last_done
+
+# Lambda Handler
+def lambda_handler(event, context):
+    event = event or {}
+    objects = select_objects(event.get('objects') or LOADER_OBJECTS)
+
+    # One listing for every object: it starts after the lowest watermark (or from the beginning if any object has none)
+    watermarks = {spec['name']: get_watermark(checkpoints, spec['name']) for spec in objects}
+    start_after = None if None in watermarks.values() else start_after_folder(min(watermarks.values()))
+    all_diff_folders = list_differential_folders(bucket_name, prefix_base, start_after)
+    pending, already_done = pending_folders(objects, all_diff_folders, watermarks)
+    print(f"Watermarks: {watermarks} | folders nuevos: {len(all_diff_folders)} | "
+          f"pendientes: { {name: len(folders) for name, folders in pending.items()} }")
+
+    if not any(pending.values()):
+        for name, folder in already_done.items():
+            advance_watermark(checkpoints, name, folder)
+        return {'status': 'ok', 'message': 'No hay folders nuevos'}
+
+    coalesce = event.get('coalesce', COALESCE_FOLDERS)
+    stats = new_stage_stats()
+    started = time.perf_counter()
+
+    # A single Redshift connection serves every COPY and merge of the run
+    conn = psycopg2.connect(**REDSHIFT_CONFIG)
+    try:
+        if coalesce:
+            last_done = coalesce_pending_folders(conn, objects, all_diff_folders, pending, stats)
+        else:
+            last_done = load_pending_folders(conn, objects, all_diff_folders, pending, stats)
+    finally:
+        conn.close()
+
+    # Watermarks only move forward, so the later of both folders wins
+    for name, folder in list(already_done.items()) + list(last_done.items()):
+        advance_watermark(checkpoints, name, folder)
+
+    report_stage_stats(stats, time.perf_counter() - started)
+    return {'status': 'ok', 'message': f"Objetos procesados: {', '.join(spec['name'] for spec in objects)}"}
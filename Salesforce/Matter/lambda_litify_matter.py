@@ -1,9 +1,34 @@
 import boto3
 import pandas as pd
 from datetime import datetime
+from functools import partial
 import pytz
-import io
+import time
+import json
+import os
 import psycopg2
+from litify_checkpoint import (
+    CHECKPOINT_TABLE,
+    advance_watermark,
+    get_processed_folder_keys,
+    get_watermark,
+    start_after_folder,
+)
+from litify_coercion import apply_coercion_plan, read_csv_options
+from litify_objects import MATTER_PLAN
+from litify_pipeline import new_stage_stats, prefetch_csvs, report_stage_stats, timed_stage
+from litify_staging import (
+    DEFAULT_CHUNK_ROWS,
+    STAGING_FORMATS,
+    build_copy_sql,
+    coalesce_pending_folders,
+    csv_header,
+    encode_frames,
+    list_csv_keys,
+    load_folders_coalesced,
+    new_staging_key,
+    stream_csv_to_s3,
+)
 
 # Configuration
 REDSHIFT_CONFIG = json.loads(os.environ["REDSHIFT_CONFIG"])
@@ -11,10 +36,21 @@ IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
 
 S3_TARGET_BUCKET = os.getenv("S3_TARGET_BUCKET")
 
+# Rows per CSV chunk when streaming; 0 loads the whole CSV at once
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+
+# Coalesce all pending folders into a single COPY and merge (can be overridden per event)
+COALESCE_FOLDERS = os.getenv("COALESCE_FOLDERS", "false").lower() == "true"
+
+# Staging file format: json, json_gzip, json_zstd, csv_gzip or parquet
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "json")
+STAGING_EXTENSION = STAGING_FORMATS[STAGING_FORMAT]['extension']
+
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('ProcessedMatterFolders')
+checkpoints = dynamodb.Table(os.getenv("CHECKPOINT_TABLE", CHECKPOINT_TABLE))
 
 bucket_name = 'sfdatabackup-gfproduction'
 prefix_base = 'backup/'
@@ -24,23 +60,15 @@ def get_local_time_iso():
     return datetime.now(ny_tz).isoformat()
 
 def upload_df_to_s3(df, s3_bucket, s3_key):
-    json_buffer = io.StringIO()
-    df.to_json(json_buffer, orient='records', lines=True, date_format='iso')
-    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=json_buffer.getvalue())
+    body = b''.join(encode_frames([df], STAGING_FORMAT))
+    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=body)
 
-def copy_to_redshift_and_update(s3_temp_key):
+def copy_to_redshift_and_update(s3_temp_key, manifest=False, columns=None):
     S3_TEMP_PATH = f's3://{S3_TARGET_BUCKET}/{s3_temp_key}'
+    copy_sql = build_copy_sql('litify.matter_staging', S3_TEMP_PATH, IAM_ROLE_ARN, STAGING_FORMAT, columns, manifest)
     with psycopg2.connect(**REDSHIFT_CONFIG) as conn:
         with conn.cursor() as cur:
-            cur.execute(f"""
-                COPY litify.matter_staging
-                FROM '{S3_TEMP_PATH}'
-                IAM_ROLE '{IAM_ROLE_ARN}'
-                FORMAT AS JSON 'auto'
-                TIMEFORMAT 'auto'
-                BLANKSASNULL
-                EMPTYASNULL;
-            """)
+            cur.execute(copy_sql)
             print("COPY completado")
             cur.execute("CALL litify.update_litify_matter();")
             print("Procedure ejecutada")
@@ -49,9 +77,8 @@ def copy_to_redshift_and_update(s3_temp_key):
 def extract_folder_key(folder_name: str) -> str:
     return folder_name.split('/')[-2].split('_Differential')[0] + "_"
 
-def get_processed_keys():
-    response = table.scan()
-    return {item['folder_key'] for item in response.get('Items', [])}
+def get_processed_keys(folder_keys):
+    return get_processed_folder_keys(dynamodb, table.name, folder_keys)
 
 def mark_key_as_processed(folder_key):
     table.put_item(Item={
@@ -60,280 +87,76 @@ def mark_key_as_processed(folder_key):
     })
     
 
-def list_differential_folders(bucket, base_prefix):
+def list_differential_folders(bucket, base_prefix, start_after=None):
     paginator = s3.get_paginator('list_objects_v2')
-    result = paginator.paginate(Bucket=bucket, Prefix=base_prefix, Delimiter='/')
+    params = {'Bucket': bucket, 'Prefix': base_prefix, 'Delimiter': '/'}
+    if start_after:
+        params['StartAfter'] = start_after
+    result = paginator.paginate(**params)
     folders = []
     for page in result:
         folders += [cp['Prefix'] for cp in page.get('CommonPrefixes', [])]
     return folders
 
 def transform_data(df):
-
-
-    df.columns = df.columns.str.lower()
-    
-    datetime_fields = [
-
-        "createddate",
-        "lastmodifieddate",
-        "systemmodstamp",
-        "lastactivitydate",
-        "litify_pm__open_date__c",
-        "litify_pm__last_called_at__c",
-        "litify_pm__last_emailed_at__c",
-        "litify_pm__closed_date__c",
-        "litify_pm__filed_date__c",
-        "rfe_deadline__c",
-        "emergency_deadline_date__c",
-        "approved_denied_date__c",
-        "psych_eval_date__c",
-        "submitted_to_uscis__c",
-        "reviewed_with_cl__c",
-        "ff_paid_on__c",
-        "receipt_notices_received__c",
-        "fingerprint_appointment__c",
-        "psych_eval_completed__c",
-        "psych_eval_submitted_to_uscis__c",
-        "rfe_received__c",
-        "rfe_submission__c",
-        "received_prima_facie__c",
-        "received_work_permit__c",
-        "checkboxf__c",
-        "foia_request__c",
-        "fbi_submission__c",
-        "appeal_deadline__c",
-        "approval_received__c",
-        "denial_received__c",
-        "client_notified__c",
-        "uscis_receipt_cl_notified__c",
-        "fingerprint_cl_notified__c",
-        "rfe_received_cl_notified__c",
-        "work_permit_cl_notified__c",
-        "approval_received_cl_notified__c",
-        "denial_received_cl_notified__c",
-        "received_work_permit2__c",
-        "work_permit_cl_notified2__c",
-        "docs_collected__c",
-        "accurint_report_completed__c",
-        "sign_up_day__c",
-        "cl_interview__c",
-        "delivered_on__c",
-        "intreview_completed__c",
-        "forms_completed__c",
-        "rejection_received__c",
-        "refiling_date__c",
-        "prima_facie_cl_notified__c",
-        "early_aos_requested__c",
-        "early_aos_requested_cl_notified__c",
-        "early_aos_approved_cl_notified__c",
-        "aos_approval_received__c",
-        "referred_out_for_pe__c",
-        "latest_case_update__c",
-        "rfe_delivery__c",
-        "qc_completed__c",
-        "follow_up_date__c",
-        "date_ff_paid_on__c",
-        "noid_received__c",
-        "noid_responded__c",
-        "pre_rfe_date__c",
-        "latest_docs_fu__c",
-        "i_485_interview_360__c",
-        "i_485_interview_aos__c",
-        "asc_appointment_date__c",
-        "welcome_email_sent__c",
-        "last_auto_txt_communication__c",
-        "pif2__c",
-        "bonafide_received__c",
-        "status_changed_date_time__c",
-        "concern_raised__c",
-        "concern_resolved__c",
-        "dec_forms_sent_for_review__c"
-    ]
-
-    boolean_fields = [
-
-        "isdeleted",
-        "litify_pm__billable_matter__c",
-        "litify_pm__ignore_default_plan__c",
-        "litify_pm__limitations_date_satisfied__c",
-        "litify_pm__matter_has_budget__c",
-        "litify_pm__matter_team_modified__c",
-        "litify_pm__manual_statute_of_limitations__c",
-        "run_triggers__c",
-        "litify_ext__isteammember__c",
-        "litify_ext__private__c",
-        "isdeceased__c",
-        "serious_injury__c",
-        "isminor__c",
-        "conflict_check__c",
-        "payment_overdue__c",
-        "payments_criteria_2months__c",
-        "is_synced__c",
-        "urgent__c",
-        "not_financial_user__c",
-        "filling_fees_paid__c",
-        "attorney_or_paralegal__c",
-        "is_cl_specialist__c",
-        "automatic_form_errors__c",
-        "checkboxdate__c",
-        "priority__c",
-        "case_submitted__c",
-        "pif__c",
-        "foia_eoir__c",
-        "filled_fee_is_filled_automation__c",
-        "case_delivered__c",
-        "attorney_approval__c",
-        "consent_for_mts__c",
-        "official_records__c",
-        "early_aos_request__c",
-        "mtt__c",
-        "pro_bono__c",
-        "marked_for_rfe_tagging__c",
-        "ff_confirmed__c",
-        "submission_qc__c",
-        "removal__c",
-        "original_docs_at_the_office__c",
-        "i_765_filled__c",
-        "cl_detained__c",
-        "supervisor_call__c",
-        "supervisor_call_resolved__c",
-        "flagged_for_issues__c",
-        "template_needed__c",
-        "cases_sold_with__c",
-        "money_back_guarantee__c",
-        "archived__c",
-        "unresponsive_client__c",
-        "sensitive_case__c",
-        "criminal_offense__c",
-        "monitor_delivery__c",
-        "post_dec_forms_review_edits__c",
-        "attorney_call_needed__c",
-        "case_monitoring__c",
-        "open_warrant__c",
-        "i_131__c",
-        "claim_issue_found__c",
-        "signature__c",
-        "full_translation__c",
-        "form_update__c"
-        ]
-
-    int_fields = [
-
-        "live_saved__c",
-        "lives_saved__c",
-        "no_of_days__c",
-        "turnaround_time__c",
-        "count_role_records__c",
-        "case_count__c",
-        "live_associated__c",
-        "litify_pm__matter__c",
-        "litify_pm__total_calls__c",
-        "successful_calls__c",
-        "litify_pm__total_emails__c"
-        ]
-
-
-    float_fields = [
-
-        "litify_pm__total_damages__c",
-        "scheduled_amount__c",
-        "litify_pm__total_hours__c",
-        "litify_pm__total_amount_billable__c",
-        "litify_pm__total_amount_due__c",
-        "litify_pm__total_matter_value__c",
-        "litify_pm__total_matter_cost__c",
-        "litify_pm__total_amount_paid__c",
-        "litify_pm__total_amount_billed__c",
-        "litify_pm__total_amount_expensed_due__c",
-        "litify_pm__total_amount_expensed__c",
-        "litify_pm__total_amount_retained__c",
-        "litify_pm__total_amount_unbilled_expenses__c",
-        "litify_pm__total_amount_time_entries__c",
-        "litify_pm__total_amount_time_entries_billed__c",
-        "litify_pm__total_amount_time_entries_due__c",
-        "litify_pm__total_amount_time_entries_unpaid__c",
-        "litify_pm__lit_lien_total_currency__c",
-        "litify_pm__lit_total_client_payout__c",
-        "litify_pm__lit_damage_total__c",
-        "litify_pm__lit_expense_total__c",
-        "litify_pm__lit_lien_total__c",
-        "total_billable_expenses__c",
-        "total_unbilled_expenses__c",
-        "total_billable_te__c",
-        "total_unbilled_time_entries__c",
-        "total_invoiced_amount__c",
-        "total_payments_received__c",
-        "total_expenses__c",
-        "total_billed_expenses__c",
-        "total_time_entries__c",
-        "total_billed_time_entries__c",
-        "total_payments_due__c",
-        "total_uninvoiced_amount__c",
-        "payment__c",
-        "total_filing_fee__c",
-        "total_overdue_amount__c",
-        "urgentoverdue__c"
-        ]
-
-    string_fields = [col for col in df.columns if col not in datetime_fields + boolean_fields + int_fields + float_fields]
-
-    
-    for field in datetime_fields:
-        if field in df.columns:
-            df[field] = pd.to_datetime(df[field], errors='coerce')
-
-    for field in boolean_fields:
-        if field in df.columns:
-            df[field] = df[field].apply(lambda x: 1 if x in ['t', 'T', 'True', 'true', 1] else 0)
-            #df[field] = df[field].map({'t': 1, 'f': 0}).fillna(0).astype(int)
-
-    for field in int_fields:
-        if field in df.columns:
-            df[field] = df[field].fillna(0).astype(int)
-
-    for field in float_fields:
-        if field in df.columns:
-            df[field] = df[field].fillna(0).astype(float)
-
-    for field in string_fields:
-        if field in df.columns:
-            df[field] = df[field].fillna('').astype(str)
-    
-    return df
+    return apply_coercion_plan(df, MATTER_PLAN)
 
 def process_matter_csvs(bucket, differential_folder):
-    ny_tz = pytz.timezone('America/New_York')
-    timestamp = datetime.now(ny_tz).strftime('%Y%m%d%H%M%S')
-    s3_temp_key = f'staging/matter_staging/matter_staging_{timestamp}.json'
     matter_prefix = differential_folder + 'litify_pm__Matter__c/'
-    result = s3.list_objects_v2(Bucket=bucket, Prefix=matter_prefix)
+    csv_keys = list_csv_keys(s3, bucket, matter_prefix)
 
-    if 'Contents' not in result:
-        print(f"No se encontró carpeta 'litify_pm__Matter__c/' en {differential_folder}")
+    if not csv_keys:
+        print(f"No se encontró carpeta 'litify_pm__Matter__c/' con CSVs en {differential_folder}")
         return False
 
-    csv_found = False
-    for obj in result['Contents']:
-        key = obj['Key']
-        if key.endswith('.csv'):
-            csv_found = True
-            print(f"Procesando CSV: {key}")
-            response = s3.get_object(Bucket=bucket, Key=key)
-            df = pd.read_csv(response['Body'])
-
-            try:
-                df = transform_data(df)
+    stats = new_stage_stats()
+    started = time.perf_counter()
+
+    for key, path in prefetch_csvs(s3, bucket, csv_keys, stats):
+        print(f"Procesando CSV: {key}")
+        s3_temp_key = new_staging_key('matter', suffix=STAGING_EXTENSION)
+        read_options = read_csv_options(MATTER_PLAN, csv_header(path))
+
+        try:
+            if CSV_CHUNK_ROWS:
+                with open(path, 'rb') as body:
+                    rows, columns = stream_csv_to_s3(s3, body, transform_data, S3_TARGET_BUCKET, s3_temp_key, CSV_CHUNK_ROWS,
+                                                     STAGING_FORMAT, stats=stats, read_options=read_options)
+            else:
+                df = transform_data(pd.read_csv(path, **read_options))
                 upload_df_to_s3(df, S3_TARGET_BUCKET, s3_temp_key)
-                copy_to_redshift_and_update(s3_temp_key)
-            except Exception as e:
-                print(f"Error al transformar {key}: {e}")
-    return csv_found
+                rows, columns = len(df), list(df.columns)
+            if rows:
+                with timed_stage(stats, 'copy'):
+                    copy_to_redshift_and_update(s3_temp_key, columns=columns)
+        except Exception as e:
+            print(f"Error al transformar {key}: {e}")
+
+    report_stage_stats(stats, time.perf_counter() - started)
+    return True
+
+def coalesce_folders(all_diff_folders, processed_keys):
+    load = partial(load_folders_coalesced, s3, bucket_name, subfolder='litify_pm__Matter__c/', transform=transform_data,
+                   copy=copy_to_redshift_and_update, staging_bucket=S3_TARGET_BUCKET, object_name='matter',
+                   plan=MATTER_PLAN, chunksize=CSV_CHUNK_ROWS, staging_format=STAGING_FORMAT)
+    pending, last_done = coalesce_pending_folders(all_diff_folders, processed_keys, extract_folder_key, load,
+                                                  mark_key_as_processed)
+    if last_done:
+        advance_watermark(checkpoints, 'matter', last_done)
+
+    return {'status': 'ok', 'message': f'{pending} folders consolidados en un solo merge'}
 
 def lambda_handler(event, context):
-    processed_keys = get_processed_keys()
-    all_diff_folders = list_differential_folders(bucket_name, prefix_base)
+    # Only folders after the watermark are listed and checked in DynamoDB
+    watermark = get_watermark(checkpoints, 'matter')
+    all_diff_folders = list_differential_folders(bucket_name, prefix_base, start_after_folder(watermark))
+    processed_keys = get_processed_keys([extract_folder_key(f) for f in all_diff_folders if f.endswith('_Differential/')])
+    print(f"Watermark: {watermark} | folders nuevos: {len(all_diff_folders)}")
+
+    if (event or {}).get('coalesce', COALESCE_FOLDERS):
+        return coalesce_folders(all_diff_folders, processed_keys)
 
+    last_done = None
     for i, full_diff_folder in enumerate(all_diff_folders):
         if not full_diff_folder.endswith('_Differential/'):
             continue
@@ -342,6 +165,7 @@ def lambda_handler(event, context):
 
         if folder_key in processed_keys:
             print(f"Ya procesado: {folder_key}")
+            last_done = full_diff_folder
             continue
 
         print(f"Procesando folder: {folder_key}")
@@ -350,11 +174,16 @@ def lambda_handler(event, context):
         if not csv_processed:
             if i < len(all_diff_folders) - 1:
                 mark_key_as_processed(folder_key)
+                last_done = full_diff_folder
                 print(f"Carpeta vacía marcada como procesada: {folder_key}")
             else:
                 print(f"Última carpeta sin CSVs, no se marcará como procesada: {folder_key}")
         else:
             mark_key_as_processed(folder_key)
+            last_done = full_diff_folder
             print(f"Completado: {folder_key}")
 
+    if last_done:
+        advance_watermark(checkpoints, 'matter', last_done)
+
     return {'status': 'ok', 'message': 'Todos los folders nuevos fueron procesados'}
\ No newline at end of file
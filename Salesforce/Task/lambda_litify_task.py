@@ -1,10 +1,33 @@
 import boto3
 import pandas as pd
-import io
 import json 
 from datetime import datetime
+from functools import partial
 import pytz
+import time
 import psycopg2
+from litify_checkpoint import (
+    CHECKPOINT_TABLE,
+    advance_watermark,
+    get_processed_folder_keys,
+    get_watermark,
+    start_after_folder,
+)
+from litify_coercion import apply_coercion_plan, read_csv_options
+from litify_objects import TASK_PLAN
+from litify_pipeline import new_stage_stats, prefetch_csvs, report_stage_stats, timed_stage
+from litify_staging import (
+    DEFAULT_CHUNK_ROWS,
+    STAGING_FORMATS,
+    build_copy_sql,
+    coalesce_pending_folders,
+    csv_header,
+    encode_frames,
+    list_csv_keys,
+    load_folders_coalesced,
+    new_staging_key,
+    stream_csv_to_s3,
+)
 import os
 
 # Configuration
@@ -13,10 +36,21 @@ IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
 
 S3_TARGET_BUCKET = os.getenv("S3_TARGET_BUCKET")
 
+# Rows per CSV chunk when streaming; 0 loads the whole CSV at once
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+
+# Coalesce all pending folders into a single COPY and merge (can be overridden per event)
+COALESCE_FOLDERS = os.getenv("COALESCE_FOLDERS", "false").lower() == "true"
+
+# Staging file format: json, json_gzip, json_zstd, csv_gzip or parquet
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "json")
+STAGING_EXTENSION = STAGING_FORMATS[STAGING_FORMAT]['extension']
+
 # AWS clients
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('ProcessedTaskFolders')
+checkpoints = dynamodb.Table(os.getenv("CHECKPOINT_TABLE", CHECKPOINT_TABLE))
 
 bucket_name = 'sfdatabackup-gfproduction'
 prefix_base = 'backup/'
@@ -28,24 +62,16 @@ def get_local_time_iso():
 
 # Function to upload dataframe to S3
 def upload_df_to_s3(df, s3_bucket, s3_key):
-    json_buffer = io.StringIO()
-    df.to_json(json_buffer, orient='records', lines=True, date_format='iso')
-    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=json_buffer.getvalue())
+    body = b''.join(encode_frames([df], STAGING_FORMAT))
+    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=body)
 
 # Function to copy data to Redshift and update
-def copy_to_redshift_and_update(s3_temp_key):
+def copy_to_redshift_and_update(s3_temp_key, manifest=False, columns=None):
     S3_TEMP_PATH = f's3://{S3_TARGET_BUCKET}/{s3_temp_key}'
+    copy_sql = build_copy_sql('litify.task_staging', S3_TEMP_PATH, IAM_ROLE_ARN, STAGING_FORMAT, columns, manifest)
     with psycopg2.connect(**REDSHIFT_CONFIG) as conn:
         with conn.cursor() as cur:
-            cur.execute(f"""
-                COPY litify.task_staging
-                FROM '{S3_TEMP_PATH}'
-                IAM_ROLE '{IAM_ROLE_ARN}'
-                FORMAT AS JSON 'auto'
-                TIMEFORMAT 'auto'
-                BLANKSASNULL
-                EMPTYASNULL;
-            """)
+            cur.execute(copy_sql)
             print("COPY completado")
             cur.execute("CALL litify.update_litify_task();")
             print("Procedure ejecutada")
@@ -57,66 +83,11 @@ def extract_folder_key(folder_name: str) -> str:
 
 # Function to transform data
 def transform_data(df):
-    columns_to_keep = [
-
-    'WhatId', 
-    'Subject', 
-    'ActivityDate', 
-    'Status', 
-    'Priority', 
-    'IsHighPriority', 
-    'OwnerId', 
-    'Description',
-    'IsClosed', 
-    'CreatedDate', 
-    'CreatedById', 
-    'LastModifiedDate', 
-    'LastModifiedById', 
-    'SystemModstamp',
-    'ReminderDateTime', 
-    'IsReminderSet', 
-    'IsRecurrence', 
-    'In_Progress_Date__c', 
-    'TaskSubtype', 
-    'CompletedDateTime',
-    'litify_ext__Status__c', 
-    'litify_pm__Default_Matter_Task__c', 
-    'litify_pm__Matter_Stage_Activity__c',
-    'litify_pm__AssociatedObjectName__c', 
-    'litify_pm__Completed_Date__c', 
-    'litify_pm__AssigneeName__c',
-    'litify_pm__MatterStage__c', 
-    'litify_pm__UserRoleRelatedJunction__c', 
-    'Show_On_Calendar__c',
-    'Completed_Date__c', 
-    'Id', 
-    'Completed_By__c']
-
-    df = df[columns_to_keep]
-
-    datetime_fields = ['ActivityDate', 'Completed_Date__c', 'In_Progress_Date__c','CreatedDate', 'LastModifiedDate', 'CompletedDateTime',
-                       'litify_pm__Completed_Date__c', 'SystemModstamp', 'ReminderDateTime']
-    for field in datetime_fields:
-        df[field] = pd.to_datetime(df[field], errors='coerce')
-
-    boolean_fields = ['IsHighPriority', 'IsClosed', 'IsReminderSet', 'IsRecurrence', 'Show_On_Calendar__c']
-    for field in boolean_fields:
-        df[field] = df[field].fillna(0).astype(bool).astype(int)
-
-    string_fields = ["WhatId", "Subject", "Status", "Priority", "OwnerId", "Description", "CreatedById", "LastModifiedById",
-                     "TaskSubtype", "litify_pm__Default_Matter_Task__c", "litify_pm__Matter_Stage_Activity__c",
-                     "litify_pm__AssociatedObjectName__c", "litify_pm__AssigneeName__c", "litify_pm__MatterStage__c",
-                     "litify_pm__UserRoleRelatedJunction__c", "litify_ext__Status__c", "Id", 'Completed_By__c']
-    for field in string_fields:
-        df[field] = df[field].fillna('').astype(str)
-
-    df.columns = df.columns.str.lower()
-    return df
+    return apply_coercion_plan(df, TASK_PLAN)
 
 # Function to get processed keys from DynamoDB
-def get_processed_keys():
-    response = table.scan()
-    return {item['folder_key'] for item in response.get('Items', [])}
+def get_processed_keys(folder_keys):
+    return get_processed_folder_keys(dynamodb, table.name, folder_keys)
 
 # Function to mark folder as processed in DynamoDB
 def mark_key_as_processed(folder_key):
@@ -126,9 +97,12 @@ def mark_key_as_processed(folder_key):
     })
 
 # Function to list differential folders in S3
-def list_differential_folders(bucket, base_prefix):
+def list_differential_folders(bucket, base_prefix, start_after=None):
     paginator = s3.get_paginator('list_objects_v2')
-    result = paginator.paginate(Bucket=bucket, Prefix=base_prefix, Delimiter='/')
+    params = {'Bucket': bucket, 'Prefix': base_prefix, 'Delimiter': '/'}
+    if start_after:
+        params['StartAfter'] = start_after
+    result = paginator.paginate(**params)
     folders = []
     for page in result:
         folders += [cp['Prefix'] for cp in page.get('CommonPrefixes', [])]
@@ -136,43 +110,65 @@ def list_differential_folders(bucket, base_prefix):
 
 # Function to process Task CSVs
 def process_task_csvs(bucket, differential_folder):
-    ny_tz = pytz.timezone('America/New_York')
-    timestamp = datetime.now(ny_tz).strftime('%Y%m%d%H%M%S')
-    s3_temp_key = f'staging/task_staging/task_staging_{timestamp}.json'
     task_prefix = differential_folder + 'Task/'
-    result = s3.list_objects_v2(Bucket=bucket, Prefix=task_prefix)
+    csv_keys = list_csv_keys(s3, bucket, task_prefix)
 
     # If no files found, return False to indicate this folder is empty
-    if 'Contents' not in result:
-        print(f"No se encontró carpeta 'Task/' en {differential_folder}")
+    if not csv_keys:
+        print(f"No se encontró carpeta 'Task/' con CSVs en {differential_folder}")
         return False
 
-    csv_found = False  # Flag to track if any CSV is found and processed
+    stats = new_stage_stats()
+    started = time.perf_counter()
 
-    # Process the files in the 'Task' folder
-    for obj in result['Contents']:
-        key = obj['Key']
-        if key.endswith('.csv'):
-            csv_found = True  # Mark as found once we detect a .csv file
-            print(f"Procesando CSV: {key}")
-            response = s3.get_object(Bucket=bucket, Key=key)
-            df = pd.read_csv(response['Body'])
+    # The next CSV downloads while the current one is transformed; COPY and merge stay in CSV order
+    for key, path in prefetch_csvs(s3, bucket, csv_keys, stats):
+        print(f"Procesando CSV: {key}")
+        s3_temp_key = new_staging_key('task', suffix=STAGING_EXTENSION)
+        read_options = read_csv_options(TASK_PLAN, csv_header(path))
 
-            try:
-                df = transform_data(df)
+        try:
+            if CSV_CHUNK_ROWS:
+                with open(path, 'rb') as body:
+                    rows, columns = stream_csv_to_s3(s3, body, transform_data, S3_TARGET_BUCKET, s3_temp_key, CSV_CHUNK_ROWS,
+                                                     STAGING_FORMAT, stats=stats, read_options=read_options)
+            else:
+                df = transform_data(pd.read_csv(path, **read_options))
                 upload_df_to_s3(df, S3_TARGET_BUCKET, s3_temp_key)
-                copy_to_redshift_and_update(s3_temp_key)
-            except Exception as e:
-                print(f"Error al transformar {key}: {e}")
-
-    return csv_found  # Return whether CSVs were found and processed
+                rows, columns = len(df), list(df.columns)
+            if rows:
+                with timed_stage(stats, 'copy'):
+                    copy_to_redshift_and_update(s3_temp_key, columns=columns)
+        except Exception as e:
+            print(f"Error al transformar {key}: {e}")
+
+    report_stage_stats(stats, time.perf_counter() - started)
+    return True
+
+# Function to load every pending folder with a single COPY and procedure call
+def coalesce_folders(all_diff_folders, processed_keys):
+    load = partial(load_folders_coalesced, s3, bucket_name, subfolder='Task/', transform=transform_data,
+                   copy=copy_to_redshift_and_update, staging_bucket=S3_TARGET_BUCKET, object_name='task',
+                   plan=TASK_PLAN, chunksize=CSV_CHUNK_ROWS, staging_format=STAGING_FORMAT)
+    pending, last_done = coalesce_pending_folders(all_diff_folders, processed_keys, extract_folder_key, load,
+                                                  mark_key_as_processed)
+    if last_done:
+        advance_watermark(checkpoints, 'task', last_done)
+
+    return {'status': 'ok', 'message': f'{pending} folders consolidados en un solo merge'}
 
 # Lambda Handler
 def lambda_handler(event, context):
-    # Get processed keys and list differential folders
-    processed_keys = get_processed_keys()
-    all_diff_folders = list_differential_folders(bucket_name, prefix_base)
+    # Only folders after the watermark are listed and checked in DynamoDB
+    watermark = get_watermark(checkpoints, 'task')
+    all_diff_folders = list_differential_folders(bucket_name, prefix_base, start_after_folder(watermark))
+    processed_keys = get_processed_keys([extract_folder_key(f) for f in all_diff_folders if f.endswith('_Differential/')])
+    print(f"Watermark: {watermark} | folders nuevos: {len(all_diff_folders)}")
 
+    if (event or {}).get('coalesce', COALESCE_FOLDERS):
+        return coalesce_folders(all_diff_folders, processed_keys)
+
+    last_done = None
     # Iterate over all the differential folders
     for i, full_diff_folder in enumerate(all_diff_folders):
         if not full_diff_folder.endswith('_Differential/'):
@@ -183,6 +179,7 @@ def lambda_handler(event, context):
         # Skip processing if the folder has already been processed
         if folder_key in processed_keys:
             print(f"Ya procesado: {folder_key}")
+            last_done = full_diff_folder
             continue
 
         print(f"Procesando folder: {folder_key}")
@@ -195,12 +192,17 @@ def lambda_handler(event, context):
             # If this is not the last folder (i.e., there is a next folder to process), mark as processed
             if i < len(all_diff_folders) - 1:  # Check if there is a next folder
                 mark_key_as_processed(folder_key)  # Only mark as processed if there is a next folder
+                last_done = full_diff_folder
                 print(f"Carpeta vacía marcada como procesada: {folder_key}")
             else:
                 print(f"No se encontraron archivos CSV en {folder_key} y es la última carpeta, no se marcará como procesada.")
         else:
             # If CSV files were found and processed, mark as processed
             mark_key_as_processed(folder_key)
+            last_done = full_diff_folder
             print(f"Completado: {folder_key}")
 
+    if last_done:
+        advance_watermark(checkpoints, 'task', last_done)
+
     return {'status': 'ok', 'message': 'Todos los folders nuevos fueron procesados'}
\ No newline at end of file
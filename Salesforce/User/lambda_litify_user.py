@@ -1,9 +1,32 @@
 import boto3
 import pandas as pd
-import io
 from datetime import datetime
+from functools import partial
 import pytz
+import time
 import psycopg2
+from litify_checkpoint import (
+    CHECKPOINT_TABLE,
+    advance_watermark,
+    get_processed_folder_keys,
+    get_watermark,
+    start_after_folder,
+)
+from litify_coercion import apply_coercion_plan, read_csv_options
+from litify_objects import USER_PLAN
+from litify_pipeline import new_stage_stats, prefetch_csvs, report_stage_stats, timed_stage
+from litify_staging import (
+    DEFAULT_CHUNK_ROWS,
+    STAGING_FORMATS,
+    build_copy_sql,
+    coalesce_pending_folders,
+    csv_header,
+    encode_frames,
+    list_csv_keys,
+    load_folders_coalesced,
+    new_staging_key,
+    stream_csv_to_s3,
+)
 import os 
 import json 
 
@@ -13,10 +36,21 @@ IAM_ROLE_ARN = os.getenv("IAM_ROLE_ARN")
 
 S3_TARGET_BUCKET = os.getenv("S3_TARGET_BUCKET")
 
+# Rows per CSV chunk when streaming; 0 loads the whole CSV at once
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+
+# Coalesce all pending folders into a single COPY and merge (can be overridden per event)
+COALESCE_FOLDERS = os.getenv("COALESCE_FOLDERS", "false").lower() == "true"
+
+# Staging file format: json, json_gzip, json_zstd, csv_gzip or parquet
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "json")
+STAGING_EXTENSION = STAGING_FORMATS[STAGING_FORMAT]['extension']
+
 # AWS clients
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('ProcessedUserFolders')
+checkpoints = dynamodb.Table(os.getenv("CHECKPOINT_TABLE", CHECKPOINT_TABLE))
 
 bucket_name = 'sfdatabackup-gfproduction'
 prefix_base = 'backup/'
@@ -26,23 +60,15 @@ def get_local_time_iso():
     return datetime.now(ny_tz).isoformat()
 
 def upload_df_to_s3(df, s3_bucket, s3_key):
-    json_buffer = io.StringIO()
-    df.to_json(json_buffer, orient='records', lines=True, date_format='iso')
-    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=json_buffer.getvalue())
+    body = b''.join(encode_frames([df], STAGING_FORMAT))
+    s3.put_object(Bucket=s3_bucket, Key=s3_key, Body=body)
 
-def copy_to_redshift_and_update(s3_temp_key):
+def copy_to_redshift_and_update(s3_temp_key, manifest=False, columns=None):
     S3_TEMP_PATH = f's3://{S3_TARGET_BUCKET}/{s3_temp_key}'
+    copy_sql = build_copy_sql('litify.dim_users_staging', S3_TEMP_PATH, IAM_ROLE_ARN, STAGING_FORMAT, columns, manifest)
     with psycopg2.connect(**REDSHIFT_CONFIG) as conn:
         with conn.cursor() as cur:
-            cur.execute(f"""
-                COPY litify.dim_users_staging
-                FROM '{S3_TEMP_PATH}'
-                IAM_ROLE '{IAM_ROLE_ARN}'
-                FORMAT AS JSON 'auto'
-                TIMEFORMAT 'auto'
-                BLANKSASNULL
-                EMPTYASNULL;
-            """)
+            cur.execute(copy_sql)
             print("COPY completado")
             cur.execute("CALL litify.update_litify_user();")
             print("Procedure ejecutada")
@@ -51,9 +77,8 @@ def copy_to_redshift_and_update(s3_temp_key):
 def extract_folder_key(folder_name: str) -> str:
     return folder_name.split('/')[-2].split('_Differential')[0] + "_"
 
-def get_processed_keys():
-    response = table.scan()
-    return {item['folder_key'] for item in response.get('Items', [])}
+def get_processed_keys(folder_keys):
+    return get_processed_folder_keys(dynamodb, table.name, folder_keys)
 
 def mark_key_as_processed(folder_key):
     table.put_item(Item={
@@ -61,124 +86,76 @@ def mark_key_as_processed(folder_key):
         'processed_at': get_local_time_iso()
     })
 
-def list_differential_folders(bucket, base_prefix):
+def list_differential_folders(bucket, base_prefix, start_after=None):
     paginator = s3.get_paginator('list_objects_v2')
-    result = paginator.paginate(Bucket=bucket, Prefix=base_prefix, Delimiter='/')
+    params = {'Bucket': bucket, 'Prefix': base_prefix, 'Delimiter': '/'}
+    if start_after:
+        params['StartAfter'] = start_after
+    result = paginator.paginate(**params)
     folders = []
     for page in result:
         folders += [cp['Prefix'] for cp in page.get('CommonPrefixes', [])]
     return folders
 
 def transform_user_data(df):
-    df.columns = df.columns.str.lower()
-    col_list = ['id',
-                'username',
-                'alias',
-                'communitynickname',
-                'firstname',
-                'lastname',
-                'title',
-                'cm_job_title__c',
-                'cm_job_title_multi__c',
-                'department__c',
-                'isactive',
-                'startday',
-                'endday',
-                'companyname',
-                'timezonesidkey',
-                'localesidkey',
-                'usertype',
-                'passwordexpirationdate',
-                'systemmodstamp',
-                'lastpasswordchangedate',
-                'createddate',
-                'createdbyid',
-                'lastmodifieddate',
-                'lastmodifiedbyid',
-                'lastlogindate',
-                'receivesinfoemails',
-                'receivesadmininfoemails',
-                'numberoffailedlogins',
-                'dfsle__username__c',
-                'dfsle__status__c',
-                'dfsle__provisioned__c',
-                'dfsle__canmanageaccount__c',
-                'aboutme',
-                'federationidentifier',
-                'attorneys_per_page__c',
-                'lastreferenceddate',
-                'lastvieweddate',
-                'defaultgroupnotificationfrequency',
-                'digestfrequency',
-                'profileid']
-    
-    bool_fields = ['isactive', 
-                'receivesinfoemails', 
-                'receivesadmininfoemails', 
-                'dfsle__canmanageaccount__c']
-
-    date_fields = ['lastvieweddate', 
-                'lastreferenceddate', 
-                'lastlogindate', 
-                'lastmodifieddate', 
-                'createddate', 
-                'lastpasswordchangedate', 
-                'systemmodstamp', 
-                'passwordexpirationdate', 
-                'dfsle__provisioned__c']
-
-    float_fields = ['startday',	
-                    'endday', 
-                    'numberoffailedlogins']
-
-    string_fields = [col for col in df.columns if col not in date_fields + bool_fields + float_fields]
-
-    df = df[col_list]
-
-    for field in date_fields:
-        if field in df.columns:
-            df[field] = pd.to_datetime(df[field], errors='coerce')
-
-    for field in bool_fields:
-        if field in df.columns:
-            df[field] = df[field].fillna(0).astype(bool).astype(int)
-
-    for field in string_fields:
-        if field in df.columns:
-            df[field] = df[field].fillna('').astype(str)
-
-    return df
+    return apply_coercion_plan(df, USER_PLAN)
 
 def process_user_csvs(bucket, differential_folder):
-    timestamp = datetime.now(pytz.timezone('America/New_York')).strftime('%Y%m%d%H%M%S')
-    s3_temp_key = f'staging/user_staging/user_staging_{timestamp}.json'
     user_prefix = differential_folder + 'User/'
-    result = s3.list_objects_v2(Bucket=bucket, Prefix=user_prefix)
+    csv_keys = list_csv_keys(s3, bucket, user_prefix)
 
-    if 'Contents' not in result:
-        print(f"No se encontró carpeta 'User/' en {differential_folder}")
+    if not csv_keys:
+        print(f"No se encontró carpeta 'User/' con CSVs en {differential_folder}")
         return False
 
-    csv_found = False
-    for obj in result['Contents']:
-        key = obj['Key']
-        if key.endswith('.csv'):
-            csv_found = True
-            print(f"Procesando CSV: {key}")
-            response = s3.get_object(Bucket=bucket, Key=key)
-            df = pd.read_csv(response['Body'])
-            try:
-                df = transform_user_data(df)
+    stats = new_stage_stats()
+    started = time.perf_counter()
+
+    for key, path in prefetch_csvs(s3, bucket, csv_keys, stats):
+        print(f"Procesando CSV: {key}")
+        s3_temp_key = new_staging_key('user', suffix=STAGING_EXTENSION)
+        read_options = read_csv_options(USER_PLAN, csv_header(path))
+
+        try:
+            if CSV_CHUNK_ROWS:
+                with open(path, 'rb') as body:
+                    rows, columns = stream_csv_to_s3(s3, body, transform_user_data, S3_TARGET_BUCKET, s3_temp_key, CSV_CHUNK_ROWS,
+                                                     STAGING_FORMAT, stats=stats, read_options=read_options)
+            else:
+                df = transform_user_data(pd.read_csv(path, **read_options))
                 upload_df_to_s3(df, S3_TARGET_BUCKET, s3_temp_key)
-                copy_to_redshift_and_update(s3_temp_key)
-            except Exception as e:
-                print(f"Error al transformar {key}: {e}")
-    return csv_found
+                rows, columns = len(df), list(df.columns)
+            if rows:
+                with timed_stage(stats, 'copy'):
+                    copy_to_redshift_and_update(s3_temp_key, columns=columns)
+        except Exception as e:
+            print(f"Error al transformar {key}: {e}")
+
+    report_stage_stats(stats, time.perf_counter() - started)
+    return True
+
+def coalesce_folders(all_diff_folders, processed_keys):
+    load = partial(load_folders_coalesced, s3, bucket_name, subfolder='User/', transform=transform_user_data,
+                   copy=copy_to_redshift_and_update, staging_bucket=S3_TARGET_BUCKET, object_name='user',
+                   plan=USER_PLAN, chunksize=CSV_CHUNK_ROWS, staging_format=STAGING_FORMAT)
+    pending, last_done = coalesce_pending_folders(all_diff_folders, processed_keys, extract_folder_key, load,
+                                                  mark_key_as_processed)
+    if last_done:
+        advance_watermark(checkpoints, 'user', last_done)
+
+    return {'status': 'ok', 'message': f'{pending} folders consolidados en un solo merge'}
 
 def lambda_handler(event, context):
-    processed_keys = get_processed_keys()
-    all_diff_folders = list_differential_folders(bucket_name, prefix_base)
+    # Only folders after the watermark are listed and checked in DynamoDB
+    watermark = get_watermark(checkpoints, 'user')
+    all_diff_folders = list_differential_folders(bucket_name, prefix_base, start_after_folder(watermark))
+    processed_keys = get_processed_keys([extract_folder_key(f) for f in all_diff_folders if f.endswith('_Differential/')])
+    print(f"Watermark: {watermark} | folders nuevos: {len(all_diff_folders)}")
 
+    if (event or {}).get('coalesce', COALESCE_FOLDERS):
+        return coalesce_folders(all_diff_folders, processed_keys)
+
+    last_done = None
     for i, full_diff_folder in enumerate(all_diff_folders):
         if not full_diff_folder.endswith('_Differential/'):
             continue
@@ -187,6 +164,7 @@ def lambda_handler(event, context):
 
         if folder_key in processed_keys:
             print(f"Ya procesado: {folder_key}")
+            last_done = full_diff_folder
             continue
 
         print(f"Procesando folder: {folder_key}")
@@ -195,11 +173,16 @@ def lambda_handler(event, context):
         if not csv_processed:
             if i < len(all_diff_folders) - 1:
                 mark_key_as_processed(folder_key)
+                last_done = full_diff_folder
                 print(f"Carpeta vacía marcada como procesada: {folder_key}")
             else:
                 print(f"Última carpeta sin CSVs, no se marcará como procesada: {folder_key}")
         else:
             mark_key_as_processed(folder_key)
+            last_done = full_diff_folder
             print(f"Completado: {folder_key}")
 
+    if last_done:
+        advance_watermark(checkpoints, 'user', last_done)
+
     return {'status': 'ok', 'message': 'Todos los folders nuevos fueron procesados'}
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Throughput benchmark for the Salesforce type coercion on a wide Matter frame.
+
+Compares the previous per-column / per-cell loops of the Matter transform
+against the compiled coercion plan (litify_coercion + litify_objects). Both
+outputs are checked to be equal before timing; the synthetic values stay
+where the two agree (the plan also accepts '1' as True and coerces text in
+numeric columns, which the loops did not).
+
+    python Salesforce/benchmarks/bench_coercion.py --rows 20000 --string-columns 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from litify_coercion import apply_coercion_plan, build_coercion_plan  # noqa: E402
+from litify_objects import (  # noqa: E402
+    MATTER_BOOLEAN_FIELDS,
+    MATTER_DATETIME_FIELDS,
+    MATTER_FLOAT_FIELDS,
+    MATTER_INT_FIELDS,
+)
+
+
+def make_matter_frame(rows, string_columns, seed=7):
+    rng = np.random.default_rng(seed)
+    data = {}
+    dates = pd.date_range('2023-01-01', periods=1000, freq='h').strftime('%Y-%m-%dT%H:%M:%S.000Z').to_numpy()
+    for col in MATTER_DATETIME_FIELDS:
+        values = rng.choice(dates, rows).astype(object)
+        values[rng.random(rows) < 0.3] = None
+        data[col] = values
+    for col in MATTER_BOOLEAN_FIELDS:
+        data[col] = rng.choice(np.array([True, False, None], dtype=object), rows)
+    for col in MATTER_INT_FIELDS:
+        values = rng.integers(0, 50, rows).astype(float)
+        values[rng.random(rows) < 0.2] = np.nan
+        data[col] = values
+    for col in MATTER_FLOAT_FIELDS:
+        values = rng.random(rows) * 1000
+        values[rng.random(rows) < 0.2] = np.nan
+        data[col] = values
+    words = np.array(['open', 'closed', 'pending', 'a0B5f00000XyZ', None], dtype=object)
+    for i in range(string_columns):
+        data[f'text_field_{i}__c'] = rng.choice(words, rows)
+    df = pd.DataFrame(data)
+    df.columns = [col.upper() for col in df.columns]
+    return df
+
+
+def legacy_transform(df):
+    df.columns = df.columns.str.lower()
+    datetime_fields = list(MATTER_DATETIME_FIELDS)
+    boolean_fields = list(MATTER_BOOLEAN_FIELDS)
+    int_fields = list(MATTER_INT_FIELDS)
+    float_fields = list(MATTER_FLOAT_FIELDS)
+    string_fields = [col for col in df.columns if col not in datetime_fields + boolean_fields + int_fields + float_fields]
+
+    for field in datetime_fields:
+        if field in df.columns:
+            df[field] = pd.to_datetime(df[field], errors='coerce')
+    for field in boolean_fields:
+        if field in df.columns:
+            df[field] = df[field].apply(lambda x: 1 if x in ['t', 'T', 'True', 'true', 1] else 0)
+    for field in int_fields:
+        if field in df.columns:
+            df[field] = df[field].fillna(0).astype(int)
+    for field in float_fields:
+        if field in df.columns:
+            df[field] = df[field].fillna(0).astype(float)
+    for field in string_fields:
+        if field in df.columns:
+            df[field] = df[field].fillna('').astype(str)
+    return df
+
+
+def check_parity(source, plan):
+    legacy = legacy_transform(source.copy())
+    coerced = apply_coercion_plan(source.copy(), plan)
+    try:
+        pd.testing.assert_frame_equal(legacy[sorted(legacy.columns)], coerced[sorted(coerced.columns)])
+    except AssertionError as e:
+        raise SystemExit(f"Legacy loops and coercion plan disagree: {e}")
+
+
+def timed(fn, source, repeat):
+    best = None
+    for _ in range(repeat):
+        df = source.copy()
+        start = time.perf_counter()
+        fn(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--string-columns', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    source = make_matter_frame(args.rows, args.string_columns)
+    print(f"Matter frame: {len(source)} rows x {len(source.columns)} columns")
+
+    plan = build_coercion_plan(
+        datetime_fields=MATTER_DATETIME_FIELDS,
+        boolean_fields=MATTER_BOOLEAN_FIELDS,
+        int_fields=MATTER_INT_FIELDS,
+        float_fields=MATTER_FLOAT_FIELDS
+    )
+
+    check_parity(source, plan)
+    results = [
+        ('legacy loops', timed(legacy_transform, source, args.repeat)),
+        ('coercion plan', timed(lambda df: apply_coercion_plan(df, plan), source, args.repeat)),
+    ]
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print(f"{name:<15} {elapsed:8.3f} s  {len(source) / elapsed:12,.0f} rows/s  x{baseline / elapsed:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Compare the S3 staging formats on a wide, coerced Matter frame: bytes staged
+and time to produce the COPY-ready file.
+
+    python Salesforce/benchmarks/bench_staging_formats.py --rows 20000 --string-columns 100
+
+json_zstd needs `zstandard` and parquet needs `pyarrow`; formats whose
+dependency is missing are reported as skipped.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_coercion import make_matter_frame  # noqa: E402
+from litify_coercion import apply_coercion_plan  # noqa: E402
+from litify_objects import MATTER_PLAN  # noqa: E402
+from litify_staging import STAGING_FORMATS, encode_frames  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--string-columns', type=int, default=100)
+    parser.add_argument('--chunk-rows', type=int, default=5000, help='rows per encoded chunk (streaming mode)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = apply_coercion_plan(make_matter_frame(args.rows, args.string_columns), MATTER_PLAN)
+    chunks = [df.iloc[start:start + args.chunk_rows] for start in range(0, len(df), args.chunk_rows)]
+    print(f"Matter frame: {len(df)} rows x {len(df.columns)} columns, {len(chunks)} chunks")
+    print(f"{'format':<10} {'bytes':>14} {'vs json':>8} {'seconds':>9} {'rows/s':>12}")
+
+    baseline = None
+    for staging_format in STAGING_FORMATS:
+        try:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                size = sum(len(data) for data in encode_frames(chunks, staging_format))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except ImportError as e:
+            print(f"{staging_format:<10} skipped ({e.name} not installed)")
+            continue
+
+        baseline = baseline or size
+        print(f"{staging_format:<10} {size:>14,} {size / baseline:>8.2f} {best:>9.3f} {len(df) / best:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
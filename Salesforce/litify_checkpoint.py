@@ -0,0 +1,56 @@
+import time
+from datetime import datetime
+import pytz
+
+# DynamoDB table holding the highest processed differential folder per object (key: object_name)
+CHECKPOINT_TABLE = 'LitifyCheckpoints'
+
+# batch_get_item accepts at most 100 keys per request
+BATCH_GET_LIMIT = 100
+
+
+# Function to build the S3 StartAfter key that skips the watermark folder and everything inside it
+def start_after_folder(folder):
+    # 'backup/X_Differential/' -> 'backup/X_Differential0': every key of the folder sorts before it
+    return folder[:-1] + '0' if folder else None
+
+
+# Function to read the watermark of an object
+def get_watermark(table, object_name):
+    item = table.get_item(Key={'object_name': object_name}, ConsistentRead=True).get('Item')
+    return item.get('last_folder') if item else None
+
+
+# Function to move the watermark forward (never backwards)
+def advance_watermark(table, object_name, folder):
+    try:
+        table.update_item(
+            Key={'object_name': object_name},
+            UpdateExpression='SET last_folder = :folder, updated_at = :now',
+            ConditionExpression='attribute_not_exists(last_folder) OR last_folder < :folder',
+            ExpressionAttributeValues={
+                ':folder': folder,
+                ':now': datetime.now(pytz.timezone('America/New_York')).isoformat()
+            }
+        )
+        print(f"Watermark {object_name}: {folder}")
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Watermark {object_name} ya está en {folder} o después")
+
+
+# Function to check which folder keys are already marked, reading only those keys
+def get_processed_folder_keys(dynamodb, table_name, folder_keys):
+    processed = set()
+    keys = list(dict.fromkeys(folder_keys))
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {table_name: {
+            'Keys': [{'folder_key': key} for key in keys[start:start + BATCH_GET_LIMIT]],
+            'ProjectionExpression': 'folder_key'
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            processed.update(item['folder_key'] for item in response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys')
+            if request:
+                time.sleep(0.1)
+    return processed
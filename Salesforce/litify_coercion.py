@@ -0,0 +1,100 @@
+import pandas as pd
+
+# Values treated as True for boolean fields
+TRUE_VALUES = ['t', 'T', 'True', 'true', 'TRUE', '1', 1, True]
+
+DATETIME = 'datetime'
+BOOLEAN = 'boolean'
+INT = 'int'
+FLOAT = 'float'
+NUMERIC = 'numeric'
+STRING = 'string'
+
+
+def _to_datetime(block):
+    return block.apply(pd.to_datetime, errors='coerce')
+
+def _to_boolean(block):
+    return block.isin(TRUE_VALUES).astype('int64')
+
+def _to_int(block):
+    return block.apply(pd.to_numeric, errors='coerce').fillna(0).astype('int64')
+
+def _to_float(block):
+    return block.apply(pd.to_numeric, errors='coerce').fillna(0).astype('float64')
+
+def _to_numeric(block):
+    return block.apply(pd.to_numeric, errors='coerce')
+
+def _to_string(block):
+    return block.fillna('').astype(str)
+
+
+CONVERTERS = {
+    DATETIME: _to_datetime,
+    BOOLEAN: _to_boolean,
+    INT: _to_int,
+    FLOAT: _to_float,
+    NUMERIC: _to_numeric,
+    STRING: _to_string,
+}
+
+
+# Function to compile the coercion plan of a Salesforce object
+def build_coercion_plan(columns=None, datetime_fields=(), boolean_fields=(), int_fields=(),
+                        float_fields=(), numeric_fields=()):
+    """
+    Build the column -> converter map once per object. Columns not listed in any
+    group are coerced to strings. If `columns` is given, only those columns are kept.
+    """
+    converters = {}
+    for kind, fields in ((DATETIME, datetime_fields), (BOOLEAN, boolean_fields), (INT, int_fields),
+                         (FLOAT, float_fields), (NUMERIC, numeric_fields)):
+        for field in fields:
+            converters[field.lower()] = kind
+
+    return {
+        'columns': [col.lower() for col in columns] if columns else None,
+        'converters': converters,
+        'groups': {}
+    }
+
+
+def _group_columns(plan, columns):
+    # Grouping is cached per column layout, so chunks of the same CSV reuse it
+    key = tuple(columns)
+    groups = plan['groups'].get(key)
+    if groups is None:
+        converters = plan['converters']
+        groups = {}
+        for col in columns:
+            groups.setdefault(converters.get(col, STRING), []).append(col)
+        plan['groups'][key] = groups
+    return groups
+
+
+# Function to build the read_csv options of a plan for a CSV header
+def read_csv_options(plan, header):
+    """
+    Only the plan's columns are loaded (matched case-insensitively against the
+    Salesforce header), all as text so the parser skips type inference. The
+    plan converts them once; numeric columns are coerced there, so a malformed
+    cell ('1,234.50', 'N/A') becomes 0 instead of failing the whole CSV.
+    """
+    wanted = set(plan['columns']) if plan['columns'] is not None else None
+    usecols = [col for col in header if wanted is None or col.lower() in wanted]
+    return {'usecols': usecols, 'dtype': {col: str for col in usecols}}
+
+
+# Function to apply a coercion plan to a dataframe
+def apply_coercion_plan(df, plan):
+    df.columns = df.columns.str.lower()
+    if plan['columns'] is not None:
+        df = df[plan['columns']]
+
+    columns = list(df.columns)
+    groups = _group_columns(plan, columns)
+    blocks = [CONVERTERS[kind](df[cols]) for kind, cols in groups.items()]
+    if not blocks:
+        return df
+    return pd.concat(blocks, axis=1)[columns]
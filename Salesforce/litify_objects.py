@@ -0,0 +1,383 @@
+from litify_coercion import build_coercion_plan
+
+# Field definitions for the Salesforce (Litify) objects loaded into Redshift.
+# Column names are lowercase, matching the staging tables.
+
+
+# Matter (litify_pm__Matter__c)
+MATTER_DATETIME_FIELDS = [
+    "createddate",
+    "lastmodifieddate",
+    "systemmodstamp",
+    "lastactivitydate",
+    "litify_pm__open_date__c",
+    "litify_pm__last_called_at__c",
+    "litify_pm__last_emailed_at__c",
+    "litify_pm__closed_date__c",
+    "litify_pm__filed_date__c",
+    "rfe_deadline__c",
+    "emergency_deadline_date__c",
+    "approved_denied_date__c",
+    "psych_eval_date__c",
+    "submitted_to_uscis__c",
+    "reviewed_with_cl__c",
+    "ff_paid_on__c",
+    "receipt_notices_received__c",
+    "fingerprint_appointment__c",
+    "psych_eval_completed__c",
+    "psych_eval_submitted_to_uscis__c",
+    "rfe_received__c",
+    "rfe_submission__c",
+    "received_prima_facie__c",
+    "received_work_permit__c",
+    "checkboxf__c",
+    "foia_request__c",
+    "fbi_submission__c",
+    "appeal_deadline__c",
+    "approval_received__c",
+    "denial_received__c",
+    "client_notified__c",
+    "uscis_receipt_cl_notified__c",
+    "fingerprint_cl_notified__c",
+    "rfe_received_cl_notified__c",
+    "work_permit_cl_notified__c",
+    "approval_received_cl_notified__c",
+    "denial_received_cl_notified__c",
+    "received_work_permit2__c",
+    "work_permit_cl_notified2__c",
+    "docs_collected__c",
+    "accurint_report_completed__c",
+    "sign_up_day__c",
+    "cl_interview__c",
+    "delivered_on__c",
+    "intreview_completed__c",
+    "forms_completed__c",
+    "rejection_received__c",
+    "refiling_date__c",
+    "prima_facie_cl_notified__c",
+    "early_aos_requested__c",
+    "early_aos_requested_cl_notified__c",
+    "early_aos_approved_cl_notified__c",
+    "aos_approval_received__c",
+    "referred_out_for_pe__c",
+    "latest_case_update__c",
+    "rfe_delivery__c",
+    "qc_completed__c",
+    "follow_up_date__c",
+    "date_ff_paid_on__c",
+    "noid_received__c",
+    "noid_responded__c",
+    "pre_rfe_date__c",
+    "latest_docs_fu__c",
+    "i_485_interview_360__c",
+    "i_485_interview_aos__c",
+    "asc_appointment_date__c",
+    "welcome_email_sent__c",
+    "last_auto_txt_communication__c",
+    "pif2__c",
+    "bonafide_received__c",
+    "status_changed_date_time__c",
+    "concern_raised__c",
+    "concern_resolved__c",
+    "dec_forms_sent_for_review__c",
+]
+
+MATTER_BOOLEAN_FIELDS = [
+    "isdeleted",
+    "litify_pm__billable_matter__c",
+    "litify_pm__ignore_default_plan__c",
+    "litify_pm__limitations_date_satisfied__c",
+    "litify_pm__matter_has_budget__c",
+    "litify_pm__matter_team_modified__c",
+    "litify_pm__manual_statute_of_limitations__c",
+    "run_triggers__c",
+    "litify_ext__isteammember__c",
+    "litify_ext__private__c",
+    "isdeceased__c",
+    "serious_injury__c",
+    "isminor__c",
+    "conflict_check__c",
+    "payment_overdue__c",
+    "payments_criteria_2months__c",
+    "is_synced__c",
+    "urgent__c",
+    "not_financial_user__c",
+    "filling_fees_paid__c",
+    "attorney_or_paralegal__c",
+    "is_cl_specialist__c",
+    "automatic_form_errors__c",
+    "checkboxdate__c",
+    "priority__c",
+    "case_submitted__c",
+    "pif__c",
+    "foia_eoir__c",
+    "filled_fee_is_filled_automation__c",
+    "case_delivered__c",
+    "attorney_approval__c",
+    "consent_for_mts__c",
+    "official_records__c",
+    "early_aos_request__c",
+    "mtt__c",
+    "pro_bono__c",
+    "marked_for_rfe_tagging__c",
+    "ff_confirmed__c",
+    "submission_qc__c",
+    "removal__c",
+    "original_docs_at_the_office__c",
+    "i_765_filled__c",
+    "cl_detained__c",
+    "supervisor_call__c",
+    "supervisor_call_resolved__c",
+    "flagged_for_issues__c",
+    "template_needed__c",
+    "cases_sold_with__c",
+    "money_back_guarantee__c",
+    "archived__c",
+    "unresponsive_client__c",
+    "sensitive_case__c",
+    "criminal_offense__c",
+    "monitor_delivery__c",
+    "post_dec_forms_review_edits__c",
+    "attorney_call_needed__c",
+    "case_monitoring__c",
+    "open_warrant__c",
+    "i_131__c",
+    "claim_issue_found__c",
+    "signature__c",
+    "full_translation__c",
+    "form_update__c",
+]
+
+MATTER_INT_FIELDS = [
+    "live_saved__c",
+    "lives_saved__c",
+    "no_of_days__c",
+    "turnaround_time__c",
+    "count_role_records__c",
+    "case_count__c",
+    "live_associated__c",
+    "litify_pm__matter__c",
+    "litify_pm__total_calls__c",
+    "successful_calls__c",
+    "litify_pm__total_emails__c",
+]
+
+MATTER_FLOAT_FIELDS = [
+    "litify_pm__total_damages__c",
+    "scheduled_amount__c",
+    "litify_pm__total_hours__c",
+    "litify_pm__total_amount_billable__c",
+    "litify_pm__total_amount_due__c",
+    "litify_pm__total_matter_value__c",
+    "litify_pm__total_matter_cost__c",
+    "litify_pm__total_amount_paid__c",
+    "litify_pm__total_amount_billed__c",
+    "litify_pm__total_amount_expensed_due__c",
+    "litify_pm__total_amount_expensed__c",
+    "litify_pm__total_amount_retained__c",
+    "litify_pm__total_amount_unbilled_expenses__c",
+    "litify_pm__total_amount_time_entries__c",
+    "litify_pm__total_amount_time_entries_billed__c",
+    "litify_pm__total_amount_time_entries_due__c",
+    "litify_pm__total_amount_time_entries_unpaid__c",
+    "litify_pm__lit_lien_total_currency__c",
+    "litify_pm__lit_total_client_payout__c",
+    "litify_pm__lit_damage_total__c",
+    "litify_pm__lit_expense_total__c",
+    "litify_pm__lit_lien_total__c",
+    "total_billable_expenses__c",
+    "total_unbilled_expenses__c",
+    "total_billable_te__c",
+    "total_unbilled_time_entries__c",
+    "total_invoiced_amount__c",
+    "total_payments_received__c",
+    "total_expenses__c",
+    "total_billed_expenses__c",
+    "total_time_entries__c",
+    "total_billed_time_entries__c",
+    "total_payments_due__c",
+    "total_uninvoiced_amount__c",
+    "payment__c",
+    "total_filing_fee__c",
+    "total_overdue_amount__c",
+    "urgentoverdue__c",
+]
+
+MATTER_PLAN = build_coercion_plan(
+    datetime_fields=MATTER_DATETIME_FIELDS,
+    boolean_fields=MATTER_BOOLEAN_FIELDS,
+    int_fields=MATTER_INT_FIELDS,
+    float_fields=MATTER_FLOAT_FIELDS
+)
+
+
+# Task
+TASK_COLUMNS = [
+    "whatid",
+    "subject",
+    "activitydate",
+    "status",
+    "priority",
+    "ishighpriority",
+    "ownerid",
+    "description",
+    "isclosed",
+    "createddate",
+    "createdbyid",
+    "lastmodifieddate",
+    "lastmodifiedbyid",
+    "systemmodstamp",
+    "reminderdatetime",
+    "isreminderset",
+    "isrecurrence",
+    "in_progress_date__c",
+    "tasksubtype",
+    "completeddatetime",
+    "litify_ext__status__c",
+    "litify_pm__default_matter_task__c",
+    "litify_pm__matter_stage_activity__c",
+    "litify_pm__associatedobjectname__c",
+    "litify_pm__completed_date__c",
+    "litify_pm__assigneename__c",
+    "litify_pm__matterstage__c",
+    "litify_pm__userrolerelatedjunction__c",
+    "show_on_calendar__c",
+    "completed_date__c",
+    "id",
+    "completed_by__c",
+]
+
+TASK_DATETIME_FIELDS = [
+    "activitydate",
+    "completed_date__c",
+    "in_progress_date__c",
+    "createddate",
+    "lastmodifieddate",
+    "completeddatetime",
+    "litify_pm__completed_date__c",
+    "systemmodstamp",
+    "reminderdatetime",
+]
+
+TASK_BOOLEAN_FIELDS = [
+    "ishighpriority",
+    "isclosed",
+    "isreminderset",
+    "isrecurrence",
+    "show_on_calendar__c",
+]
+
+TASK_PLAN = build_coercion_plan(
+    columns=TASK_COLUMNS,
+    datetime_fields=TASK_DATETIME_FIELDS,
+    boolean_fields=TASK_BOOLEAN_FIELDS
+)
+
+
+# User
+USER_COLUMNS = [
+    "id",
+    "username",
+    "alias",
+    "communitynickname",
+    "firstname",
+    "lastname",
+    "title",
+    "cm_job_title__c",
+    "cm_job_title_multi__c",
+    "department__c",
+    "isactive",
+    "startday",
+    "endday",
+    "companyname",
+    "timezonesidkey",
+    "localesidkey",
+    "usertype",
+    "passwordexpirationdate",
+    "systemmodstamp",
+    "lastpasswordchangedate",
+    "createddate",
+    "createdbyid",
+    "lastmodifieddate",
+    "lastmodifiedbyid",
+    "lastlogindate",
+    "receivesinfoemails",
+    "receivesadmininfoemails",
+    "numberoffailedlogins",
+    "dfsle__username__c",
+    "dfsle__status__c",
+    "dfsle__provisioned__c",
+    "dfsle__canmanageaccount__c",
+    "aboutme",
+    "federationidentifier",
+    "attorneys_per_page__c",
+    "lastreferenceddate",
+    "lastvieweddate",
+    "defaultgroupnotificationfrequency",
+    "digestfrequency",
+    "profileid",
+]
+
+USER_DATETIME_FIELDS = [
+    "lastvieweddate",
+    "lastreferenceddate",
+    "lastlogindate",
+    "lastmodifieddate",
+    "createddate",
+    "lastpasswordchangedate",
+    "systemmodstamp",
+    "passwordexpirationdate",
+    "dfsle__provisioned__c",
+]
+
+USER_BOOLEAN_FIELDS = [
+    "isactive",
+    "receivesinfoemails",
+    "receivesadmininfoemails",
+    "dfsle__canmanageaccount__c",
+]
+
+# Parsed as numbers but left nullable (not filled with 0)
+USER_NUMERIC_FIELDS = [
+    "startday",
+    "endday",
+    "numberoffailedlogins",
+]
+
+USER_PLAN = build_coercion_plan(
+    columns=USER_COLUMNS,
+    datetime_fields=USER_DATETIME_FIELDS,
+    boolean_fields=USER_BOOLEAN_FIELDS,
+    numeric_fields=USER_NUMERIC_FIELDS
+)
+
+
+# Object registry used by the multi-object loader, in load order: S3 subfolder of each
+# differential folder, read/coercion plan, staging table, SCD1 procedure and the DynamoDB
+# table that marks the folders already processed for the object.
+LITIFY_OBJECTS = [
+    {
+        'name': 'task',
+        'subfolder': 'Task/',
+        'plan': TASK_PLAN,
+        'staging_table': 'litify.task_staging',
+        'procedure': 'litify.update_litify_task',
+        'processed_table': 'ProcessedTaskFolders',
+    },
+    {
+        'name': 'user',
+        'subfolder': 'User/',
+        'plan': USER_PLAN,
+        'staging_table': 'litify.dim_users_staging',
+        'procedure': 'litify.update_litify_user',
+        'processed_table': 'ProcessedUserFolders',
+    },
+    {
+        'name': 'matter',
+        'subfolder': 'litify_pm__Matter__c/',
+        'plan': MATTER_PLAN,
+        'staging_table': 'litify.matter_staging',
+        'procedure': 'litify.update_litify_matter',
+        'processed_table': 'ProcessedMatterFolders',
+    },
+]
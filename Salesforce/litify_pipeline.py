@@ -0,0 +1,85 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Pipeline stages, in order: S3 download, parse + transform + encode, S3 part upload, COPY + merge
+STAGES = ['download', 'transform', 'upload', 'copy']
+
+_stats_lock = threading.Lock()
+
+
+# Function to create the per-stage counters of one run
+def new_stage_stats():
+    return {stage: {'seconds': 0.0, 'items': 0, 'bytes': 0} for stage in STAGES}
+
+
+# Function to add a measurement to a stage (safe to call from worker threads)
+def record_stage(stats, stage, seconds, items=1, nbytes=0):
+    if stats is None:
+        return
+    with _stats_lock:
+        stats[stage]['seconds'] += seconds
+        stats[stage]['items'] += items
+        stats[stage]['bytes'] += nbytes
+
+
+@contextmanager
+def timed_stage(stats, stage, items=1, nbytes=0):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stats, stage, time.perf_counter() - started, items, nbytes)
+
+
+# Function to print busy time and throughput per stage
+def report_stage_stats(stats, wall_seconds):
+    busy = sum(stage['seconds'] for stage in stats.values())
+    print(f"Pipeline: {wall_seconds:.1f}s wall, {busy:.1f}s busy across stages")
+    for name in STAGES:
+        stage = stats[name]
+        rate = stage['bytes'] / stage['seconds'] / 1024 / 1024 if stage['seconds'] else 0.0
+        print(f"  {name:<9} {stage['seconds']:7.1f}s  {stage['items']:6d} items  {stage['bytes'] / 1024 / 1024:9.1f} MB  {rate:7.1f} MB/s")
+
+
+def _download(s3, bucket, key, stats):
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    os.close(handle)
+    started = time.perf_counter()
+    s3.download_file(bucket, key, path)
+    record_stage(stats, 'download', time.perf_counter() - started, nbytes=os.path.getsize(path))
+    return path
+
+
+# Function to iterate CSVs in order while the next ones download in the background
+def prefetch_csvs(s3, bucket, keys, stats=None, depth=1):
+    """
+    Yield (key, local_path) in the order of `keys`. Up to `depth` following CSVs are
+    downloaded to /tmp while the current one is processed; each file is deleted as
+    soon as the consumer moves on, so at most depth + 1 files are on disk.
+    """
+    with ThreadPoolExecutor(max_workers=depth) as downloads:
+        pending = [downloads.submit(_download, s3, bucket, key, stats) for key in keys[:depth + 1]]
+        next_index = len(pending)
+        try:
+            for key in keys:
+                path = pending.pop(0).result()
+                try:
+                    yield key, path
+                finally:
+                    os.remove(path)
+                if next_index < len(keys):
+                    pending.append(downloads.submit(_download, s3, bucket, keys[next_index], stats))
+                    next_index += 1
+        finally:
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled():
+                    try:
+                        os.remove(future.result())
+                    except Exception:
+                        pass
@@ -0,0 +1,375 @@
+import gzip
+import io
+import json
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import pandas as pd
+import pytz
+from litify_coercion import read_csv_options
+from litify_pipeline import new_stage_stats, prefetch_csvs, record_stage, report_stage_stats, timed_stage
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Rows read from the source CSV per chunk in streaming mode
+DEFAULT_CHUNK_ROWS = 20000
+
+# Multipart parts uploading in the background while the next chunks are parsed
+DEFAULT_UPLOAD_WORKERS = 2
+
+# Columns that order versions of the same record (latest last)
+COMPACTION_ORDER = ['lastmodifieddate', 'systemmodstamp']
+
+
+# Function to build a unique staging key (several CSVs can be staged within the same second)
+def new_staging_key(object_name, suffix='.json'):
+    timestamp = datetime.now(pytz.timezone('America/New_York')).strftime('%Y%m%d%H%M%S')
+    return f'staging/{object_name}_staging/{object_name}_staging_{timestamp}_{uuid.uuid4().hex[:8]}{suffix}'
+
+
+# Function to list every CSV under a prefix
+def list_csv_keys(s3, bucket, prefix):
+    paginator = s3.get_paginator('list_objects_v2')
+    keys = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys += [obj['Key'] for obj in page.get('Contents', []) if obj['Key'].endswith('.csv')]
+    return keys
+
+
+# Function to read only the header of a local CSV
+def csv_header(path):
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+# Function to serialize a dataframe as JSON lines
+def serialize_json_lines(df):
+    json_buffer = io.StringIO()
+    df.to_json(json_buffer, orient='records', lines=True, date_format='iso')
+    data = json_buffer.getvalue().encode('utf-8')
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    return data
+
+
+# Function to serialize a dataframe as headerless CSV (column order comes from the COPY column list)
+def serialize_csv(df):
+    return df.to_csv(index=False, header=False, date_format='%Y-%m-%dT%H:%M:%S.%f').encode('utf-8')
+
+
+def _zstd_compress(data):
+    import zstandard
+    return zstandard.ZstdCompressor().compress(data)
+
+
+class _PartSink:
+    """Write-only file object that keeps the absolute position pyarrow needs for the Parquet footer."""
+
+    closed = False
+
+    def __init__(self):
+        self.pieces = []
+        self.position = 0
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def _encode_parquet(frames):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _PartSink()
+    writer = None
+    for df in frames:
+        if writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            writer = pq.ParquetWriter(sink, table.schema, coerce_timestamps='us', allow_truncated_timestamps=True)
+        else:
+            table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+# Staging formats: file extension, chunk encoder, COPY options and whether COPY needs
+# an explicit column list. Encoded json/csv chunks can be concatenated (gzip members and
+# zstd frames are valid back to back); Parquet chunks become row groups of one file.
+STAGING_FORMATS = {
+    'json': {
+        'extension': '.json',
+        'encode': serialize_json_lines,
+        'copy_options': ["FORMAT AS JSON 'auto'", "TIMEFORMAT 'auto'", "BLANKSASNULL", "EMPTYASNULL"],
+        'column_list': False,
+    },
+    'json_gzip': {
+        'extension': '.json.gz',
+        'encode': lambda df: gzip.compress(serialize_json_lines(df), compresslevel=6),
+        'copy_options': ["FORMAT AS JSON 'auto'", "GZIP", "TIMEFORMAT 'auto'", "BLANKSASNULL", "EMPTYASNULL"],
+        'column_list': False,
+    },
+    'json_zstd': {
+        'extension': '.json.zst',
+        'encode': lambda df: _zstd_compress(serialize_json_lines(df)),
+        'copy_options': ["FORMAT AS JSON 'auto'", "ZSTD", "TIMEFORMAT 'auto'", "BLANKSASNULL", "EMPTYASNULL"],
+        'column_list': False,
+    },
+    'csv_gzip': {
+        'extension': '.csv.gz',
+        'encode': lambda df: gzip.compress(serialize_csv(df), compresslevel=6),
+        'copy_options': ["FORMAT AS CSV", "GZIP", "TIMEFORMAT 'auto'", "BLANKSASNULL", "EMPTYASNULL"],
+        'column_list': True,
+    },
+    'parquet': {
+        'extension': '.parquet',
+        'encode': None,
+        'copy_options': ["FORMAT AS PARQUET"],
+        'column_list': True,
+    },
+}
+
+
+# Function to encode a sequence of dataframes into the chunks of one staged file
+def encode_frames(frames, staging_format='json'):
+    if staging_format == 'parquet':
+        yield from _encode_parquet(frames)
+        return
+
+    encode = STAGING_FORMATS[staging_format]['encode']
+    columns = None
+    for df in frames:
+        # Keep the column order of the first chunk so positional formats (CSV) stay aligned
+        if columns is None:
+            columns = list(df.columns)
+        yield encode(df[columns])
+
+
+# Function to build the COPY statement matching a staging format
+def build_copy_sql(table, s3_path, iam_role, staging_format='json', columns=None, manifest=False):
+    spec = STAGING_FORMATS[staging_format]
+    column_list = f" ({', '.join(columns)})" if columns and spec['column_list'] else ''
+    options = spec['copy_options'] + (['MANIFEST'] if manifest else [])
+    return '\n'.join([f"COPY {table}{column_list}", f"FROM '{s3_path}'", f"IAM_ROLE '{iam_role}'"] + options) + ';'
+
+
+def _upload_part(s3, s3_bucket, s3_key, upload_id, part_number, data, stats=None):
+    started = time.perf_counter()
+    response = s3.upload_part(
+        Bucket=s3_bucket,
+        Key=s3_key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=data
+    )
+    record_stage(stats, 'upload', time.perf_counter() - started, nbytes=len(data))
+    return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+
+# Function to stream a CSV through transform into a single S3 object
+def stream_csv_to_s3(s3, body, transform, s3_bucket, s3_key, chunksize=DEFAULT_CHUNK_ROWS, staging_format='json',
+                     upload_workers=DEFAULT_UPLOAD_WORKERS, stats=None, read_options=None):
+    """
+    Read the CSV body in row chunks, transform each chunk and send the encoded
+    output to S3 as multipart-upload parts. Parts upload in the background while
+    the following chunks are parsed; at most `upload_workers` parts are in flight,
+    so memory stays bounded. `read_options` (usecols/dtype) go to read_csv.
+    Returns the number of rows written (0 = nothing uploaded) and the staged
+    column order.
+    """
+    upload_id = s3.create_multipart_upload(Bucket=s3_bucket, Key=s3_key)['UploadId']
+    futures = []
+    buffer = bytearray()
+    staged = {'rows': 0, 'columns': None}
+
+    def frames():
+        for chunk in pd.read_csv(body, chunksize=chunksize, **(read_options or {})):
+            df = transform(chunk)
+            staged['rows'] += len(df)
+            if staged['columns'] is None:
+                staged['columns'] = list(df.columns)
+            yield df
+
+    def submit_part(uploads, data):
+        in_flight = [future for future in futures if not future.done()]
+        if len(in_flight) >= upload_workers:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        futures.append(uploads.submit(_upload_part, s3, s3_bucket, s3_key, upload_id, len(futures) + 1, data, stats))
+
+    try:
+        with ThreadPoolExecutor(max_workers=upload_workers) as uploads:
+            encoded = encode_frames(frames(), staging_format)
+            while True:
+                started = time.perf_counter()
+                data = next(encoded, None)
+                if data is None:
+                    break
+                record_stage(stats, 'transform', time.perf_counter() - started, nbytes=len(data))
+
+                buffer += data
+                if len(buffer) >= MIN_PART_SIZE:
+                    submit_part(uploads, bytes(buffer))
+                    buffer = bytearray()
+
+            if staged['rows'] and buffer:
+                submit_part(uploads, bytes(buffer))
+            parts = [future.result() for future in futures]
+
+        if staged['rows'] == 0:
+            s3.abort_multipart_upload(Bucket=s3_bucket, Key=s3_key, UploadId=upload_id)
+            return 0, staged['columns']
+
+        s3.complete_multipart_upload(
+            Bucket=s3_bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=s3_bucket, Key=s3_key, UploadId=upload_id)
+        raise
+
+    print(f"Streamed {staged['rows']} rows in {len(parts)} parts to s3://{s3_bucket}/{s3_key}")
+    return staged['rows'], staged['columns']
+
+
+# Function to keep only the latest version of each record
+def compact_latest(df, id_column='id', order_columns=COMPACTION_ORDER):
+    order = [col for col in order_columns if col in df.columns]
+    if order:
+        # Stable sort: on ties the row read last (newest folder) wins
+        df = df.sort_values(order, kind='stable', na_position='first')
+    return df.drop_duplicates(subset=id_column, keep='last').reset_index(drop=True)
+
+
+# Function to read, transform and compact several CSVs into one dataframe
+def read_compacted_csvs(s3, bucket, keys, transform, chunksize=DEFAULT_CHUNK_ROWS, stats=None, plan=None):
+    """
+    Keys must be ordered oldest first. The frame is compacted after every chunk,
+    so memory is bounded by the number of distinct ids rather than total rows.
+    The next CSV downloads while the current one is transformed. With a coercion
+    `plan`, only its columns are parsed, with explicit dtypes.
+    """
+    compacted = None
+    for key, path in prefetch_csvs(s3, bucket, keys, stats):
+        print(f"Compactando CSV: {key}")
+        options = read_csv_options(plan, csv_header(path)) if plan else {}
+        chunks = pd.read_csv(path, chunksize=chunksize, **options) if chunksize else [pd.read_csv(path, **options)]
+        for chunk in chunks:
+            # Nothing is encoded here, so throughput is measured on the parsed chunk in memory
+            nbytes = int(chunk.memory_usage(deep=True).sum()) if stats is not None else 0
+            started = time.perf_counter()
+            df = transform(chunk)
+            record_stage(stats, 'transform', time.perf_counter() - started, nbytes=nbytes)
+            if compacted is not None:
+                df = pd.concat([compacted, df], ignore_index=True)
+            compacted = compact_latest(df)
+    return compacted
+
+
+# Function to stage a dataframe as several files listed in one COPY manifest
+def upload_with_manifest(s3, df, s3_bucket, s3_prefix, rows_per_file=DEFAULT_CHUNK_ROWS, staging_format='json'):
+    extension = STAGING_FORMATS[staging_format]['extension']
+    entries = []
+    for part, start in enumerate(range(0, len(df), rows_per_file)):
+        key = f'{s3_prefix}part-{part:05d}{extension}'
+        body = b''.join(encode_frames([df.iloc[start:start + rows_per_file]], staging_format))
+        s3.put_object(Bucket=s3_bucket, Key=key, Body=body)
+        # content_length is required by COPY for Parquet manifests, harmless for the text formats
+        entries.append({'url': f's3://{s3_bucket}/{key}', 'mandatory': True, 'meta': {'content_length': len(body)}})
+
+    manifest_key = f'{s3_prefix}manifest.json'
+    s3.put_object(Bucket=s3_bucket, Key=manifest_key, Body=json.dumps({'entries': entries}))
+    print(f"Staged {len(df)} rows in {len(entries)} files: s3://{s3_bucket}/{manifest_key}")
+    return manifest_key
+
+
+# Function to load the CSVs of several differential folders as one coalesced COPY
+def load_folders_coalesced(s3, bucket, differential_folders, subfolder, transform, copy, staging_bucket, object_name,
+                           plan=None, chunksize=DEFAULT_CHUNK_ROWS, staging_format='json', stats=None):
+    """
+    The `subfolder` CSVs of every folder (oldest first) are compacted to the
+    latest version of each id and staged behind one manifest, which
+    `copy(manifest_key, manifest=True, columns=...)` loads. Returns the folders
+    that had CSVs. Without `stats` the stage times are reported here.
+    """
+    csv_keys = []
+    folders_with_csv = set()
+    for differential_folder in differential_folders:
+        keys = list_csv_keys(s3, bucket, differential_folder + subfolder)
+        if keys:
+            csv_keys += keys
+            folders_with_csv.add(differential_folder)
+
+    if not csv_keys:
+        return folders_with_csv
+
+    report = stats is None
+    stats = new_stage_stats() if report else stats
+    started = time.perf_counter()
+    df = read_compacted_csvs(s3, bucket, csv_keys, transform, chunksize, stats, plan=plan)
+    if len(df):
+        manifest_key = upload_with_manifest(s3, df, staging_bucket, new_staging_key(object_name, suffix='/'),
+                                            staging_format=staging_format)
+        with timed_stage(stats, 'copy'):
+            copy(manifest_key, manifest=True, columns=list(df.columns))
+
+    if report:
+        report_stage_stats(stats, time.perf_counter() - started)
+    return folders_with_csv
+
+
+# Function to load every pending differential folder with a single coalesced load
+def coalesce_pending_folders(all_diff_folders, processed_keys, folder_key, load_folders, mark_processed):
+    """
+    `load_folders(folders)` loads the pending folders and returns those that had
+    CSVs. Folders are only marked with `mark_processed(key)` once it succeeded; a
+    last folder without CSVs stays pending. Returns the number of pending
+    folders and the last folder done, for the watermark.
+    """
+    pending = []
+    last_done = None
+    for i, full_diff_folder in enumerate(all_diff_folders):
+        if not full_diff_folder.endswith('_Differential/'):
+            continue
+
+        key = folder_key(full_diff_folder)
+
+        if key in processed_keys:
+            print(f"Ya procesado: {key}")
+            last_done = full_diff_folder
+            continue
+
+        pending.append((i, full_diff_folder, key))
+
+    folders_with_csv = load_folders([folder for _, folder, _ in pending])
+
+    for i, full_diff_folder, key in pending:
+        if full_diff_folder in folders_with_csv or i < len(all_diff_folders) - 1:
+            mark_processed(key)
+            last_done = full_diff_folder
+            print(f"Completado: {key}")
+        else:
+            print(f"Última carpeta sin CSVs, no se marcará como procesada: {key}")
+
+    return len(pending), last_done